@@ -11,8 +11,12 @@ function search_books(params, userSettings) {
     throw new Error('Search query is required');
   }
 
+  // Small pages keep responses cheap; the model can ask for the next one
+  const size = Number.isInteger(params.size) && params.size > 0 ? params.size : 5;
+  const from = Number.isInteger(params.from) && params.from > 0 ? params.from : 0;
+
   // Prepare the target URL
-  const targetUrl = `${apiUrl}/search?query=${encodeURIComponent(query)}`;
+  const targetUrl = `${apiUrl}/search?query=${encodeURIComponent(query)}&size=${size}&from=${from}`;
   const requestUrl = useProxy ? `${proxyUrl}${targetUrl}` : targetUrl;
 
   // Add timeout handling
@@ -60,6 +64,12 @@ function search_books(params, userSettings) {
       return 'No books found matching your search';
     }
 
+    // Tell the model how to continue when there are more results
+    const shown = from + data.results.length;
+    const pageNote = (typeof data.total === 'number' && shown < data.total)
+      ? `\n\nShowing ${from + 1}-${shown} of ${data.total} books. Call again with from=${shown} for more.`
+      : '';
+
     // Format results with book paths and snippets
     return data.results.map(result => {
       if (!result.file_path || !result.snippet) {
@@ -106,7 +116,7 @@ function search_books(params, userSettings) {
       return `Book: ${result.file_path}\n` +
              `Snippet: ${result.snippet}\n` +
              (formattedUrl ? `URL: ${formattedUrl}\n` : '');
-    }).join('\n\n');
+    }).join('\n\n') + pageNote;
   })
   .catch(error => {
     clearTimeout(timeoutId);
@@ -1,75 +1,465 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import (Flask, request, jsonify, render_template, send_file, make_response, Response,
+                   stream_template, stream_with_context)
 from urllib.parse import unquote
-from elasticsearch import Elasticsearch
+import urllib.error
+import urllib.request
+from datetime import datetime
+from functools import lru_cache, wraps
+import pytz
 import os
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
-import PyPDF2
-import time
 import logging
 import multiprocessing
-from src.core.index import index_files, get_progress
+import threading
+from src.core.index import (start_indexing, request_cancel, request_pause, request_resume,
+                            get_progress, get_errors, get_worker_count, INDEX_GRANULARITY,
+                            recreate_index, get_index_generation, bump_index_generation)
+from src.core.catalog import get_catalog
+from src.core.metrics import metrics
+from src.core.progress_feed import ProgressFeed, PROGRESS_STREAM_INTERVAL
+from src.core.es_client import es, fan_out, get_health, is_available, start_health_monitor
+from src.core.watcher import start_watcher, get_watch_status
+from src.core.search_cache import SearchCache, normalize_query
+from src.core import render_cache, text_store
+from src.core.epub_chapters import get_package
 from io import StringIO
 import sys
 import re
+import json
 
 app = Flask(__name__, static_folder='static')
+# Behind nginx/Apache, hand raw file bodies to the front server via X-Sendfile
+app.config['USE_X_SENDFILE'] = os.environ.get("USE_X_SENDFILE", "false").lower() in ('1', 'true', 'yes')
+
+# "all" serves and indexes in one process (the development server), "web"
+# only serves and forwards the indexing endpoints to the "indexer" process
+# at INDEXER_URL, so request workers never run or track indexing themselves
+APP_ROLE = os.environ.get("APP_ROLE", "all").lower()
+INDEXER_URL = os.environ.get("INDEXER_URL", "http://booksearch_indexer:5000")
+# Seconds web workers wait for an answer from the indexer
+INDEXER_TIMEOUT = float(os.environ.get("INDEXER_TIMEOUT", 60))
+FORWARDED_HEADERS = ('Accept', 'Content-Type', 'X-Timezone', 'Authorization')
+
+def forward_to_indexer():
+    """Relay the current request to the indexer process and its answer back"""
+    url = INDEXER_URL.rstrip('/') + request.full_path.rstrip('?')
+    headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+    data = request.get_data() if request.method == 'POST' else None
+    try:
+        upstream = urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers,
+                                                                 method=request.method),
+                                          timeout=INDEXER_TIMEOUT)
+        status = upstream.status
+    except urllib.error.HTTPError as e:
+        # 4xx/5xx answers from the indexer are passed on as they are
+        upstream, status = e, e.code
+    except (urllib.error.URLError, OSError) as e:
+        return jsonify({"error": f"Indexer unavailable: {e}"}), 502
+
+    content_type = upstream.headers.get('Content-Type', 'application/json')
+    with upstream:
+        return Response(upstream.read(), status=status, content_type=content_type)
+
+# Last progress the indexer reported, kept through a failed fetch so a
+# hiccup doesn't end every open stream with "done"
+indexer_progress = None
+
+def current_progress():
+    """get_progress() here, or in a web worker the indexer's, fetched from /indexing_progress/snapshot"""
+    global indexer_progress
+    if APP_ROLE != 'web':
+        return get_progress()
+    url = INDEXER_URL.rstrip('/') + '/indexing_progress/snapshot'
+    try:
+        with urllib.request.urlopen(url, timeout=INDEXER_TIMEOUT) as upstream:
+            indexer_progress = json.loads(upstream.read())
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        print(f"Could not fetch indexing progress from {url}: {e}")
+    return indexer_progress
+
+# Progress is read once per interval however many pages and scripts watch
+# it; in a web worker that's one request to the indexer for all of them
+progress_feed = ProgressFeed(current_progress)
+# Open progress streams per process; each holds a serving thread for the
+# whole run, so past this pages fall back to polling /indexing_progress
+PROGRESS_STREAM_MAX_CLIENTS = int(os.environ.get("PROGRESS_STREAM_MAX_CLIENTS", 4))
+progress_stream_slots = threading.BoundedSemaphore(PROGRESS_STREAM_MAX_CLIENTS)
+
+def indexer_endpoint(view):
+    """Serve the view here unless this process is a web worker, which forwards it to the indexer"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if APP_ROLE == 'web':
+            return forward_to_indexer()
+        return view(*args, **kwargs)
+    return wrapper
+
+def start_background_services():
+    """Start what each serving process runs besides requests: health checks, and watching unless it's a web worker"""
+    start_health_monitor()
+    if APP_ROLE != 'web':
+        start_watcher("/books")
 
 @app.after_request
 def add_cors_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Range, If-None-Match'
+    # Let cross-origin readers see partial-content and validator headers
+    response.headers['Access-Control-Expose-Headers'] = 'Accept-Ranges, Content-Range, Content-Length, ETag'
     return response
 
 # Elasticsearch Configuration
-ELASTICSEARCH_HOST = os.environ.get("ELASTICSEARCH_HOST", "localhost")
-ELASTICSEARCH_PORT = int(os.environ.get("ELASTICSEARCH_PORT", 9200))
 INDEX_NAME = "book_index"
+HIGHLIGHT_MAX_ANALYZED_OFFSET = int(os.environ.get("HIGHLIGHT_MAX_ANALYZED_OFFSET", 1000000))
+SEARCH_DEFAULT_SIZE = 10
+SEARCH_MAX_SIZE = int(os.environ.get("SEARCH_MAX_SIZE", 100))
+FILES_PAGE_SIZE = int(os.environ.get("FILES_PAGE_SIZE", 100))
+FILES_MAX_PAGE_SIZE = int(os.environ.get("FILES_MAX_PAGE_SIZE", 1000))
+# Characters decoded per read when streaming text files
+TEXT_STREAM_CHUNK_CHARS = 64 * 1024
+# The only stored fields /search needs back; content stays in Elasticsearch
+SEARCH_SOURCE_FIELDS = ['file_path', 'book_id', 'file_size', 'file_mtime', 'content_hash',
+                        'chapter_index', 'page', 'start_offset', 'end_offset']
+# Books counted exactly for passage search totals; above it the count is an estimate
+BOOK_COUNT_PRECISION = 40000
+# Extra parts /search can add with ?include=, each queried alongside the main search
+SEARCH_INCLUDES = ('suggest', 'facets')
+SEARCH_SUGGESTIONS = int(os.environ.get("SEARCH_SUGGESTIONS", 3))
+
+search_cache = SearchCache()
+
+def python_snippet(content, query, snippet_char_limit):
+    """Build a snippet by scanning the text in Python.
+
+    Fallback for hits Elasticsearch returned no highlight for; it is
+    O(book size) per hit and retries with every subset of query words.
+    """
+    # Normalize content and query
+    normalized_content = content.casefold()
+    normalized_query = query.casefold()
+
+    def find_best_snippet(query, words):
+        try:
+            # Try exact phrase match
+            exact_pos = normalized_content.find(query)
+            if exact_pos != -1:
+                start = max(0, exact_pos - snippet_char_limit//2)
+                end = min(len(content), exact_pos + len(query) + snippet_char_limit//2)
+                snippet = content[start:end]
+                snippet = snippet.replace(query, f"**{query}**")
+                return snippet
+
+            # Try all words in any order
+            all_word_positions = []
+            for word in words:
+                if not word:
+                    continue
+                start_idx = 0
+                while True:
+                    index = normalized_content.find(word, start_idx)
+                    if index == -1:
+                        break
+                    all_word_positions.append((index, index + len(word)))
+                    start_idx = index + len(word)
+
+            if all_word_positions:
+                all_word_positions.sort()
+                # Find region with most query words
+                best_start = 0
+                best_end = 0
+                max_words = 0
 
-# Wait for Elasticsearch to be available
-es = None
-while True:
+                for i in range(len(all_word_positions)):
+                    current_start = all_word_positions[i][0]
+                    current_end = current_start + snippet_char_limit
+                    words_in_region = 1
+
+                    for j in range(i+1, len(all_word_positions)):
+                        if all_word_positions[j][0] < current_end:
+                            words_in_region += 1
+                        else:
+                            break
+
+                    if words_in_region > max_words:
+                        max_words = words_in_region
+                        best_start = max(0, current_start - snippet_char_limit//2)
+                        best_end = min(len(content), current_end + snippet_char_limit//2)
+
+                if max_words > 0:
+                    snippet = content[best_start:best_end]
+                    for word in words:
+                        snippet = snippet.replace(word, f"**{word}**")
+                    return snippet
+
+            # Recursively try with fewer words
+            if len(words) > 1:
+                for i in range(len(words)):
+                    reduced_words = words[:i] + words[i+1:]
+                    snippet = find_best_snippet(' '.join(reduced_words), reduced_words)
+                    if snippet and snippet != "No snippet found":
+                        return snippet
+
+            # Final fallback to any single word
+            for word in words:
+                if not word:
+                    continue
+                word_pos = normalized_content.find(word)
+                if word_pos != -1:
+                    start = max(0, word_pos - snippet_char_limit//2)
+                    end = min(len(content), word_pos + len(word) + snippet_char_limit//2)
+                    return content[start:end].replace(word, f"**{word}**")
+
+            return "No snippet found"
+        except Exception as e:
+            print(f"Error in find_best_snippet: {str(e)}")
+            return "Error generating snippet"
+
+    # Split query into words (handles hyphens and whitespace)
+    query_words = [w for w in re.split(r'[\s-]+', normalized_query) if w]
+    snippet = find_best_snippet(normalized_query, query_words)
+
+    # Use the snippet we already generated from find_best_snippet
+    if not snippet or snippet == "No snippet found":
+        # Final fallback to first 100 characters
+        snippet = content[:snippet_char_limit]
+    return snippet
+
+def stored_hit_text(source):
+    """Text of a search hit (the whole book, or just the passage) from the text store, None if not stored"""
+    content_hash = source.get('content_hash')
+    if not content_hash:
+        return None
+    return text_store.read_text(content_hash, source.get('start_offset', 0), source.get('end_offset'))
+
+def parse_search_paging(args):
+    """Turn from/size/search_after/track_total_hits request args into es.search keyword arguments.
+
+    Raises ValueError with a user-facing message for malformed values.
+    """
+    paging = {}
     try:
-        es = Elasticsearch([{'host': ELASTICSEARCH_HOST, 'port': ELASTICSEARCH_PORT, 'scheme': 'http'}])
-        if es.ping():
-            print("Connected to Elasticsearch")
-            break
+        size = int(args.get('size', SEARCH_DEFAULT_SIZE))
+        offset = int(args.get('from', 0))
+    except ValueError:
+        raise ValueError("'from' and 'size' must be integers")
+    if size < 0 or offset < 0:
+        raise ValueError("'from' and 'size' must not be negative")
+    paging['size'] = min(size, SEARCH_MAX_SIZE)
+
+    search_after = args.get('search_after')
+    if search_after:
+        try:
+            search_after = json.loads(search_after)
+        except ValueError:
+            search_after = None
+        if not isinstance(search_after, list):
+            raise ValueError("'search_after' must be the JSON array returned as next_search_after")
+        paging['search_after'] = search_after
+    elif offset:
+        paging['from_'] = offset
+
+    track_total_hits = args.get('track_total_hits')
+    if track_total_hits is not None:
+        if track_total_hits.lower() in ('true', 'false'):
+            paging['track_total_hits'] = track_total_hits.lower() == 'true'
         else:
-            print("Elasticsearch not available, retrying...")
-    except Exception as e:
-        print(f"Error connecting to Elasticsearch: {e}")
-    time.sleep(5)
+            try:
+                paging['track_total_hits'] = int(track_total_hits)
+            except ValueError:
+                raise ValueError("'track_total_hits' must be true, false or an integer")
+    return paging
 
-def extract_text_from_epub(epub_path):
-    try:
-        book = epub.read_epub(epub_path)
-        text = ''
-        for item in book.get_items():
-            if item.media_type == 'application/xhtml+xml':
-                content = item.get_content()
-                if content:
-                    soup = BeautifulSoup(content, 'html.parser')
-                    text += soup.get_text()
-        return text
-    except Exception as e:
-        logging.error(f"Error processing EPUB {epub_path}: {str(e)}")
-        return f"Error extracting text: {str(e)}"
-
-def extract_text_from_pdf(pdf_path):
-    text = ''
-    with open(pdf_path, 'rb') as pdf_file:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text()
-    return text
+def parse_search_filters(args):
+    """Turn include/file_type request args into (include, file_type) for run_search.
+
+    Raises ValueError with a user-facing message for unknown includes.
+    """
+    include = tuple(sorted({part.strip() for part in args.get('include', '').split(',') if part.strip()}))
+    unknown = [part for part in include if part not in SEARCH_INCLUDES]
+    if unknown:
+        raise ValueError(f"'include' takes a comma-separated list of {', '.join(SEARCH_INCLUDES)}")
+    file_type = args.get('file_type', '').strip().lower() or None
+    return include, file_type
 
 @app.route('/', methods=['GET'])
 def home():
     return render_template('search.html')
 
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness of the web process plus the last known Elasticsearch and library watcher state"""
+    es_state = get_health()
+    return jsonify({"status": "ok", "elasticsearch": es_state, "watcher": get_watch_status()}), 200
+
+@app.route('/metrics', methods=['GET'])
+@indexer_endpoint
+def prometheus_metrics():
+    """Indexing stage histograms, totals and the state of the current run, for Prometheus to scrape"""
+    progress = progress_feed.current()
+    gauges = {
+        'booksearch_indexing_running': 1 if progress else 0,
+        'booksearch_indexing_files_total': progress['total_files'] if progress else 0,
+        'booksearch_indexing_files_processed': progress['processed_files'] if progress else 0,
+        'booksearch_indexing_estimated_remaining_seconds': round(progress['estimated_remaining'], 1) if progress else 0,
+    }
+    lines = [metrics.prometheus()]
+    for name, value in gauges.items():
+        lines.append(f"# TYPE {name} gauge\n{name} {value}\n")
+    return Response(''.join(lines), mimetype='text/plain; version=0.0.4')
+
+def suggest_query(query):
+    """Spelling corrections for the whole query, built from the indexed words"""
+    return es.search(index=INDEX_NAME, size=0, suggest={
+        'did_you_mean': {
+            'text': query,
+            'phrase': {
+                'field': 'content',
+                'size': SEARCH_SUGGESTIONS,
+                'direct_generator': [{'field': 'content', 'suggest_mode': 'always'}],
+                'highlight': {'pre_tag': '**', 'post_tag': '**'}
+            }
+        }
+    })
+
+def facet_query(match):
+    """Matching books per file type; passages are counted once per book"""
+    file_types = {'terms': {'field': 'file_type', 'size': 20}}
+    if INDEX_GRANULARITY == 'passage':
+        file_types['aggs'] = {'books': {'cardinality': {'field': 'book_id'}}}
+    return es.search(index=INDEX_NAME, size=0, query=match, aggs={'file_type': file_types})
+
+def run_search(query, search_kwargs, include=(), file_type=None):
+    """Query Elasticsearch and build the JSON-ready payload /search responds with
+
+    include may ask for 'suggest' (spelling corrections) and 'facets' (counts per
+    file type, regardless of the file_type filter). They are queried concurrently
+    with the main search, so they add no latency unless they are the slowest.
+    """
+    match = {'match': {'content': query}}
+    extras = {}
+    if 'suggest' in include:
+        extras['suggest'] = lambda: suggest_query(query)
+    if 'facets' in include:
+        extras['facets'] = lambda: facet_query(match)
+    extra_futures = dict(zip(extras, fan_out(*extras.values())))
+
+    if INDEX_GRANULARITY == 'passage':
+        # One hit per book: its best matching passage
+        search_kwargs['collapse'] = {'field': 'book_id'}
+        if search_kwargs.get('track_total_hits') is not False:
+            # hits.total counts passages even when collapsing, so count the books
+            search_kwargs['aggs'] = {'books': {'cardinality': {'field': 'book_id',
+                                                               'precision_threshold': BOOK_COUNT_PRECISION}}}
+    else:
+        # A unique tie-breaker makes every hit's sort values usable as a search_after cursor
+        search_kwargs['sort'] = [{'_score': 'desc'}, {'book_id': 'asc'}]
+    snippet_char_limit = int(os.environ.get("SNIPPET_CHAR_LIMIT", 100))
+    # Snippets come from the highlighter, so the (huge) content never leaves Elasticsearch
+    highlight = {
+        'fields': {
+            'content': {
+                'type': 'unified',
+                'fragment_size': snippet_char_limit,
+                'number_of_fragments': 1
+            }
+        },
+        'pre_tags': ['**'],
+        'post_tags': ['**'],
+        # Older indexes without stored offsets re-analyze the text; cap it instead of failing
+        'max_analyzed_offset': HIGHLIGHT_MAX_ANALYZED_OFFSET
+    }
+    main_query = {'bool': {'must': [match], 'filter': [{'term': {'file_type': file_type}}]}} if file_type else match
+    results = es.search(index=INDEX_NAME, query=main_query,
+                        highlight=highlight, source=SEARCH_SOURCE_FIELDS, **search_kwargs)
+    hits = results['hits']['hits']
+
+    search_results = []
+    for hit in hits:
+        file_path = hit['_source']['file_path']
+
+        try:
+            fragments = hit.get('highlight', {}).get('content')
+            if fragments:
+                snippet = fragments[0]
+            else:
+                # No highlight (e.g. offsets beyond max_analyzed_offset): scan the text,
+                # from the local text store when the indexer left it there
+                content = stored_hit_text(hit['_source'])
+                if content is None:
+                    source = es.get(index=INDEX_NAME, id=hit['_id'], source_includes=['content'])['_source']
+                    content = source.get('content', '')
+                snippet = python_snippet(content, query, snippet_char_limit)
+        except Exception as e:
+            snippet = f"Error generating snippet: {str(e)}"
+            print(f"Snippet generation error: {str(e)}")
+
+        # Get base URL from environment
+        base_url = os.environ.get("BASE_URL", "http://localhost:8000")
+        # Construct URLs
+        # Remove "/books/" from path start if it's here
+        if file_path.startswith("/books/"):
+            file_path = file_path[len("/books/"):]
+
+        url = f"{base_url}/{file_path}"
+        raw_url_old = f"{base_url}/file/{file_path}?format=html"
+        raw_url = f"{base_url}/file_html/{file_path}"
+
+        result = {
+            "file_path": file_path,
+            "url": url,
+            "raw_url": raw_url,
+            "raw_url_old": raw_url_old,
+            "snippet": snippet,
+            "score": hit['_score']
+        }
+        # Passage hits say where in the book they matched
+        for field in ('chapter_index', 'page'):
+            if field in hit['_source']:
+                result[field] = hit['_source'][field]
+        if result.get('chapter_index') is not None and file_path.lower().endswith('.epub'):
+            # Opens the matching chapter only; numbered like the viewer's ?chapter=N
+            result['chapter_url'] = f"{raw_url}?chapter={result['chapter_index']}"
+        search_results.append(result)
+
+    total = results['hits'].get('total')
+    books = results.get('aggregations', {}).get('books')
+    if books is not None:
+        # Exact up to the precision threshold, an estimate beyond it
+        total = {'value': books['value'],
+                 'relation': 'eq' if books['value'] <= BOOK_COUNT_PRECISION else 'approx'}
+    next_search_after = hits[-1].get('sort') if hits and len(hits) == search_kwargs['size'] else None
+
+    payload = {
+        "results": search_results,
+        "total": total['value'] if total else None,
+        "total_relation": total['relation'] if total else None,
+        "from": search_kwargs.get('from_', 0),
+        "size": search_kwargs['size'],
+        "next_search_after": json.dumps(next_search_after) if next_search_after else None,
+        "took": results['took']
+    }
+    if file_type:
+        payload['file_type'] = file_type
+
+    # The extras are optional: a failed one is left out rather than failing the search
+    for name, future in extra_futures.items():
+        try:
+            extra = future.result()
+        except Exception as e:
+            print(f"Search {name} failed: {str(e)}")
+            payload[name] = None
+            continue
+        if name == 'suggest':
+            options = extra.get('suggest', {}).get('did_you_mean', [{}])[0].get('options', [])
+            payload['suggest'] = [{"text": option['text'], "highlighted": option.get('highlighted'),
+                                   "score": option['score']} for option in options]
+        else:
+            buckets = extra.get('aggregations', {}).get('file_type', {}).get('buckets', [])
+            payload['facets'] = {"file_type": [{"value": bucket['key'],
+                                                "count": bucket['books']['value'] if 'books' in bucket
+                                                else bucket['doc_count']} for bucket in buckets]}
+    return payload
+
 @app.route('/search', methods=['GET'])
 def search():
     query = request.args.get('query')
@@ -78,154 +468,53 @@ def search():
             return jsonify({"error": "Query parameter is required"}), 400
         return render_template('search.html', query='')
 
+    wants_json = request.headers.get('Accept') == 'application/json' or request.args.get('format') == 'json'
+    try:
+        search_kwargs = parse_search_paging(request.args)
+        include, file_type = parse_search_filters(request.args)
+        if not wants_json and 'suggest' not in include:
+            # The search page offers "did you mean"
+            include = include + ('suggest',)
+        if INDEX_GRANULARITY == 'passage' and 'search_after' in search_kwargs:
+            raise ValueError("search_after is not supported for passage indexes, page with 'from' instead")
+    except ValueError as e:
+        if wants_json:
+            return jsonify({"error": str(e), "query": query}), 400
+        return render_template('search.html', error=str(e), query=query)
+
+    if not is_available():
+        # Fail fast while the health monitor knows Elasticsearch is down
+        error = "Search is temporarily unavailable: Elasticsearch is not reachable"
+        if wants_json:
+            return jsonify({"error": error, "query": query}), 503
+        return render_template('search.html', error=error, query=query), 503
+
     try:
         # Log the query for debugging
         print(f"Searching for query: {query} (length: {len(query)})")
         
-        results = es.search(index=INDEX_NAME, query={'match': {'content': query}})
-        hits = results['hits']['hits']
-        
-        search_results = []
-        for hit in hits:
-            file_path = hit['_source']['file_path']
-            content = hit['_source']['content']
-            
-            # Log content sample for debugging
-            print(f"Processing file: {file_path}")
-            print(f"Content sample: {content[:100]}...")
-            
-            # Highlight snippet with improved matching for multi-word queries
-            snippet_char_limit = int(os.environ.get("SNIPPET_CHAR_LIMIT", 100))
-            try:
-                # Normalize content and query
-                normalized_content = content.casefold()
-                normalized_query = query.casefold()
-                
-                def find_best_snippet(query, words):
-                    try:
-                        # Try exact phrase match
-                        exact_pos = normalized_content.find(query)
-                        if exact_pos != -1:
-                            start = max(0, exact_pos - snippet_char_limit//2)
-                            end = min(len(content), exact_pos + len(query) + snippet_char_limit//2)
-                            snippet = content[start:end]
-                            snippet = snippet.replace(query, f"**{query}**")
-                            return snippet
-
-                        # Try all words in any order
-                        all_word_positions = []
-                        for word in words:
-                            if not word:
-                                continue
-                            start_idx = 0
-                            while True:
-                                index = normalized_content.find(word, start_idx)
-                                if index == -1:
-                                    break
-                                all_word_positions.append((index, index + len(word)))
-                                start_idx = index + len(word)
-
-                        if all_word_positions:
-                            all_word_positions.sort()
-                            # Find region with most query words
-                            best_start = 0
-                            best_end = 0
-                            max_words = 0
-                            
-                            for i in range(len(all_word_positions)):
-                                current_start = all_word_positions[i][0]
-                                current_end = current_start + snippet_char_limit
-                                words_in_region = 1
-                                
-                                for j in range(i+1, len(all_word_positions)):
-                                    if all_word_positions[j][0] < current_end:
-                                        words_in_region += 1
-                                    else:
-                                        break
-                                
-                                if words_in_region > max_words:
-                                    max_words = words_in_region
-                                    best_start = max(0, current_start - snippet_char_limit//2)
-                                    best_end = min(len(content), current_end + snippet_char_limit//2)
-                            
-                            if max_words > 0:
-                                snippet = content[best_start:best_end]
-                                for word in words:
-                                    snippet = snippet.replace(word, f"**{word}**")
-                                return snippet
-
-                        # Recursively try with fewer words
-                        if len(words) > 1:
-                            for i in range(len(words)):
-                                reduced_words = words[:i] + words[i+1:]
-                                snippet = find_best_snippet(' '.join(reduced_words), reduced_words)
-                                if snippet and snippet != "No snippet found":
-                                    return snippet
-
-                        # Final fallback to any single word
-                        for word in words:
-                            if not word:
-                                continue
-                            word_pos = normalized_content.find(word)
-                            if word_pos != -1:
-                                start = max(0, word_pos - snippet_char_limit//2)
-                                end = min(len(content), word_pos + len(word) + snippet_char_limit//2)
-                                return content[start:end].replace(word, f"**{word}**")
-
-                        return "No snippet found"
-                    except Exception as e:
-                        print(f"Error in find_best_snippet: {str(e)}")
-                        return "Error generating snippet"
-
-                # Split query into words (handles hyphens and whitespace)
-                import re
-                query_words = [w for w in re.split(r'[\s-]+', normalized_query) if w]
-                snippet = find_best_snippet(normalized_query, query_words)
-                
-                # Use the snippet we already generated from find_best_snippet
-                if not snippet or snippet == "No snippet found":
-                    # Final fallback to first 100 characters
-                    snippet = content[:snippet_char_limit]
-            except Exception as e:
-                snippet = f"Error generating snippet: {str(e)}"
-                print(f"Snippet generation error: {str(e)}")
-                
-            # Get base URL from environment
-            base_url = os.environ.get("BASE_URL", "http://localhost:8000")
-            # Construct URLs
-            # Remove "/books/" from path start if it's here
-            if file_path.startswith("/books/"):
-                file_path = file_path[len("/books/"):]
-
-            url = f"{base_url}/{file_path}"
-            raw_url_old = f"{base_url}/file/{file_path}?format=html"
-            raw_url = f"{base_url}/file_html/{file_path}"
-
-            search_results.append({
-                "file_path": file_path,
-                "url": url,
-                "raw_url": raw_url,
-                "raw_url_old": raw_url_old,
-                "snippet": snippet,
-                "score": hit['_score']
-            })
+        cache_key = (normalize_query(query), INDEX_GRANULARITY, json.dumps(search_kwargs, sort_keys=True),
+                     include, file_type)
+        # Read the generation before searching so a concurrent reindex can't get cached as current
+        generation = get_index_generation()
+        payload = search_cache.get(cache_key, generation)
+        if payload is None:
+            payload = run_search(query, search_kwargs, include, file_type)
+            search_cache.put(cache_key, payload, generation)
 
         # If it's an API request or format=json is specified
-        if request.headers.get('Accept') == 'application/json' or request.args.get('format') == 'json':
-            response = jsonify({
-                "query": query,
-                "results": search_results,
-                "total": len(search_results),
-                "took": results['took']
-            })
+        if wants_json:
+            response = jsonify(dict(payload, query=query))
             response.headers['Content-Type'] = 'application/json'
             return response
         
         # Otherwise, render the HTML template
-        return render_template('search.html', results=search_results, query=query)
+        return render_template('search.html', results=payload['results'], query=query,
+                               total=payload['total'], offset=payload['from'], size=payload['size'],
+                               suggestions=payload.get('suggest'))
 
     except Exception as e:
-        if request.headers.get('Accept') == 'application/json' or request.args.get('format') == 'json':
+        if wants_json:
             response = jsonify({
                 "error": str(e),
                 "query": query
@@ -234,38 +523,61 @@ def search():
             return response, 500
         return render_template('search.html', error=str(e), query=query)
 
+@app.route('/search_cache', methods=['GET'])
+def get_search_cache_stats():
+    """Hit/miss counters and size of the search result cache"""
+    return jsonify(search_cache.get_stats())
+
 @app.route('/files', methods=['GET'])
 def list_files():
+    """List the library from the cached catalog.
+
+    Query parameters: sort (name, title, path, size, mtime), order (asc,
+    desc), q (substring of the path), type (epub, pdf, txt), offset and
+    limit (FILES_PAGE_SIZE by default, at most FILES_MAX_PAGE_SIZE).
+    """
     books_dir = "/books"
-    files = []
     
     try:
-        # Check if indexing is in progress
-        indexing_in_progress = get_progress() is not None
-        
-        for filename in os.listdir(books_dir):
-            file_path = os.path.join(books_dir, filename)
-            if os.path.isfile(file_path):
-                file_size = os.path.getsize(file_path)
-                # Extract book title from filename if possible
-                title = filename
-                if ' - ' in filename:  # Common pattern in filenames
-                    title_parts = filename.split(' - ')
-                    if len(title_parts) > 1:
-                        title = ' - '.join(title_parts[:-1])  # Take all but last part
-                
-                files.append({
-                    'name': filename,
-                    'title': title,
-                    'path': filename,
-                    'size': file_size,
-                    'size_mb': round(file_size / (1024 * 1024), 2)
-                })
+        # Check if indexing is in progress, in the indexer process if this is a web worker
+        indexing_in_progress = progress_feed.current() is not None
+
+        try:
+            offset = int(request.args.get('offset', 0))
+            limit = int(request.args.get('limit', FILES_PAGE_SIZE))
+            if offset < 0 or not 1 <= limit <= FILES_MAX_PAGE_SIZE:
+                raise ValueError(f"offset must be >= 0 and limit between 1 and {FILES_MAX_PAGE_SIZE}")
+            sort = request.args.get('sort', 'name')
+            order = request.args.get('order', 'asc')
+            if order not in ('asc', 'desc'):
+                raise ValueError("order must be asc or desc")
+            search = request.args.get('q', '').strip()
+            file_type = request.args.get('type', '').lower().lstrip('.')
+
+            # The catalog comes from the indexer's last scan, so no extra walk of the share here;
+            # web workers read the one it publishes to MANIFEST_FILE
+            catalog = get_catalog(books_dir, published_only=APP_ROLE == 'web')
+            files, matched_files, matched_size = catalog.query(sort, order == 'desc', search, file_type,
+                                                               offset, limit)
+        except ValueError as e:
+            if request.headers.get('Accept') == 'application/json':
+                return jsonify({"error": str(e)}), 400
+            return render_template('files.html', error=str(e)), 400
         
-        # Calculate totals
-        total_files = len(files)
-        total_size = sum(f['size'] for f in files)
+        # Totals cover the whole library, matched_* only what the filters kept
+        total_files = catalog.total_files
+        total_size = catalog.total_size
         total_size_mb = round(total_size / (1024 * 1024), 2)
+        listing = {
+            'sort': sort,
+            'order': order,
+            'q': search,
+            'type': file_type,
+            'offset': offset,
+            'limit': limit,
+            'matched_files': matched_files,
+            'matched_size': matched_size
+        }
         
         # If it's an API request, return JSON
         if request.headers.get('Accept') == 'application/json':
@@ -274,7 +586,8 @@ def list_files():
                 'total_files': total_files,
                 'total_size': total_size,
                 'total_size_mb': total_size_mb,
-                'indexing_in_progress': indexing_in_progress
+                'indexing_in_progress': indexing_in_progress,
+                **listing
             })
         
         # Otherwise, render the HTML template
@@ -283,12 +596,140 @@ def list_files():
                             total_files=total_files,
                             total_size=total_size,
                             total_size_mb=total_size_mb,
-                            indexing_in_progress=indexing_in_progress)
+                            indexing_in_progress=indexing_in_progress,
+                            **listing)
     except Exception as e:
         if request.headers.get('Accept') == 'application/json':
             return jsonify({"error": str(e)}), 500
         return render_template('files.html', error=str(e))
 
+def epub_html_response(full_path, file_path):
+    """Serve the HTML rendering of an EPUB from the render cache, answering 304 if the client has it
+
+    With ?chapter=N only that spine item (0-based) is parsed and rendered.
+    """
+    chapter = request.args.get('chapter')
+    if chapter is not None:
+        if not chapter.isdigit():
+            return jsonify({"error": "chapter must be a non-negative integer"}), 400
+        chapter = int(chapter)
+    stat = os.stat(full_path)
+    chapter_info = {}
+    if chapter is not None:
+        try:
+            spine, toc = get_package(full_path, stat)
+        except Exception as e:
+            logging.error(f"Error reading EPUB structure {full_path}: {str(e)}")
+            return jsonify({"error": f"Failed to process EPUB: {str(e)}"}), 500
+        if chapter >= len(spine) or spine[chapter] is None:
+            return jsonify({"error": f"Chapter {chapter} not found, the book has {len(spine)}"}), 404
+        chapter_info = {
+            'chapter': chapter,
+            'chapter_count': len(spine),
+            'chapter_title': next((entry['title'] for entry in toc if entry['chapter'] == chapter), None),
+            'toc': toc
+        }
+    etag = render_cache.cache_key(full_path, stat, '' if chapter is None else f'chapter-{chapter}')
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        try:
+            html, etag = render_cache.get_rendered_html(full_path, stat, chapter)
+        except Exception as e:
+            logging.error(f"Error processing EPUB {full_path}: {str(e)}")
+            return jsonify({"error": f"Failed to process EPUB: {str(e)}"}), 500
+        response = make_response(render_template('text_file.html',
+                                                 file_path=file_path,
+                                                 content=html,
+                                                 is_html=True,
+                                                 **chapter_info))
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    # Let browsers keep the page but check back, the book may have changed
+    response.cache_control.no_cache = True
+    return response
+
+def parse_text_window(args):
+    """Read the offset/length query parameters (in characters) of a text view, raising ValueError if invalid"""
+    offset = int(args.get('offset', 0))
+    length = args.get('length')
+    length = int(length) if length is not None else None
+    if offset < 0 or (length is not None and length <= 0):
+        raise ValueError("offset must be >= 0 and length > 0")
+    return offset, length
+
+def iter_text_window(text_file, offset=0, length=None, chunk_chars=None):
+    """Yield a decoded text file in chunks of at most chunk_chars, from character offset for length characters
+
+    Closes the file when done, so it can be handed to a streaming response.
+    """
+    chunk_chars = chunk_chars or TEXT_STREAM_CHUNK_CHARS
+    with text_file as f:
+        # Skip to the window in bounded reads rather than one big one
+        while offset > 0:
+            skipped = f.read(min(offset, chunk_chars))
+            if not skipped:
+                return
+            offset -= len(skipped)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = chunk_chars if remaining is None else min(chunk_chars, remaining)
+            chunk = f.read(size)
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+
+def is_inside_books_dir(full_path, books_dir):
+    """True if full_path is books_dir or a path below it
+
+    Compared by path components, so siblings sharing the prefix, like
+    /books_private next to /books, are outside.
+    """
+    books_dir = os.path.abspath(books_dir)
+    return os.path.commonpath([os.path.abspath(full_path), books_dir]) == books_dir
+
+def text_file_response(full_path, file_path):
+    """Stream a text file, or the stored text of a PDF, as plain text or inside text_file.html
+
+    ?offset=&length= select a window in characters, the same positions
+    passage offsets use. Plain text requests without a window get the raw
+    file with Range support instead.
+    """
+    try:
+        offset, length = parse_text_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid text window: {str(e)}"}), 400
+    end = None if length is None else offset + length
+    accept = request.headers.get('Accept', '')
+    # API requests and anything not asking for HTML get plain text
+    plain = accept == 'application/json' or 'text/html' not in accept
+
+    if file_path.lower().endswith('.pdf'):
+        # PDFs are shown as the text the indexer extracted instead of being parsed here
+        content_hash = text_store.lookup(full_path)
+        content = text_store.read_text(content_hash, offset, end) if content_hash else None
+        if content is None:
+            return jsonify({"error": "No extracted text for this file yet, re-index to create it"}), 404
+        chunks = [content]
+    elif plain and accept != 'application/json' and not offset and length is None:
+        # Whole-file downloads go straight from disk
+        return send_book_file(full_path, 'text/plain')
+    else:
+        # Opened here so a missing file is a 404 rather than a broken stream
+        text_file = open(full_path, 'r', encoding='utf-8', errors='ignore')
+        chunks = iter_text_window(text_file, offset, length)
+
+    if plain:
+        return Response(stream_with_context(chunks), mimetype='text/plain')
+    return Response(stream_with_context(stream_template('text_file.html',
+                                                        file_path=file_path,
+                                                        content_chunks=chunks,
+                                                        offset=offset,
+                                                        length=length)))
+
 @app.route('/file_html/<path:file_path>', methods=['GET'])
 def get_file_html(file_path):
     """Serve the HTML version of the file"""
@@ -307,44 +748,17 @@ def get_file_html(file_path):
     full_path = os.path.normpath(os.path.join(books_dir, decoded_path))
     
     # Validate the path is within the books directory
-    if not os.path.abspath(full_path).startswith(os.path.abspath(books_dir)):
+    if not is_inside_books_dir(full_path, books_dir):
         return jsonify({"error": "Access denied: File path outside of books directory"}), 403
 
     try:
         # Handle EPUB files
         if file_path.lower().endswith('.epub'):
-                # Convert EPUB to HTML
-                try:
-                    book = epub.read_epub(full_path)
-                    html_content = []
-                    for item in book.get_items():
-                        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                            content = item.get_content()
-                            if content:
-                                soup = BeautifulSoup(content, 'html.parser')
-                                # Preserve basic formatting tags
-                                for tag in soup.find_all():
-                                    if tag.name not in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'br', 'div', 'span', 'strong', 'em', 'b', 'i', 'ul', 'ol', 'li']:
-                                        tag.unwrap()
-                                html_content.append(str(soup))
-                except Exception as e:
-                    logging.error(f"Error processing EPUB {full_path}: {str(e)}")
-                    return jsonify({"error": f"Failed to process EPUB: {str(e)}"}), 500
-                return render_template('text_file.html',
-                                   file_path=file_path,
-                                   content='<hr>'.join(html_content),
-                                   is_html=True)
+            # Convert EPUB to HTML, reusing the cached rendering when the file is unchanged
+            return epub_html_response(full_path, file_path)
         
-        # Handle regular text files
-        with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # If it's an API request or the Accept header doesn't include HTML, return plain text
-        if request.headers.get('Accept') == 'application/json' or 'text/html' not in request.headers.get('Accept', ''):
-            return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
-        
-        # Otherwise, render a simple HTML page with the content
-        return render_template('text_file.html', file_path=file_path, content=content)
+        # Handle text files and the extracted text of PDFs
+        return text_file_response(full_path, file_path)
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
@@ -368,51 +782,73 @@ def get_file(file_path):
     full_path = os.path.normpath(os.path.join(books_dir, decoded_path))
     
     # Validate the path is within the books directory
-    if not os.path.abspath(full_path).startswith(os.path.abspath(books_dir)):
+    if not is_inside_books_dir(full_path, books_dir):
         return jsonify({"error": "Access denied: File path outside of books directory"}), 403
     
     try:
         # Handle EPUB files
         if file_path.lower().endswith('.epub'):
             if request.args.get('format') == 'html':
-                # Convert EPUB to HTML
-                try:
-                    book = epub.read_epub(full_path)
-                    html_content = []
-                    for item in book.get_items():
-                        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                            content = item.get_content()
-                            if content:
-                                soup = BeautifulSoup(content, 'html.parser')
-                                # Preserve basic formatting tags
-                                for tag in soup.find_all():
-                                    if tag.name not in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'br', 'div', 'span', 'strong', 'em', 'b', 'i', 'ul', 'ol', 'li']:
-                                        tag.unwrap()
-                                html_content.append(str(soup))
-                except Exception as e:
-                    logging.error(f"Error processing EPUB {full_path}: {str(e)}")
-                    return jsonify({"error": f"Failed to process EPUB: {str(e)}"}), 500
-                return render_template('text_file.html',
-                                   file_path=file_path,
-                                   content='<hr>'.join(html_content),
-                                   is_html=True)
+                # Convert EPUB to HTML, reusing the cached rendering when the file is unchanged
+                return epub_html_response(full_path, file_path)
+            elif request.args.get('format') == 'text':
+                # Plain text as indexed, from the text store
+                content = text_store.text_for_file(full_path)
+                if content is None:
+                    return jsonify({"error": "No extracted text for this file yet, re-index to create it"}), 404
+                return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
             else:
                 # Render the viewer template
                 return render_template('epub_viewer.html', file_path=file_path)
         
-        # Handle regular text files
-        with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        
-        # If it's an API request or the Accept header doesn't include HTML, return plain text
-        if request.headers.get('Accept') == 'application/json' or 'text/html' not in request.headers.get('Accept', ''):
-            return content, 200, {'Content-Type': 'text/plain; charset=utf-8'}
-        
-        # Otherwise, render a simple HTML page with the content
-        return render_template('text_file.html', file_path=file_path, content=content)
+        # Handle text files and the extracted text of PDFs
+        return text_file_response(full_path, file_path)
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
+@app.route('/toc/<path:file_path>', methods=['GET'])
+def get_epub_toc(file_path):
+    """Table of contents of an EPUB as JSON, with the chapter number each entry opens via ?chapter=N"""
+    books_dir = "/books"
+    decoded_path = unquote(file_path).lstrip('/')
+    if decoded_path.startswith('books/'):
+        decoded_path = decoded_path[6:]
+    full_path = os.path.normpath(os.path.join(books_dir, decoded_path))
+
+    # Validate the path is within the books directory
+    if not is_inside_books_dir(full_path, books_dir):
+        return jsonify({"error": "Access denied: File path outside of books directory"}), 403
+    if not decoded_path.lower().endswith('.epub'):
+        return jsonify({"error": "Table of contents is only available for EPUB files"}), 400
+
+    try:
+        spine, toc = get_package(full_path)
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
+    except Exception as e:
+        logging.error(f"Error reading EPUB structure {full_path}: {str(e)}")
+        return jsonify({"error": f"Failed to process EPUB: {str(e)}"}), 500
+
+    return jsonify({
+        "file_path": decoded_path,
+        "chapters": len(spine),
+        "toc": toc
+    })
+
+def send_book_file(full_path, mimetype, download_name=None):
+    """Stream a file from disk with ETag/Last-Modified, 304s and Range (206) support
+
+    The body goes out through the server's file wrapper (sendfile under
+    gunicorn), or as X-Sendfile when USE_X_SENDFILE is set. Text mimetypes
+    get charset=utf-8 added.
+    """
+    return send_file(full_path,
+                     mimetype=mimetype,
+                     as_attachment=download_name is not None,
+                     download_name=download_name,
+                     conditional=True,
+                     etag=True)
+
 @app.route('/epub/<path:file_path>', methods=['GET'])
 def get_epub_file(file_path):
     """Serve the raw EPUB file with proper headers"""
@@ -420,43 +856,45 @@ def get_epub_file(file_path):
     full_path = os.path.join(books_dir, file_path)
     
     # Validate the path is within the books directory
-    if not os.path.abspath(full_path).startswith(os.path.abspath(books_dir)):
+    if not is_inside_books_dir(full_path, books_dir):
         return jsonify({"error": "Access denied: File path outside of books directory"}), 403
     
     try:
         # Serve the raw EPUB file with proper headers
-        response = send_from_directory(
-            books_dir,
-            file_path,
-            as_attachment=True,
-            mimetype='application/epub+zip'
-        )
+        response = send_book_file(full_path, 'application/epub+zip', download_name=os.path.basename(file_path))
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Methods'] = 'GET'
-        response.headers['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
         return response
     except Exception as e:
         return jsonify({"error": str(e)}), 404
 
 @app.route('/index_books', methods=['GET'])
+@indexer_endpoint
 def index_books():
     logging.info("Indexing books endpoint called")
     
     # Get CPU configuration
-    cpu_limit = os.environ.get("CPU_LIMIT")
     available_cpus = multiprocessing.cpu_count()
-    used_cpus = float(cpu_limit) if cpu_limit else max(1, available_cpus - 1)
+    # index_files sizes its extraction pool the same way
+    used_cpus = get_worker_count()
     
     try:
         # Configure logging to capture output
         logging.basicConfig(level=logging.INFO)
-        # Start indexing in a separate thread
-        from threading import Thread
-        index_thread = Thread(target=index_files, args=("/books",))
-        index_thread.start()
+        # ?full=1 re-extracts every file instead of skipping unchanged ones,
+        # ?resume=0 ignores the checkpoint of an interrupted run
+        kwargs = {}
+        if request.args.get('full') in ('1', 'true'):
+            kwargs['incremental'] = False
+        if request.args.get('resume') in ('0', 'false'):
+            kwargs['resume'] = False
+        # Start indexing in a separate thread, unless a run is already going
+        started = start_indexing("/books", **kwargs)
         
         # If it's an API request, return immediately
         if request.headers.get('Accept') == 'application/json':
+            if not started:
+                return jsonify({"error": "Indexing is already running"}), 409
             return jsonify({"message": "Indexing started in background"})
         
         # Otherwise, render the progress page with CPU info
@@ -474,22 +912,67 @@ def index_books():
         return render_template('indexing_error.html', error=str(e))
 
 @app.route('/indexing_progress', methods=['GET'])
+@indexer_endpoint
 def get_indexing_progress():
-    progress = get_progress()
+    progress = progress_feed.current()
     if progress is None:
         return jsonify({"status": "not_running"})
-    
-    # Format time for display
-    from datetime import datetime
-    import pytz
-    
-    # Get browser timezone from Accept-Language header or use UTC as fallback
-    browser_tz = request.headers.get('X-Timezone', 'UTC')
+    # Browser timezone from the X-Timezone header, UTC as fallback
+    return jsonify(format_progress(progress, request.headers.get('X-Timezone', 'UTC')))
+
+@app.route('/indexing_progress/snapshot', methods=['GET'])
+@indexer_endpoint
+def get_indexing_progress_snapshot():
+    """The raw shared progress sample, which web workers stream to their own clients"""
+    return jsonify(progress_feed.current())
+
+@app.route('/indexing_progress/stream', methods=['GET'])
+def stream_indexing_progress():
+    """Server-Sent Events: the full progress first, then only the fields that changed.
+
+    The stream ends with a "done" event once no indexing is running. EventSource
+    can't send headers, so the browser timezone comes as ?tz=. Web workers serve
+    it from their own feed rather than forwarding it, so streams never hold the
+    indexer's threads; past PROGRESS_STREAM_MAX_CLIENTS the answer is 503.
+    """
+    if not progress_stream_slots.acquire(blocking=False):
+        response = jsonify({"error": "Too many progress streams open, poll /indexing_progress instead"})
+        response.headers['Retry-After'] = str(int(PROGRESS_STREAM_INTERVAL) or 1)
+        return response, 503
+    tz_name = request.args.get('tz', 'UTC')
+
+    def events():
+        sent = {}
+        for changed, progress in progress_feed.updates():
+            if progress is None:
+                yield f"event: done\ndata: {json.dumps({'status': 'not_running'})}\n\n"
+                return
+            if not changed:
+                yield ": keep-alive\n\n"
+                continue
+            formatted = format_progress(progress, tz_name)
+            delta = {key: value for key, value in formatted.items() if sent.get(key) != value}
+            sent = formatted
+            if delta:
+                yield f"data: {json.dumps(delta)}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(progress_stream_slots.release)
+    return response
+
+@lru_cache(maxsize=64)
+def get_timezone(name):
     try:
-        tz = pytz.timezone(browser_tz)
+        return pytz.timezone(name)
     except pytz.UnknownTimeZoneError:
-        tz = pytz.UTC
-    
+        return pytz.UTC
+
+def format_progress(progress, tz_name):
+    """The /indexing_progress JSON for a get_progress() snapshot, times shown in tz_name"""
+    tz = get_timezone(tz_name)
     elapsed_min = int(progress['elapsed_time'] // 60)
     elapsed_sec = int(progress['elapsed_time'] % 60)
     
@@ -502,25 +985,60 @@ def get_indexing_progress():
         remaining_sec = 0
         completion_time = "N/A"
     
-    return jsonify({
+    return {
         "status": "running",
         "total_files": progress['total_files'],
         "processed_files": progress['processed_files'],
         "percentage": round(progress['percentage'], 1),
         "current_file": progress['current_file'],
+        "scan_complete": progress['scan_complete'],
+        "state": progress['state'],
+        "resumed_files": progress['resumed_files'],
+        "quarantined_files": progress['quarantined_files'],
+        "metrics": progress['metrics'],
         "elapsed_time": f"{elapsed_min}m {elapsed_sec}s",
         "estimated_remaining": f"{remaining_min}m {remaining_sec}s",
         "estimated_completion": completion_time,
         "errors": progress['errors']
-    })
+    }
+
+@app.route('/indexing_errors', methods=['GET'])
+@indexer_endpoint
+def indexing_errors():
+    """Error records of the current or last run, paged with ?after=<next of the previous page>&limit=N"""
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers"}), 400
+    if after < 0 or not 1 <= limit <= 1000:
+        return jsonify({"error": "after must be >= 0 and limit between 1 and 1000"}), 400
+    return jsonify(get_errors(after, limit))
 
 @app.route('/abort_indexing', methods=['POST'])
+@indexer_endpoint
 def abort_indexing():
-    # In a real implementation, we would set a flag to stop the indexing
-    # For now, we'll just return a message
-    return jsonify({"status": "abort_requested", "message": "Indexing will stop after current file"})
+    if not request_cancel():
+        return jsonify({"status": "not_running", "message": "No indexing is running"}), 409
+    return jsonify({"status": "abort_requested",
+                    "message": "Indexing will stop after the current pages; the next run resumes from there"})
+
+@app.route('/pause_indexing', methods=['POST'])
+@indexer_endpoint
+def pause_indexing():
+    if not request_pause():
+        return jsonify({"status": "not_running", "message": "No indexing is running"}), 409
+    return jsonify({"status": "paused", "message": "Indexing paused"})
+
+@app.route('/resume_indexing', methods=['POST'])
+@indexer_endpoint
+def resume_indexing():
+    if not request_resume():
+        return jsonify({"status": "not_running", "message": "No indexing is running"}), 409
+    return jsonify({"status": "running", "message": "Indexing resumed"})
 
 @app.route('/reset_index', methods=['POST'])
+@indexer_endpoint
 def reset_index():
     """Reset the Elasticsearch index by deleting and recreating it"""
     try:
@@ -529,80 +1047,11 @@ def reset_index():
         if not auth or auth.username != os.environ.get("ADMIN_USER") or auth.password != os.environ.get("ADMIN_PASSWORD"):
             return jsonify({"error": "Authentication required"}), 401
 
-        # Delete existing index if it exists
-        if es.indices.exists(index=INDEX_NAME):
-            es.indices.delete(index=INDEX_NAME)
-        
-        # Verify required plugins are installed
-        try:
-            plugins = es.cat.plugins(format='json')
-            plugin_names = [p['component'] for p in plugins]
-            
-            if 'analysis-stempel' not in plugin_names:
-                return jsonify({
-                    "error": "Missing required plugin",
-                    "message": "Please install analysis-stempel plugin for Russian support",
-                    "solution": "Run: bin/elasticsearch-plugin install analysis-stempel"
-                }), 500
-
-            # Create index with cyrillic analyzer
-            es.indices.create(index=INDEX_NAME, body={
-                "settings": {
-                    "number_of_shards": 1,
-                    "number_of_replicas": 0,
-                    "analysis": {
-                        "filter": {
-                            "russian_stop": {
-                                "type": "stop",
-                                "stopwords": "_russian_"
-                            },
-                            "russian_stemmer": {
-                                "type": "stemmer",
-                                "language": "russian"
-                            }
-                        },
-                        "analyzer": {
-                            "cyrillic_analyzer": {
-                                "tokenizer": "standard",
-                                "filter": [
-                                    "lowercase",
-                                    "russian_stop",
-                                    "russian_stemmer"
-                                ]
-                            }
-                        }
-                    }
-                },
-                "mappings": {
-                    "properties": {
-                        "file_path": {"type": "keyword"},
-                        "content": {
-                            "type": "text",
-                            "analyzer": "cyrillic_analyzer",
-                            "search_analyzer": "cyrillic_analyzer"
-                        }
-                    }
-                }
-            })
-        except Exception as e:
-            # Fallback to basic configuration if advanced filters aren't available
-            es.indices.create(index=INDEX_NAME, body={
-                "settings": {
-                    "number_of_shards": 1,
-                    "number_of_replicas": 0
-                },
-                "mappings": {
-                    "properties": {
-                        "file_path": {"type": "keyword"},
-                        "content": {
-                            "type": "text",
-                            "analyzer": "standard",
-                            "search_analyzer": "standard"
-                        }
-                    }
-                }
-            })
+        # Same template as indexing runs use, so both end up with the same analyzer and mappings
+        if recreate_index() is None:
+            return jsonify({"error": "Indexing is running, abort it before resetting the index"}), 409
         
+        bump_index_generation()
         return jsonify({"status": "success", "message": "Index reset successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -610,4 +1059,10 @@ def reset_index():
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
     logging.info("Starting the API - inside main block")
+    start_health_monitor()
+    # The debug reloader runs this block in a parent process and in the child
+    # that serves requests; only the child should watch and index
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' and APP_ROLE != 'web':
+        start_watcher("/books")
+    # Development only; production runs gunicorn with gunicorn.conf.py
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
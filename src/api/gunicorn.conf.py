@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+
+# Production serving: gunicorn -c src/api/gunicorn.conf.py
+# APP_ROLE=web runs one worker per CPU_LIMIT core (WEB_WORKERS overrides);
+# "indexer" and "all" keep indexing state in memory, so they get exactly one
+# worker and rely on its threads for concurrent requests
+role = os.environ.get("APP_ROLE", "all").lower()
+cpu_limit = os.environ.get("CPU_LIMIT")
+
+wsgi_app = "app:app"
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+if role == "web":
+    workers = int(os.environ.get("WEB_WORKERS") or max(1, int(float(cpu_limit)) if cpu_limit
+                                                       else multiprocessing.cpu_count()))
+else:
+    workers = 1
+# Threads, so slow Elasticsearch calls and progress streams don't block a whole worker
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+
+# Import the app once in the master; workers fork from it. Workers restarted
+# by HUP fork from that same import, so new code needs a full restart
+preload_app = True
+# On HUP or TERM, workers finish their requests for up to this many seconds
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+timeout = 120
+keepalive = 5
+# Recycle web workers now and then (0 disables)
+max_requests = int(os.environ.get("WEB_MAX_REQUESTS", 0)) if role == "web" else 0
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+def post_worker_init(worker):
+    # Threads don't survive the fork from the preloading master, so each worker starts its own
+    from app import start_background_services
+    start_background_services()
@@ -0,0 +1,93 @@
+import os
+from threading import Lock
+from src.core.scanner import get_manifest
+
+SORT_KEYS = ('name', 'title', 'path', 'size', 'mtime')
+
+def title_from_filename(filename):
+    """Book title guessed from a "Title - Author.ext" style filename, else the filename."""
+    if ' - ' in filename:  # Common pattern in filenames
+        title_parts = filename.split(' - ')
+        if len(title_parts) > 1:
+            return ' - '.join(title_parts[:-1])  # Take all but last part
+    return filename
+
+class LibraryCatalog:
+    """The /files view of one library manifest: precomputed entries, totals and sort orders.
+
+    Built once per manifest, so listing, sorting and paging never touch
+    the share. Sort orders are computed the first time they're asked for.
+    """
+
+    def __init__(self, directory, library_files):
+        self.directory = directory
+        self.library_files = library_files
+        self.entries = []
+        self._search_keys = []
+        for library_file in library_files:
+            filename = os.path.basename(library_file.path)
+            path = os.path.relpath(library_file.path, directory)
+            self.entries.append({
+                'name': filename,
+                'title': title_from_filename(filename),
+                'path': path,
+                'type': os.path.splitext(filename)[1].lstrip('.').lower(),
+                'size': library_file.size,
+                'size_mb': round(library_file.size / (1024 * 1024), 2),
+                'mtime': library_file.mtime
+            })
+            self._search_keys.append(path.casefold())
+        self.total_files = len(self.entries)
+        self.total_size = sum(entry['size'] for entry in self.entries)
+        self._orders = {}
+        self._lock = Lock()
+
+    def _order(self, sort):
+        """Entry positions sorted ascending by sort, ties broken by path."""
+        with self._lock:
+            order = self._orders.get(sort)
+            if order is None:
+                if sort in ('name', 'title', 'path'):
+                    key = lambda i: (self.entries[i][sort].casefold(), self._search_keys[i])
+                else:
+                    key = lambda i: (self.entries[i][sort], self._search_keys[i])
+                order = sorted(range(self.total_files), key=key)
+                self._orders[sort] = order
+            return order
+
+    def query(self, sort='name', descending=False, search=None, file_type=None, offset=0, limit=None):
+        """Return (page of entries, number of matching entries, their total size).
+
+        search is a case-insensitive substring of the relative path,
+        file_type an extension without the dot.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        order = self._order(sort)
+        if descending:
+            order = order[::-1]
+        if search or file_type:
+            search = search.casefold() if search else None
+            order = [i for i in order
+                     if (not search or search in self._search_keys[i])
+                     and (not file_type or self.entries[i]['type'] == file_type)]
+            matched_size = sum(self.entries[i]['size'] for i in order)
+        else:
+            matched_size = self.total_size
+        end = None if limit is None else offset + limit
+        return [self.entries[i] for i in order[offset:end]], len(order), matched_size
+
+_catalog = None
+_catalog_lock = Lock()
+
+def get_catalog(directory, published_only=False):
+    """Catalog of the current manifest for directory, rebuilt only when a new scan is published.
+
+    published_only is passed on to get_manifest.
+    """
+    global _catalog
+    library_files = get_manifest(directory, published_only=published_only)
+    with _catalog_lock:
+        if _catalog is None or _catalog.directory != directory or _catalog.library_files is not library_files:
+            _catalog = LibraryCatalog(directory, library_files)
+        return _catalog
@@ -0,0 +1,123 @@
+import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from urllib.parse import unquote
+from bs4 import BeautifulSoup
+
+# Reads single chapters and the table of contents straight from the EPUB zip,
+# without loading every document of the book the way epub.read_epub does.
+
+def _local(tag):
+    """Tag name without its XML namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+def _children(element, name):
+    return [child for child in element if _local(child.tag) == name]
+
+def _resolve(base_dir, href):
+    """Zip member name for an href relative to base_dir, without any #fragment."""
+    href = unquote(href.split('#', 1)[0])
+    return posixpath.normpath(posixpath.join(base_dir, href)) if href else ''
+
+def _parse_package(full_path):
+    with zipfile.ZipFile(full_path) as archive:
+        container = ET.fromstring(archive.read('META-INF/container.xml'))
+        opf_path = next(el.get('full-path') for el in container.iter() if _local(el.tag) == 'rootfile')
+        opf_dir = posixpath.dirname(opf_path)
+        package = ET.fromstring(archive.read(opf_path))
+
+        manifest = {}
+        nav_path = None
+        ncx_path = None
+        for section in _children(package, 'manifest'):
+            for item in _children(section, 'item'):
+                path = _resolve(opf_dir, item.get('href', ''))
+                manifest[item.get('id')] = path
+                if 'nav' in (item.get('properties') or '').split():
+                    nav_path = path
+                elif item.get('media-type') == 'application/x-dtbncx+xml':
+                    ncx_path = path
+
+        # Every itemref, linear="no" ones included, so chapter numbers match
+        # the chapter_index the indexer stores (positions in ebooklib's book.spine)
+        spine = []
+        for section in _children(package, 'spine'):
+            ncx_path = manifest.get(section.get('toc'), ncx_path)
+            for itemref in _children(section, 'itemref'):
+                spine.append(manifest.get(itemref.get('idref')))
+
+        chapter_of = {path: index for index, path in reversed(list(enumerate(spine))) if path}
+        if nav_path:
+            toc = _read_nav(archive, nav_path, chapter_of)
+        elif ncx_path:
+            toc = _read_ncx(archive, ncx_path, chapter_of)
+        else:
+            toc = []
+    if not toc:
+        toc = [{'title': f"Chapter {index + 1}", 'chapter': index, 'level': 0}
+               for index, path in enumerate(spine) if path]
+    return spine, toc
+
+def _read_nav(archive, nav_path, chapter_of):
+    """TOC entries from an EPUB 3 navigation document."""
+    soup = BeautifulSoup(archive.read(nav_path), 'html.parser')
+    nav = soup.find('nav', attrs={'epub:type': 'toc'}) or soup.find('nav')
+    if nav is None:
+        return []
+    base_dir = posixpath.dirname(nav_path)
+    toc = []
+    for link in nav.find_all('a', href=True):
+        toc.append({
+            'title': link.get_text(' ', strip=True),
+            'chapter': chapter_of.get(_resolve(base_dir, link['href'])),
+            'level': len(link.find_parents('ol')) - 1
+        })
+    return toc
+
+def _read_ncx(archive, ncx_path, chapter_of):
+    """TOC entries from an EPUB 2 NCX file."""
+    root = ET.fromstring(archive.read(ncx_path))
+    base_dir = posixpath.dirname(ncx_path)
+    toc = []
+
+    def walk(element, level):
+        for point in _children(element, 'navPoint'):
+            # Only the point's own label, not those of nested points
+            title = ' '.join((el.text or '').strip() for label in _children(point, 'navLabel')
+                             for el in label.iter() if _local(el.tag) == 'text')
+            content = next(iter(_children(point, 'content')), None)
+            src = content.get('src', '') if content is not None else ''
+            toc.append({'title': title, 'chapter': chapter_of.get(_resolve(base_dir, src)), 'level': level})
+            walk(point, level + 1)
+
+    for nav_map in _children(root, 'navMap'):
+        walk(nav_map, 0)
+    return toc
+
+@lru_cache(maxsize=256)
+def _package_for(full_path, mtime_ns, size):
+    return _parse_package(full_path)
+
+def get_package(full_path, stat=None):
+    """Return (spine, toc) for an EPUB.
+
+    spine lists the zip member of every spine item in order, non-linear
+    ones included and None for an itemref missing from the manifest;
+    toc is a flat list of {'title', 'chapter', 'level'} entries where chapter
+    is the spine index the entry points into (None if it isn't in the spine).
+    Parsed once per version of the file.
+    """
+    stat = stat or os.stat(full_path)
+    return _package_for(full_path, stat.st_mtime_ns, stat.st_size)
+
+def read_chapter(full_path, chapter, stat=None):
+    """Raw bytes of one spine item. Raises IndexError for a chapter outside the spine or missing from the book."""
+    spine, _ = get_package(full_path, stat)
+    if not 0 <= chapter < len(spine):
+        raise IndexError(f"Chapter {chapter} out of range, the book has {len(spine)}")
+    if spine[chapter] is None:
+        raise IndexError(f"Chapter {chapter} is not in the book's manifest")
+    with zipfile.ZipFile(full_path) as archive:
+        return archive.read(spine[chapter])
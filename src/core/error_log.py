@@ -0,0 +1,87 @@
+import os
+import time
+from collections import Counter, deque
+from threading import Lock
+
+# Most error records kept per indexing run; older ones are dropped but still counted
+INDEX_ERROR_BUFFER = int(os.environ.get("INDEX_ERROR_BUFFER", 1000))
+
+class ErrorLog:
+    """Bounded ring buffer of structured error records with running counts.
+
+    Records are dicts with an increasing id, time, file, stage, type (the
+    exception class, if any) and message. Ids keep increasing across
+    clear() so API cursors from an earlier run never skip records of a
+    new one; only records of the current run count as missed by page().
+    """
+
+    def __init__(self, maxlen=None):
+        self._lock = Lock()
+        self._records = deque(maxlen=maxlen or INDEX_ERROR_BUFFER)
+        self._next_id = 1
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            # Records below this belong to an earlier run, not dropped ones of this run
+            self._first_id = self._next_id
+            self.total = 0
+            self.by_type = Counter()
+            self.by_stage = Counter()
+
+    def add(self, message, file_path=None, stage=None, error=None, error_type=None):
+        """Record one error; error is the exception behind it, if there was one."""
+        if error is not None and error_type is None:
+            error_type = type(error).__name__
+        record = {'file': file_path, 'stage': stage, 'type': error_type, 'message': message}
+        return self._add(record)
+
+    def _add(self, record):
+        with self._lock:
+            record = dict(record, id=self._next_id, time=record.get('time') or time.time())
+            self._next_id += 1
+            self._records.append(record)
+            self.total += 1
+            self.by_type[record['type'] or 'other'] += 1
+            self.by_stage[record['stage'] or 'other'] += 1
+            return record
+
+    def append(self, message):
+        """Record a plain message, like list.append did when errors were strings."""
+        self.add(message)
+
+    def extend(self, records):
+        """Take over records from another log, such as a worker's, giving them ids of this one."""
+        for record in records:
+            self._add(record if isinstance(record, dict) else {'message': record})
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total > 0
+
+    def page(self, after=0, limit=100):
+        """Records with an id above after, oldest first, and whether some were already dropped."""
+        with self._lock:
+            oldest = self._records[0]['id'] if self._records else self._next_id
+            page = [record for record in self._records if record['id'] > after][:limit]
+            missed = max(after + 1, self._first_id) < oldest
+        return page, missed
+
+    def summary(self, recent=5):
+        """Counts and the last few records, small enough to poll every second."""
+        with self._lock:
+            return {
+                'total': self.total,
+                'dropped': self.total - len(self._records),
+                'last_id': self._next_id - 1,
+                'by_type': dict(self.by_type),
+                'by_stage': dict(self.by_stage),
+                'recent': list(self._records)[-recent:] if recent else []
+            }
@@ -0,0 +1,116 @@
+from elasticsearch import Elasticsearch
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+
+# Elasticsearch Configuration
+ELASTICSEARCH_HOST = os.environ.get("ELASTICSEARCH_HOST", "localhost")
+ELASTICSEARCH_PORT = int(os.environ.get("ELASTICSEARCH_PORT", 9200))
+ES_CONNECTIONS_PER_NODE = int(os.environ.get("ES_CONNECTIONS_PER_NODE", 10))
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", 30))
+# Threads running the independent queries of one search side by side
+ES_FAN_OUT_THREADS = int(os.environ.get("ES_FAN_OUT_THREADS", 16))
+# Ping interval while Elasticsearch is down, and while it is up
+ES_RECONNECT_INTERVAL = float(os.environ.get("ES_RECONNECT_INTERVAL", 5))
+ES_HEALTH_INTERVAL = float(os.environ.get("ES_HEALTH_INTERVAL", 30))
+
+_client = None
+_client_lock = Lock()
+_fan_out_pool = None
+
+es_health = {
+    'status': 'unknown',
+    'checked_at': None,
+    'last_ok': None,
+    'last_error': None
+}
+health_lock = Lock()
+_monitor_thread = None
+
+def get_client():
+    """Return the process-wide Elasticsearch client, creating it on first use.
+
+    Creating the client doesn't connect; connections are opened on demand
+    and pooled per node by the transport.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = Elasticsearch(
+                    [{'host': ELASTICSEARCH_HOST, 'port': ELASTICSEARCH_PORT, 'scheme': 'http'}],
+                    connections_per_node=ES_CONNECTIONS_PER_NODE,
+                    request_timeout=ES_REQUEST_TIMEOUT,
+                    retry_on_timeout=True,
+                    max_retries=3
+                )
+    return _client
+
+class LazyElasticsearch:
+    """Stand-in for the client that defers creating it until an attribute is used."""
+
+    def __getattr__(self, name):
+        return getattr(get_client(), name)
+
+# Shared by the web app and the indexer
+es = LazyElasticsearch()
+
+def fan_out(*calls):
+    """Start independent Elasticsearch calls concurrently and return their futures, in order.
+
+    The calls share the client's pooled connections, so a search that needs
+    several queries takes as long as the slowest one instead of their sum.
+    """
+    global _fan_out_pool
+    if _fan_out_pool is None:
+        with _client_lock:
+            if _fan_out_pool is None:
+                _fan_out_pool = ThreadPoolExecutor(max_workers=ES_FAN_OUT_THREADS, thread_name_prefix="es-fan-out")
+    return [_fan_out_pool.submit(call) for call in calls]
+
+def check_health():
+    """Ping Elasticsearch once and record the outcome in es_health."""
+    now = time.time()
+    try:
+        ok = get_client().ping()
+        error = None if ok else "ping returned no response"
+    except Exception as e:
+        ok = False
+        error = str(e)
+
+    with health_lock:
+        if ok and es_health['status'] != 'up':
+            print("Connected to Elasticsearch")
+        elif not ok and es_health['status'] != 'down':
+            print(f"Elasticsearch not available: {error}")
+        es_health['status'] = 'up' if ok else 'down'
+        es_health['checked_at'] = now
+        if ok:
+            es_health['last_ok'] = now
+        else:
+            es_health['last_error'] = error
+    return ok
+
+def get_health():
+    with health_lock:
+        return es_health.copy()
+
+def is_available():
+    """False only once a health check has seen Elasticsearch down."""
+    with health_lock:
+        return es_health['status'] != 'down'
+
+def _monitor():
+    while True:
+        ok = check_health()
+        time.sleep(ES_HEALTH_INTERVAL if ok else ES_RECONNECT_INTERVAL)
+
+def start_health_monitor():
+    """Start the background thread that keeps es_health current. Safe to call more than once."""
+    global _monitor_thread
+    with health_lock:
+        if _monitor_thread is not None:
+            return
+        _monitor_thread = Thread(target=_monitor, name="es-health-monitor", daemon=True)
+    _monitor_thread.start()
@@ -1,206 +1,518 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import helpers
 import os
 import ebooklib
 from ebooklib import epub
 from bs4 import BeautifulSoup
 import PyPDF2
 import time
-from threading import Lock
+import hashlib
+import json
+import multiprocessing
+from collections import deque
+from threading import Lock, Thread
+from src.core.es_client import es
+from src.core import render_cache, text_store
+from src.core.scanner import scan_library, stat_library_files
+from src.core.worker_pool import WorkerPool, WorkerTimeout, WorkerCrashed
+from src.core.metrics import metrics, timed, take_stage_seconds
+from src.core.error_log import ErrorLog
 
 # Elasticsearch Configuration
-ELASTICSEARCH_HOST = os.environ.get("ELASTICSEARCH_HOST", "localhost")
-ELASTICSEARCH_PORT = int(os.environ.get("ELASTICSEARCH_PORT", 9200))
-es = Elasticsearch([{'host': ELASTICSEARCH_HOST, 'port': ELASTICSEARCH_PORT, 'scheme': 'http'}])
+# INDEX_NAME is an alias for the live index, which is named
+# INDEX_NAME-v<template version>-<milliseconds> and created from the index template
 INDEX_NAME = "book_index"
+INDEX_TEMPLATE_NAME = "book_index_template"
+# Bump whenever the settings or mappings below change; the next full run
+# builds a new index with them and swaps it in
+INDEX_TEMPLATE_VERSION = 2
+# Serving settings, restored once a full load is done (loads run with
+# neither replicas nor refreshes)
+INDEX_REPLICAS = int(os.environ.get("INDEX_REPLICAS", 0))
+INDEX_REFRESH_INTERVAL = os.environ.get("INDEX_REFRESH_INTERVAL", "1s")
+
+# Bulk indexing configuration
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 200))
+BULK_MAX_CHUNK_BYTES = int(os.environ.get("BULK_MAX_CHUNK_BYTES", 20 * 1024 * 1024))
+BULK_MIN_CHUNK_BYTES = 1024 * 1024
+BULK_MAX_RETRIES = int(os.environ.get("BULK_MAX_RETRIES", 5))
+BULK_INITIAL_BACKOFF = 2
+BULK_MAX_BACKOFF = 60
+# Room left for the metadata of a document when its size is estimated from its content
+BULK_ACTION_OVERHEAD = 1024
+
+# "book" stores one document per file, "passage" one per EPUB spine item,
+# PDF page or PASSAGE_TXT_CHARS block of a text file
+INDEX_GRANULARITY = os.environ.get("INDEX_GRANULARITY", "book")
+PASSAGE_TXT_CHARS = int(os.environ.get("PASSAGE_TXT_CHARS", 20000))
+
+# Extraction worker limits: wall-clock seconds per file, address space per
+# worker process (0 for none), and files per process before it's replaced
+EXTRACT_TIMEOUT = float(os.environ.get("EXTRACT_TIMEOUT", 600))
+EXTRACT_MEMORY_LIMIT_MB = int(os.environ.get("EXTRACT_MEMORY_LIMIT_MB", 4096))
+EXTRACT_MAX_TASKS_PER_WORKER = int(os.environ.get("EXTRACT_MAX_TASKS_PER_WORKER", 500))
+# Files that timed out or killed their worker; skipped until they change or a full run retries them
+EXTRACT_QUARANTINE_FILE = os.environ.get("EXTRACT_QUARANTINE_FILE", "/app/data/extract_quarantine.json")
+
+# Fields used to tell whether a file changed since it was last indexed
+FINGERPRINT_MAPPING = {
+    "file_path": {"type": "keyword"},
+    "file_size": {"type": "long"},
+    "file_mtime": {"type": "double"},
+    "content_hash": {"type": "keyword"},
+    "book_id": {"type": "keyword"},
+    "granularity": {"type": "keyword"},
+    # Extension without the dot, for the search facet and ?file_type= filter
+    "file_type": {"type": "keyword"}
+}
+
+# Where a passage sits inside its book
+PASSAGE_MAPPING = {
+    "chapter_index": {"type": "integer"},
+    "page": {"type": "integer"},
+    "start_offset": {"type": "long"},
+    "end_offset": {"type": "long"}
+}
+
+INDEX_MAPPING = {**FINGERPRINT_MAPPING, **PASSAGE_MAPPING}
+
+# Stored term vectors with offsets let the highlighter build snippets
+# without re-analyzing whole books at search time
+CONTENT_MAPPING = {"type": "text", "analyzer": "cyrillic_analyzer", "term_vector": "with_positions_offsets"}
+
+# The russian stop words and stemmer are built into Elasticsearch
+INDEX_ANALYSIS = {
+    "filter": {
+        "russian_stop": {
+            "type": "stop",
+            "stopwords": "_russian_"
+        },
+        "russian_stemmer": {
+            "type": "stemmer",
+            "language": "russian"
+        }
+    },
+    "analyzer": {
+        "cyrillic_analyzer": {
+            "tokenizer": "standard",
+            "filter": [
+                "lowercase",
+                "russian_stop",
+                "russian_stemmer"
+            ]
+        }
+    }
+}
 
 # Global variables for progress tracking
+# Errors of the current or last full-library run
+index_errors = ErrorLog()
+# Errors of watcher batches (runs with paths), kept apart so they don't wipe the above
+watch_errors = ErrorLog()
 indexing_progress = {
     'total_files': 0,
     'processed_files': 0,
     'start_time': None,
     'is_running': False,
     'current_file': '',
-    'errors': []
+    'skipped_files': 0,
+    'deleted_documents': 0,
+    'scan_complete': False,
+    'errors': index_errors
 }
 progress_lock = Lock()
+# Held for the whole of an indexing run so full runs and watcher batches don't interleave
+index_write_lock = Lock()
 
-def create_index():
-    if not es.indices.exists(index=INDEX_NAME):
-        es.indices.create(index=INDEX_NAME)
-
-# TODO: remove old version?
-def extract_text_from_epub_old(epub_path):
-    book = epub.read_epub(epub_path)
-    text = ''
-    for item in book.get_items():
-        if item.media_type == 'application/xhtml+xml':
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            text += soup.get_text()
-    return text
-
-# TODO: remove old version?
-def extract_text_from_epub_interim(epub_path):
-    text = ''
-    try:
+# Files finished by a full-library run, one JSON line each, so a run that
+# was aborted or crashed can be resumed without redoing them
+INDEX_CHECKPOINT_FILE = os.environ.get("INDEX_CHECKPOINT_FILE", "/app/data/index_checkpoint.jsonl")
+# How often a paused run looks for resume or abort
+JOB_POLL_INTERVAL = 0.5
+
+class IndexingCancelled(BaseException):
+    """Raised inside an indexing run, including its extraction workers, once an abort is requested.
+
+    A BaseException so the extractors' broad except Exception handlers don't swallow it.
+    """
+
+# Abort and pause flags of the current run. Multiprocessing events, so the
+# extraction workers can check them between PDF pages and EPUB items too.
+_cancel_event = None
+_resume_event = None
+# Seconds runs spent paused before the current pause, and when that one began
+_paused_total = 0.0
+_paused_since = None
+_pause_lock = Lock()
+# The background thread started by start_indexing
+_index_thread = None
+_index_thread_lock = Lock()
+
+# Bumped whenever the index contents may have changed, so cached search
+# results from before can be told apart
+index_generation = 0
+generation_lock = Lock()
+# Replaced on every bump so web workers notice reindexing done by the indexer
+# process; only needed, and only set, when the two run separately
+INDEX_GENERATION_FILE = os.environ.get("INDEX_GENERATION_FILE", "")
+
+def get_index_generation():
+    """Opaque value that changes whenever this or any other process bumps the generation."""
+    with generation_lock:
+        if not INDEX_GENERATION_FILE:
+            return index_generation, None
         try:
-            book = epub.read_epub(epub_path)
-        except Exception as e:
-            with progress_lock:
-                indexing_progress['errors'].append(f"EPUB structure error in {epub_path}: {str(e)}")
-            return text  # Return empty if we can't even read the EPUB
+            stat = os.stat(INDEX_GENERATION_FILE)
+            shared = (stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            shared = None
+        return index_generation, shared
 
-        for item in book.get_items():
-            current_item_id = getattr(item, 'id', 'no_id')
-            try:
-                # Attempt to process all text-containing formats
-                if item.media_type in ['application/xhtml+xml', 'text/html', 'application/html']:
-                    try:
-                        content = item.get_content()
-                    except Exception as e:
-                        with progress_lock:
-                            indexing_progress['errors'].append(
-                                f"Content extraction failed in {epub_path} item {current_item_id}: {str(e)}")
-                        continue
+def bump_index_generation():
+    global index_generation
+    with generation_lock:
+        index_generation += 1
+        if not INDEX_GENERATION_FILE:
+            return
+        try:
+            os.makedirs(os.path.dirname(INDEX_GENERATION_FILE), exist_ok=True)
+            tmp_path = f"{INDEX_GENERATION_FILE}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(str(time.time_ns()))
+            os.replace(tmp_path, INDEX_GENERATION_FILE)
+        except OSError as e:
+            print(f"Could not update {INDEX_GENERATION_FILE}: {e}")
 
-                    try:
-                        soup = BeautifulSoup(content, 'html.parser', from_encoding='utf-8')
-                        item_text = soup.get_text(separator='\n', strip=True)
-                        text += f"\n{item_text}\n"
-                    except Exception as e:
-                        with progress_lock:
-                            indexing_progress['errors'].append(
-                                f"HTML parsing failed in {epub_path} item {current_item_id}: {str(e)}")
-                        # Fallback to raw content extraction
-                        text += f"\n{content.decode('utf-8', errors='replace')}\n"
+def _set_job_events(cancel_event, resume_event):
+    """Make this process (the indexer, or a pool worker via its initializer) obey a run's flags."""
+    global _cancel_event, _resume_event
+    _cancel_event, _resume_event = cancel_event, resume_event
 
-            except Exception as e:
-                with progress_lock:
-                    indexing_progress['errors'].append(
-                        f"Unexpected error processing {epub_path} item {current_item_id}: {str(e)}")
-                continue
+def check_job_control():
+    """Raise IndexingCancelled if the run was aborted, and block while it is paused.
 
-    except Exception as e:
-        with progress_lock:
-            indexing_progress['errors'].append(f"Critical failure processing {epub_path}: {str(e)}")
+    Cheap enough to call per file, page or chapter.
+    """
+    if _cancel_event is None:
+        return
+    while not _resume_event.wait(JOB_POLL_INTERVAL):
+        if _cancel_event.is_set():
+            break
+    if _cancel_event.is_set():
+        raise IndexingCancelled("Indexing aborted on request")
 
-    return text
+def paused_seconds():
+    """Seconds spent paused so far, counting a pause that is still going on."""
+    with _pause_lock:
+        if _paused_since is None:
+            return _paused_total
+        return _paused_total + time.monotonic() - _paused_since
 
-# TODO: remove old version?
-def extract_text_from_epub_interim2(epub_path, progress_lock=None, indexing_progress=None):
-    """Extract text from EPUB using generator stabilization."""
-    text = ''
-    errors = []
-    info_messages = []
-    
-    def add_error(msg):
-        errors.append(msg)
-        if indexing_progress and progress_lock:
-            with progress_lock:
-                indexing_progress['errors'].append(msg)
+def _set_pause_clock(paused):
+    global _paused_total, _paused_since
+    with _pause_lock:
+        if paused and _paused_since is None:
+            _paused_since = time.monotonic()
+        elif not paused and _paused_since is not None:
+            _paused_total += time.monotonic() - _paused_since
+            _paused_since = None
 
-    # Validate file existence
-    if not os.path.exists(epub_path):
-        add_error(f"File not found: {epub_path}")
-        return '', errors
+def _set_job_state(state):
+    with progress_lock:
+        if indexing_progress['is_running']:
+            indexing_progress['state'] = state
+            return True
+        return False
 
-    try:
-        # --- EPUB Initialization ---
-        try:
-            book = epub.read_epub(epub_path)
-            info_messages.append(f"[MAIN] Processing EPUB: {os.path.basename(epub_path)}")
-        except Exception as e:
-            add_error(f"EPUB read failure: {str(e)}")
-            return '', errors
-
-        # --- Metadata Extraction ---
-        md = lambda ns,name: book.get_metadata(ns, name)[0][0] if book.get_metadata(ns, name) else 'N/A'
-        info_messages.extend([
-            "[METADATA]",
-            f"Title: {md('DC', 'title')}",
-            f"Creator: {md('DC', 'creator')}",
-            f"Language: {md('DC', 'language')}",
-            f"Identifier: {md('DC', 'identifier')}"
-        ])
-
-        # --- Critical Section: Resolve Generator Early ---
+def request_cancel():
+    """Ask the running indexing job to stop after the pages and files in progress. False if none runs."""
+    if _cancel_event is None or not _set_job_state('cancelling'):
+        return False
+    _cancel_event.set()
+    # A paused run has to wake up to notice
+    _set_pause_clock(False)
+    _resume_event.set()
+    return True
+
+def request_pause():
+    """Hold the running job at its next check. False if no run is going."""
+    if _resume_event is None or not _set_job_state('paused'):
+        return False
+    _set_pause_clock(True)
+    _resume_event.clear()
+    return True
+
+def request_resume():
+    """Let a paused job continue. False if no run is going."""
+    if _resume_event is None or not _set_job_state('running'):
+        return False
+    _set_pause_clock(False)
+    _resume_event.set()
+    return True
+
+def start_indexing(directory, **kwargs):
+    """Run index_files in a background thread unless one started here is still going.
+
+    Returns False, without starting anything, if a run is already underway.
+    """
+    global _index_thread
+
+    def run():
         try:
-            raw_items = book.get_items()
-            item_cache = list(raw_items)  # Convert generator to list IMMEDIATELY
-            item_map = {item.id: item for item in item_cache}
-            info_messages.append(f"[STRUCTURE] Found {len(item_cache)} items in manifest")
+            index_files(directory, **kwargs)
+        except IndexingCancelled:
+            print("Indexing cancelled")
         except Exception as e:
-            add_error(f"Item collection failed: {str(e)}")
-            return '', errors
+            # Already recorded in indexing_progress
+            print(f"Indexing failed: {e}")
 
-        # --- Spine Reconciliation ---
-        spine_items = []
+    with _index_thread_lock:
+        if _index_thread is not None and _index_thread.is_alive():
+            return False
+        _index_thread = Thread(target=run, name="indexer", daemon=True)
+        _index_thread.start()
+    return True
+
+def checkpoint_file(loading):
+    """Checkpoint path of runs on the live index, or of loads of a new one.
+
+    Kept apart so an incremental run between an interrupted load and the
+    next full run doesn't replace, or delete, the load's checkpoint.
+    """
+    if not loading:
+        return INDEX_CHECKPOINT_FILE
+    root, ext = os.path.splitext(INDEX_CHECKPOINT_FILE)
+    return f"{root}.load{ext}"
+
+def _checkpoint_header(directory, granularity, incremental, index_name):
+    return {'directory': directory, 'granularity': granularity, 'incremental': incremental, 'index': index_name}
+
+def load_checkpoint(path, directory, granularity, incremental, index_name):
+    """{path: [size, mtime]} finished by an interrupted run with the same settings and index, {} if there is none."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline() or 'null')
+            if header != _checkpoint_header(directory, granularity, incremental, index_name):
+                return {}
+            done = {}
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be cut short by a crash
+                    continue
+                done[entry['path']] = [entry['size'], entry['mtime']]
+            return done
+    except (OSError, ValueError):
+        return {}
+
+def open_checkpoint(path, directory, granularity, incremental, index_name, resume):
+    """Open the checkpoint for appending, starting a new one unless resuming. None if it can't be written."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        checkpoint = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume:
+            header = _checkpoint_header(directory, granularity, incremental, index_name)
+            checkpoint.write(json.dumps(header) + '\n')
+            checkpoint.flush()
+        return checkpoint
+    except OSError as e:
+        print(f"Cannot write indexing checkpoint {path}: {e}")
+        return None
+
+def load_quarantine():
+    """{path: {'size', 'mtime', 'reason', 'time'}} of files extraction gave up on."""
+    try:
+        with open(EXTRACT_QUARANTINE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_quarantine(quarantine):
+    os.makedirs(os.path.dirname(EXTRACT_QUARANTINE_FILE), exist_ok=True)
+    tmp_path = f"{EXTRACT_QUARANTINE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(quarantine, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, EXTRACT_QUARANTINE_FILE)
+
+def is_quarantined(quarantine, library_file):
+    entry = quarantine.get(library_file.path)
+    # A new version of the file deserves another try
+    return entry is not None and [entry['size'], entry['mtime']] == [library_file.size, library_file.mtime]
+
+def put_index_template():
+    """Install the current index template; every index behind INDEX_NAME is created from it."""
+    es.indices.put_index_template(
+        name=INDEX_TEMPLATE_NAME,
+        index_patterns=[f"{INDEX_NAME}-*"],
+        version=INDEX_TEMPLATE_VERSION,
+        template={
+            "settings": {
+                "number_of_shards": 1,
+                "number_of_replicas": INDEX_REPLICAS,
+                "refresh_interval": INDEX_REFRESH_INTERVAL,
+                "analysis": INDEX_ANALYSIS
+            },
+            "mappings": {
+                "_meta": {"template_version": INDEX_TEMPLATE_VERSION},
+                "properties": {**INDEX_MAPPING, "content": CONTENT_MAPPING}
+            }
+        })
+
+def live_index():
+    """The index INDEX_NAME points at, or None before the first run.
+
+    That's INDEX_NAME itself for an index created before it became an alias.
+    """
+    if not es.indices.exists(index=INDEX_NAME):
+        return None
+    return next(iter(es.indices.get_alias(index=INDEX_NAME)), None)
+
+def index_template_version(index_name):
+    """Template version an index was created with; 1 for indexes from before the template."""
+    mappings = es.indices.get_mapping(index=index_name)[index_name]['mappings']
+    return mappings.get('_meta', {}).get('template_version', 1)
+
+def create_index(rebuild=False):
+    """Return the index a run writes to and whether it is a new one that still has to go live.
+
+    Runs normally write to the live index. With rebuild, or before the
+    first run, they load a new index instead, created from the template
+    with refreshes and replicas off; swap_index() puts it live once it's
+    complete. A new index an interrupted load left behind is loaded on,
+    so the checkpoint of that run still applies.
+    """
+    put_index_template()
+    live = live_index()
+    if live is not None and not rebuild:
+        # Indexes created before these fields existed pick them up here
         try:
-            spine_ids = [s[0] for s in book.spine]
-            spine_items = [item_map.get(sid) for sid in spine_ids]
-            missing = len([sid for sid in spine_ids if sid not in item_map])
-            
-            info_messages.append(
-                f"[SPINE] Contains {len(spine_ids)} entries "
-                f"({len(spine_items)-missing} valid, {missing} missing)"
-            )
+            es.indices.put_mapping(index=live, properties=INDEX_MAPPING)
         except Exception as e:
-            add_error(f"Spine analysis failed: {str(e)}")
+            print(f"Could not update mapping of {live}: {e}")
+        if index_template_version(live) < INDEX_TEMPLATE_VERSION:
+            print(f"{live} predates index template version {INDEX_TEMPLATE_VERSION}, a full reindex rebuilds it")
+        return live, False
 
-        # --- Content Processing ---
-        content_blocks = []
-        processed_items = 0
-        
-        for item in item_cache:  # Use stabilized list
-            if item.media_type not in {'application/xhtml+xml', 'text/html'}:
-                continue
-                
-            try:
-                # Filter items safely
-                if item.size == 0:
-                    info_messages.append(f"[SKIP] Empty item: {item.id}")
-                    continue
+    prefix = f"{INDEX_NAME}-v{INDEX_TEMPLATE_VERSION}-"
+    unfinished = sorted(name for name in es.indices.get(index=f"{INDEX_NAME}-v*") if name != live)
+    target = None
+    for name in unfinished:
+        if name == unfinished[-1] and name.startswith(prefix):
+            target = name
+        else:
+            # Left behind by older loads or template versions
+            es.indices.delete(index=name)
+    if target is None:
+        target = f"{prefix}{int(time.time() * 1000)}"
+        es.indices.create(index=target)
+    else:
+        print(f"Continuing the load of {target}")
+    es.indices.put_settings(index=target, settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+    return target, True
 
-                try_context = f"Item {item.id} ({item.media_type})"
-                
-                # Content decoding
-                try:
-                    content = item.get_content().decode('utf-8-sig')  # Handle BOM
-                except UnicodeError:
-                    content = item.get_content().decode('latin-1', errors='replace')
+def swap_index(target):
+    """Give a fully loaded index its serving settings and atomically point INDEX_NAME at it.
 
-                # Text extraction
-                soup = BeautifulSoup(content, 'html.parser')
-                text = soup.get_text(separator='\n', strip=True)
-                
-                content_blocks.append(text)
-                processed_items += 1
-                info_messages.append(f"[PROCESSED] {try_context} ({len(text)} chars)")
+    The index that was live until then is deleted.
+    """
+    es.indices.put_settings(index=target, settings={"index": {"refresh_interval": INDEX_REFRESH_INTERVAL,
+                                                              "number_of_replicas": INDEX_REPLICAS}})
+    es.indices.refresh(index=target)
+    live = live_index()
+    actions = [{"add": {"index": target, "alias": INDEX_NAME}}]
+    if live == INDEX_NAME:
+        # The alias can only take the name once the index holding it is gone
+        actions.insert(0, {"remove_index": {"index": live}})
+    elif live is not None:
+        actions.insert(0, {"remove": {"index": live, "alias": INDEX_NAME}})
+    es.indices.update_aliases(actions=actions)
+    if live is not None and live != INDEX_NAME:
+        es.indices.delete(index=live)
+    print(f"{INDEX_NAME} now points at {target}")
 
-            except Exception as e:
-                add_error(f"Processing failed for {item.id}: {str(e)}")
+def recreate_index():
+    """Delete the live index and any unfinished loads, and put an empty index live.
 
-        # --- Final Assembly ---
-        info_messages.append(
-            f"[STATS] Processed {processed_items}/{len(item_cache)} items "
-            f"({len(content_blocks)} valid blocks)"
-        )
-        
-        full_text = '\n'.join(info_messages) + '\n\n' + '\n'.join(content_blocks)
-        return full_text.strip(), errors
+    Returns None without touching anything while an indexing run holds the
+    index, so a load in progress never loses its target.
+    """
+    if not index_write_lock.acquire(blocking=False):
+        return None
+    try:
+        return _recreate_index()
+    finally:
+        index_write_lock.release()
 
-    except Exception as e:
-        add_error(f"Critical failure: {str(e)}")
-        return '', errors
+def _recreate_index():
+    put_index_template()
+    live = live_index()
+    stale = set(es.indices.get(index=f"{INDEX_NAME}-v*"))
+    if live is not None:
+        stale.add(live)
+    target = f"{INDEX_NAME}-v{INDEX_TEMPLATE_VERSION}-{int(time.time() * 1000)}"
+    es.indices.create(index=target)
+    for name in stale:
+        es.indices.delete(index=name)
+    es.indices.update_aliases(actions=[{"add": {"index": target, "alias": INDEX_NAME}}])
+    return target
 
-def extract_text_from_epub(epub_path):
-    text = ''
+def document_id(file_path):
+    """Stable Elasticsearch _id for a file, so re-indexing overwrites instead of duplicating."""
+    return hashlib.sha1(file_path.encode('utf-8')).hexdigest()
+
+def file_content_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_fingerprints(book_ids=None, index_name=INDEX_NAME):
+    """Map book_id -> stored fingerprint fields plus the set of document ids ('ids') holding that book.
+
+    With book_ids only those books are loaded.
+    """
+    fingerprints = {}
+    if not es.indices.exists(index=index_name):
+        return fingerprints
+    if book_ids is None:
+        query = {"match_all": {}}
+    else:
+        # Documents from before book_id existed are only found by their _id
+        query = {"bool": {"should": [{"terms": {"book_id": list(book_ids)}},
+                                     {"ids": {"values": list(book_ids)}}]}}
+    for hit in helpers.scan(es, index=index_name, query={"query": query},
+                            _source=list(FINGERPRINT_MAPPING)):
+        source = hit.get('_source', {})
+        book_id = source.get('book_id')
+        if not book_id:
+            book_id = document_id(source['file_path']) if 'file_path' in source else hit['_id']
+        book = fingerprints.setdefault(book_id, {'ids': set()})
+        book['ids'].add(hit['_id'])
+        if 'content_hash' in source:
+            book.update(source)
+        else:
+            book.setdefault('file_path', source.get('file_path', hit['_id']))
+    return fingerprints
+
+def _own_document_ids(book_id, ids):
+    """Ids that follow the stable naming scheme for book_id; anything else is a leftover duplicate."""
+    return {doc_id for doc_id in ids if doc_id == book_id or doc_id.startswith(book_id + '-')}
+
+def iter_epub_chapters(epub_path):
+    """Yield (chapter_index, text) for each HTML item in the EPUB.
+
+    chapter_index is the item's position in the spine, None for items the
+    spine doesn't reference.
+    """
     try:
         try:
             book = epub.read_epub(epub_path)
         except Exception as e:
             with progress_lock:
-                indexing_progress['errors'].append(f"Failed to load EPUB: {epub_path}: Error:{str(e)}")
-            return text
+                indexing_progress['errors'].add(f"Failed to load EPUB: {epub_path}: Error:{str(e)}",
+                                                epub_path, 'parse', e)
+            return
 
         # Collect all items first to handle generator issues
         collected_items = []
@@ -209,9 +521,15 @@ def extract_text_from_epub(epub_path):
                 collected_items.append(item)
         except Exception as e:
             with progress_lock:
-                indexing_progress['errors'].append(f"Item collection failed in {epub_path}: {str(e)}")
+                indexing_progress['errors'].add(f"Item collection failed in {epub_path}: {str(e)}",
+                                                epub_path, 'parse', e)
+
+        spine_positions = {}
+        for position, (idref, _) in enumerate(getattr(book, 'spine', None) or []):
+            spine_positions.setdefault(idref, position)
 
         for item in collected_items:
+            check_job_control()
             current_item_id = getattr(item, 'id', 'no_id')
             try:
                 if item.media_type in ['application/xhtml+xml', 'text/html', 'application/html']:
@@ -219,41 +537,328 @@ def extract_text_from_epub(epub_path):
                         content = item.get_content()
                     except Exception as e:
                         with progress_lock:
-                            indexing_progress['errors'].append(
-                                f"Content extraction failed in {epub_path} item {current_item_id}: {str(e)}")
+                            indexing_progress['errors'].add(
+                                f"Content extraction failed in {epub_path} item {current_item_id}: {str(e)}",
+                                epub_path, 'read', e)
                         continue
 
                     try:
-                        soup = BeautifulSoup(content, 'html.parser', from_encoding='utf-8')
-                        item_text = soup.get_text(separator='\n', strip=True)
-                        text += f"\n{item_text}\n"
+                        with timed('strip'):
+                            soup = BeautifulSoup(content, 'html.parser', from_encoding='utf-8')
+                            item_text = soup.get_text(separator='\n', strip=True)
                     except Exception as e:
                         with progress_lock:
-                            indexing_progress['errors'].append(
-                                f"HTML parsing failed in {epub_path} item {current_item_id}: {str(e)}")
-                        text += f"\n{content.decode('utf-8', errors='replace')}\n"
+                            indexing_progress['errors'].add(
+                                f"HTML parsing failed in {epub_path} item {current_item_id}: {str(e)}",
+                                epub_path, 'strip', e)
+                        item_text = content.decode('utf-8', errors='replace')
+                    yield spine_positions.get(current_item_id), item_text
 
             except Exception as e:
                 with progress_lock:
-                    indexing_progress['errors'].append(
-                        f"Unexpected error processing {epub_path} item {current_item_id}: {str(e)}")
+                    indexing_progress['errors'].add(
+                        f"Unexpected error processing {epub_path} item {current_item_id}: {str(e)}",
+                        epub_path, 'parse', e)
                 continue
 
     except Exception as e:
         with progress_lock:
-            indexing_progress['errors'].append(f"Critical failure processing {epub_path}: {str(e)}")
+            indexing_progress['errors'].add(f"Critical failure processing {epub_path}: {str(e)}",
+                                            epub_path, 'parse', e)
 
-    return text
+def iter_epub_chunks(epub_path):
+    """Yield the text of each HTML item in the EPUB, one chunk per item."""
+    for _, item_text in iter_epub_chapters(epub_path):
+        yield item_text
 
+def extract_text_from_epub(epub_path):
+    # Items are framed by blank lines; joined once instead of growing a string per item
+    parts = []
+    for item_text in iter_epub_chunks(epub_path):
+        parts.extend(('\n', item_text, '\n'))
+    return ''.join(parts)
 
-def extract_text_from_pdf(pdf_path):
-    text = ''
+
+def iter_pdf_chunks(pdf_path):
+    """Yield the text of the PDF one page at a time."""
     with open(pdf_path, 'rb') as pdf_file:
         pdf_reader = PyPDF2.PdfReader(pdf_file)
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            text += page.extract_text()
-    return text
+        for page in pdf_reader.pages:
+            check_job_control()
+            yield page.extract_text() or ''
+
+def extract_text_from_pdf(pdf_path):
+    return ''.join(iter_pdf_chunks(pdf_path))
+
+def iter_txt_chunks(txt_path, chunk_size=1024 * 1024):
+    """Yield a text file in decoded chunks of at most chunk_size characters."""
+    with open(txt_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            check_job_control()
+            yield chunk
+
+def iter_text_chunks(file_path):
+    """Dispatch to the chunked extractor for the file type, None if unsupported."""
+    if file_path.endswith(".epub"):
+        return iter_epub_chunks(file_path)
+    elif file_path.endswith(".pdf"):
+        return iter_pdf_chunks(file_path)
+    elif file_path.endswith(".txt"):
+        return iter_txt_chunks(file_path.encode('utf-8').decode('utf-8'))
+    return None
+
+def extract_text(file_path):
+    """Extract the whole text of a file, None if unsupported."""
+    if file_path.endswith(".epub"):
+        return extract_text_from_epub(file_path)
+    chunks = iter_text_chunks(file_path)
+    if chunks is None:
+        return None
+    return ''.join(chunks)
+
+def extract_document(file_path):
+    """Extract a file's whole text and its sections in one pass, (None, None) if unsupported.
+
+    The text is what extract_text() returns. Sections are passage dicts
+    without content: EPUBs give one per HTML item, PDFs one per page and
+    text files one per PASSAGE_TXT_CHARS block, each with character offsets
+    into the text. Empty items and pages get no section.
+    """
+    parts = []
+    sections = []
+    offset = 0
+    if file_path.endswith(".epub"):
+        for chapter_index, item_text in iter_epub_chapters(file_path):
+            # extract_text frames every item with newlines
+            parts.extend(('\n', item_text, '\n'))
+            start = offset + 1
+            offset = start + len(item_text) + 1
+            if item_text:
+                section = {'start_offset': start, 'end_offset': start + len(item_text)}
+                if chapter_index is not None:
+                    section['chapter_index'] = chapter_index
+                sections.append(section)
+        return ''.join(parts), sections
+
+    if file_path.endswith(".pdf"):
+        chunks = iter_pdf_chunks(file_path)
+    elif file_path.endswith(".txt"):
+        chunks = iter_txt_chunks(file_path, PASSAGE_TXT_CHARS)
+    else:
+        return None, None
+    for number, chunk in enumerate(chunks, 1):
+        parts.append(chunk)
+        start = offset
+        offset += len(chunk)
+        if chunk:
+            section = {'start_offset': start, 'end_offset': offset}
+            if file_path.endswith(".pdf"):
+                section['page'] = number
+            sections.append(section)
+    return ''.join(parts), sections
+
+def passages_from_sections(text, sections):
+    """Passage dicts for index documents: each section with its slice of the text."""
+    return [dict(section, content=text[section['start_offset']:section['end_offset']]) for section in sections]
+
+def extract_passages(file_path):
+    """Split a file into passage dicts, None if unsupported.
+
+    Offsets are character positions in the text extract_text() returns for
+    the same file.
+    """
+    text, sections = extract_document(file_path)
+    if text is None:
+        return None
+    return passages_from_sections(text, sections)
+
+def get_worker_count():
+    """Number of extraction processes, sized from CPU_LIMIT the same way /index_books reports it."""
+    cpu_limit = os.environ.get("CPU_LIMIT")
+    available_cpus = multiprocessing.cpu_count()
+    used_cpus = float(cpu_limit) if cpu_limit else max(1, available_cpus - 1)
+    return max(1, int(used_cpus))
+
+class ExtractionResult(tuple):
+    """(extracted, errors, content_hash) of _extract_file, with the seconds spent per stage in .timings."""
+
+    def __new__(cls, extracted, errors, content_hash, timings=None):
+        result = super().__new__(cls, (extracted, errors, content_hash))
+        result.timings = timings or {}
+        return result
+
+    def __getnewargs__(self):
+        return tuple(self) + (self.timings,)
+
+def _extract_file(file_path, known_hash=None, granularity="book"):
+    """Pool worker: extract one file and return (extracted, errors, content_hash).
+
+    extracted is the whole text in "book" granularity and a list of passage
+    dicts in "passage" granularity. If the file's content hash equals
+    known_hash the file only got touched, so extraction is skipped and
+    extracted is None. Text already in the text store for the same content
+    hash is reused instead of parsing the file again; new text is stored.
+
+    Runs in a child process, so the extractors append to this process's own
+    copy of indexing_progress; the errors are shipped back with the result.
+    So are the stage timings, see ExtractionResult.
+    """
+    take_stage_seconds()
+    with timed('read'):
+        stat = os.stat(file_path)
+        # A file the text store already saw at this size and mtime needn't be read to hash it
+        content_hash = text_store.lookup(file_path, stat) or file_content_hash(file_path)
+    if known_hash is not None and content_hash == known_hash:
+        return ExtractionResult(None, [], content_hash, take_stage_seconds())
+    with progress_lock:
+        indexing_progress['errors'] = ErrorLog()
+    with timed('read'):
+        stored = text_store.load(content_hash)
+    if stored is not None:
+        text, sections = stored
+    else:
+        with timed('parse'):
+            text, sections = extract_document(file_path)
+        with progress_lock:
+            # A partial extraction isn't kept, the next run gets to try again
+            complete = not indexing_progress['errors']
+    try:
+        if stored is not None:
+            text_store.link(file_path, stat, content_hash)
+        elif text is not None and complete:
+            text_store.put(content_hash, text, sections, file_path, stat)
+    except OSError as e:
+        with progress_lock:
+            indexing_progress['errors'].add(f"Could not store text of {file_path}: {str(e)}", file_path, 'store', e)
+    extracted = passages_from_sections(text, sections) if granularity == "passage" and text is not None else text
+    if render_cache.RENDER_CACHE_WARM and file_path.endswith(".epub"):
+        try:
+            render_cache.get_rendered_html(file_path)
+        except Exception as e:
+            with progress_lock:
+                indexing_progress['errors'].add(f"HTML rendering failed for {file_path}: {str(e)}", file_path, 'render', e)
+    with progress_lock:
+        errors = indexing_progress['errors'].records()
+    timings = take_stage_seconds()
+    if 'parse' in timings:
+        # Stripping HTML happens inside parsing but is reported on its own
+        timings['parse'] = max(0.0, timings['parse'] - timings.get('strip', 0.0))
+    return ExtractionResult(extracted, errors, content_hash, timings)
+
+def extract_files(file_paths, workers=None, known_hashes=None, granularity="book"):
+    """Extract files in worker processes, yielding (file_path, future) as each one finishes.
+
+    known_hashes maps file paths to the content hash they were last indexed
+    with; matching files come back with text None instead of being parsed.
+
+    A file that runs past EXTRACT_TIMEOUT, or crashes or exhausts its
+    worker, fails with WorkerTimeout or WorkerCrashed; its worker is
+    killed and replaced while the others keep going.
+
+    At most two tasks per worker are in flight so a large library doesn't
+    queue up thousands of pending results in memory.
+    """
+    workers = workers or get_worker_count()
+    # spawn rather than fork: we're usually called from a Flask thread and
+    # forking a threaded process can leave locks held in the children
+    mp_context = multiprocessing.get_context('spawn')
+    # The pause clock, not the pool, measures pauses: while paused this
+    # generator isn't resumed, so the pool isn't waited on either
+    with WorkerPool(workers, mp_context, initializer=_set_job_events, initargs=(_cancel_event, _resume_event),
+                    timeout=EXTRACT_TIMEOUT, memory_limit_mb=EXTRACT_MEMORY_LIMIT_MB,
+                    max_tasks=EXTRACT_MAX_TASKS_PER_WORKER, paused_seconds=paused_seconds) as pool:
+        pending = {}
+        for file_path in file_paths:
+            known_hash = known_hashes.get(file_path) if known_hashes else None
+            pending[pool.submit(_extract_file, file_path, known_hash, granularity)] = file_path
+            if len(pending) < workers * 2:
+                continue
+            for future in pool.wait():
+                yield pending.pop(future), future
+        while pending:
+            for future in pool.wait():
+                yield pending.pop(future), future
+
+class _TimedBulkClient:
+    """Elasticsearch client stand-in for streaming_bulk that times each _bulk request."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def options(self, **kwargs):
+        return _TimedBulkClient(self._client.options(**kwargs))
+
+    def bulk(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._client.bulk(*args, **kwargs)
+        finally:
+            metrics.observe('write', time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+def bulk_error_type(result):
+    """Elasticsearch's error type of a failed _bulk item, e.g. mapper_parsing_exception."""
+    error = result.get('error')
+    if isinstance(error, dict):
+        return error.get('type')
+    return f"status_{result.get('status')}"
+
+def estimated_action_bytes(action):
+    """Rough payload size of a bulk action, from its content rather than serializing it again."""
+    source = action.get('_source') or action.get('doc') or {}
+    return len(source.get('content') or '') + BULK_ACTION_OVERHEAD
+
+def bulk_index(actions, chunk_size=BULK_CHUNK_SIZE, max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+               max_retries=BULK_MAX_RETRIES, attempt=0):
+    """Write (file_path, action) pairs through the _bulk API, yielding (file_path, ok, item).
+
+    Batches are capped by payload bytes as well as by count because book
+    content ranges from a few KB to tens of MB. Documents rejected with 429
+    are set aside and retried on their own with exponential backoff, in
+    smaller batches each round so a struggling cluster gets less to chew on.
+    The retry happens as soon as a batch worth of them has built up, so
+    under sustained backpressure they hold up the stream instead of
+    piling up in memory until the end of the run.
+    """
+    # streaming_bulk reports results in submission order when it isn't
+    # retrying itself, which lets us pair every result with its file
+    sent = deque()
+    rejected = []
+    rejected_bytes = 0
+
+    def tracked_actions():
+        for file_path, action in actions:
+            sent.append((file_path, action))
+            yield action
+
+    def retry_rejected():
+        nonlocal rejected, rejected_bytes
+        batch, rejected, rejected_bytes = rejected, [], 0
+        backoff = min(BULK_INITIAL_BACKOFF * 2 ** attempt, BULK_MAX_BACKOFF)
+        print(f"Elasticsearch rejected {len(batch)} documents, retry {attempt + 1}/{max_retries} in {backoff}s")
+        time.sleep(backoff)
+        yield from bulk_index(iter(batch), max(1, chunk_size // 2),
+                              max(BULK_MIN_CHUNK_BYTES, max_chunk_bytes // 2), max_retries, attempt + 1)
+
+    for ok, item in helpers.streaming_bulk(_TimedBulkClient(es), tracked_actions(),
+                                           chunk_size=chunk_size,
+                                           max_chunk_bytes=max_chunk_bytes,
+                                           raise_on_error=False,
+                                           raise_on_exception=False):
+        file_path, action = sent.popleft()
+        status = next(iter(item.values())).get('status')
+        if not ok and status == 429 and attempt < max_retries:
+            rejected.append((file_path, action))
+            rejected_bytes += estimated_action_bytes(action)
+            if len(rejected) >= chunk_size or rejected_bytes >= max_chunk_bytes:
+                yield from retry_rejected()
+            continue
+        yield file_path, ok, item
+
+    if rejected:
+        yield from retry_rejected()
 
 def get_progress():
     with progress_lock:
@@ -268,19 +873,66 @@ def get_progress():
             
         elapsed = time.time() - progress['start_time']
         progress['elapsed_time'] = elapsed
-        if progress['processed_files'] > 0:
-            time_per_file = elapsed / progress['processed_files']
-            remaining_files = progress['total_files'] - progress['processed_files']
-            progress['estimated_remaining'] = time_per_file * remaining_files
-            progress['estimated_completion'] = time.time() + progress['estimated_remaining']
+        remaining = metrics.estimate_remaining(progress['processed_files'], progress['total_files'])
+        if remaining is not None:
+            progress['estimated_remaining'] = remaining
+            progress['estimated_completion'] = time.time() + remaining
         else:
             progress['estimated_remaining'] = 0
             progress['estimated_completion'] = 0
+        progress['metrics'] = metrics.snapshot()
+        # The records themselves are paged through get_errors()
+        progress['errors'] = progress['errors'].summary()
             
         return progress
 
-def index_files(directory):
+def get_errors(after=0, limit=100):
+    """Up to limit error records of the current or last run with ids above after, plus the counts.
+
+    next is the cursor for the following page; missed is true when records
+    after the cursor were already pushed out of the buffer.
+    """
+    records, missed = index_errors.page(after, limit)
+    summary = index_errors.summary(recent=0)
+    del summary['recent']
+    return dict(summary, errors=records, missed=missed, next=records[-1]['id'] if records else after)
+
+def index_files(directory, workers=None, incremental=True, granularity=None, paths=None, resume=True):
+    """Index every supported file under directory, or only the given paths.
+
+    In incremental mode files whose size and mtime match the stored
+    fingerprint are skipped without being opened, and files whose content
+    hash still matches only get their fingerprint refreshed. Documents for
+    files that no longer exist are deleted in either mode, as are passages
+    a changed book no longer has.
+
+    With paths (e.g. from the watcher) only those files are looked at;
+    paths that no longer exist have their documents deleted.
+
+    Full runs (not incremental, no paths) and the first run load a new
+    index with refreshes and replicas off, and swap it in for the live one
+    when they complete; searches see the old index until then.
+
+    Full-library runs record finished files in a checkpoint (see
+    checkpoint_file). With resume, files an interrupted run with the same
+    settings and target index finished are skipped. request_cancel() makes the run raise IndexingCancelled.
+    """
+    with index_write_lock:
+        mp_context = multiprocessing.get_context('spawn')
+        _set_job_events(mp_context.Event(), mp_context.Event())
+        _resume_event.set()
+        _set_pause_clock(False)
+        _index_files(directory, workers, incremental, granularity or INDEX_GRANULARITY, paths, resume)
+
+def _index_files(directory, workers, incremental, granularity, paths, resume):
     global indexing_progress
+
+    if paths is not None and live_index() is None:
+        # An index holding only these files mustn't go live; the first full run covers them
+        print(f"No live index yet, leaving {len(paths)} changed files to the first full indexing run")
+        return
+    # Watcher batches log to watch_errors and put the last full run's progress back when done
+    previous_progress = indexing_progress if paths is not None else None
     
     with progress_lock:
         indexing_progress = {
@@ -289,62 +941,305 @@ def index_files(directory):
             'start_time': time.time(),
             'is_running': True,
             'current_file': '',
-            'errors': []
+            'skipped_files': 0,
+            'deleted_documents': 0,
+            'scan_complete': False,
+            'state': 'running',
+            'resumed_files': 0,
+            'quarantined_files': 0,
+            'errors': index_errors if paths is None else watch_errors
         }
+        if paths is None:
+            index_errors.clear()
     
+    if paths is None:
+        metrics.start_run()
+    checkpoint = None
+    # The index this run wrote to or deleted from, refreshed before the generation moves on
+    written_index = None
     try:
-        create_index()
-        
-        # First count all files
-        total_files = 0
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if file.endswith(('.epub', '.pdf', '.txt')):
-                    total_files += 1
+        target, loading = create_index(rebuild=paths is None and not incremental)
+        stored = load_fingerprints(None if paths is None else {document_id(path) for path in paths}, target)
         
-        with progress_lock:
-            indexing_progress['total_files'] = total_files
+        file_stats = {}
+        known_hashes = {}
+        # Every stored document id that is still wanted after this run
+        keep_ids = set()
+        # Content hashes of every file still in the library, for pruning the text store
+        live_hashes = set()
+        # Parts of the library the scan couldn't read
+        scan_errors = []
+
+        # A full run gives quarantined files another chance
+        quarantine = load_quarantine()
+        skip_quarantined = incremental
+
+        if paths is None:
+            checkpoint_path = checkpoint_file(loading)
+            finished = load_checkpoint(checkpoint_path, directory, granularity, incremental, target) if resume else {}
+            if finished:
+                print(f"Resuming indexing, {len(finished)} files already done")
+            checkpoint = open_checkpoint(checkpoint_path, directory, granularity, incremental, target, bool(finished))
+        else:
+            finished = {}
+
+        def keep_stored(file_path):
+            """Keep what the index already has of a book that couldn't be extracted this time."""
+            book_id = document_id(file_path)
+            known = stored.get(book_id)
+            if known:
+                keep_ids.update(_own_document_ids(book_id, known['ids']))
+                live_hashes.add(known.get('content_hash'))
+
+        def mark_finished(file_path, library_file):
+            if checkpoint is not None:
+                line = {'path': file_path, 'size': library_file.size, 'mtime': library_file.mtime}
+                checkpoint.write(json.dumps(line) + '\n')
+                checkpoint.flush()
+
+        def files_to_extract():
+            """Walk the scan as it streams in, so extraction starts before the scan ends."""
+            library_files = iter(scan_library(directory, scan_errors) if paths is None
+                                 else stat_library_files(paths))
+            scan_seconds = 0.0
+            while True:
+                started = time.perf_counter()
+                library_file = next(library_files, None)
+                scan_seconds += time.perf_counter() - started
+                if library_file is None:
+                    break
+                check_job_control()
+                file_path = library_file.path
+                book_id = document_id(file_path)
+                known = stored.get(book_id)
+                with progress_lock:
+                    indexing_progress['total_files'] += 1
+                if skip_quarantined and is_quarantined(quarantine, library_file):
+                    keep_stored(file_path)
+                    with progress_lock:
+                        indexing_progress['processed_files'] += 1
+                        indexing_progress['quarantined_files'] += 1
+                    continue
+                if known and finished.get(file_path) == [library_file.size, library_file.mtime]:
+                    # Done by the interrupted run this one resumes
+                    keep_ids.update(_own_document_ids(book_id, known['ids']))
+                    live_hashes.add(known.get('content_hash'))
+                    with progress_lock:
+                        indexing_progress['processed_files'] += 1
+                        indexing_progress['resumed_files'] += 1
+                    continue
+                if incremental and known and known.get('granularity', 'book') == granularity:
+                    # Documents from before file_type existed go through the
+                    # touched-file path, which refreshes the fingerprint without re-parsing
+                    if (known.get('file_size') == library_file.size and known.get('file_mtime') == library_file.mtime
+                            and known.get('file_type')):
+                        keep_ids.update(_own_document_ids(book_id, known['ids']))
+                        live_hashes.add(known.get('content_hash'))
+                        mark_finished(file_path, library_file)
+                        with progress_lock:
+                            indexing_progress['processed_files'] += 1
+                            indexing_progress['skipped_files'] += 1
+                        continue
+                    known_hashes[file_path] = known.get('content_hash')
+                file_stats[file_path] = library_file
+                yield file_path
+            metrics.observe('scan', scan_seconds)
+            with progress_lock:
+                indexing_progress['scan_complete'] = True
+                for scan_error in scan_errors:
+                    indexing_progress['errors'].add(scan_error, stage='scan')
+
+        # Bulk results still expected per file, so a file counts as processed
+        # only once all of its passages are acknowledged
+        outstanding = {}
+        outstanding_files = {}
         
-        # Now process files
-        for root, _, files in os.walk(directory):
-            for file in files:
-                file_path = os.path.join(root, file)
-                
+        # Extraction runs in worker processes, indexing stays on this thread
+        def extracted_documents():
+            for file_path, future in extract_files(files_to_extract(), workers, known_hashes, granularity):
+                check_job_control()
                 with progress_lock:
                     indexing_progress['current_file'] = file_path
+                library_file = file_stats.pop(file_path)
                 
                 try:
-                    encoded_file_path = file_path.encode('utf-8').decode('utf-8')
-                    if file_path.endswith(".epub"):
-                        text = extract_text_from_epub(file_path)
-                    elif file_path.endswith(".pdf"):
-                        text = extract_text_from_pdf(file_path)
-                    elif file_path.endswith(".txt"):
-                        with open(encoded_file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            text = f.read()
-                    else:
-                        print(f"Skipping unsupported file type: {file_path}")
-                        continue
-
-                    doc = {
-                        'file_path': file_path,
-                        'content': text
-                    }
-                    es.index(index=INDEX_NAME, document=doc)
-                    print(f"Indexed: {file_path}")
-                    
+                    extraction = future.result()
+                    extracted, extraction_errors, content_hash = extraction
+                except (WorkerTimeout, WorkerCrashed) as e:
+                    error_msg = f"Quarantined {file_path}: {e}"
+                    print(error_msg)
+                    quarantine[file_path] = {'size': library_file.size, 'mtime': library_file.mtime,
+                                             'reason': str(e), 'time': time.time()}
+                    try:
+                        save_quarantine(quarantine)
+                    except OSError as save_error:
+                        print(f"Could not save the quarantine list: {save_error}")
+                    keep_stored(file_path)
                     with progress_lock:
-                        indexing_progress['processed_files'] += 1
-                    
+                        indexing_progress['errors'].add(error_msg, file_path, 'extract', e)
+                        indexing_progress['quarantined_files'] += 1
+                    continue
                 except Exception as e:
                     error_msg = f"Error indexing {file_path}: {type(e)}, {e}"
                     print(error_msg)
+                    keep_stored(file_path)
+                    with progress_lock:
+                        indexing_progress['errors'].add(error_msg, file_path, 'extract', e)
+                    continue
+
+                if extraction_errors:
+                    with progress_lock:
+                        indexing_progress['errors'].extend(extraction_errors)
+                metrics.record_file(file_path, library_file.size, getattr(extraction, 'timings', {}))
+                live_hashes.add(content_hash)
+                if quarantine.pop(file_path, None) is not None:
+                    try:
+                        save_quarantine(quarantine)
+                    except OSError as e:
+                        print(f"Could not save the quarantine list: {e}")
+
+                book_id = document_id(file_path)
+                fingerprint = {
+                    'file_path': file_path,
+                    'file_size': library_file.size,
+                    'file_mtime': library_file.mtime,
+                    'content_hash': content_hash,
+                    'book_id': book_id,
+                    'granularity': granularity,
+                    'file_type': os.path.splitext(file_path)[1].lstrip('.').lower()
+                }
+                if extracted is None:
+                    # Same bytes, new mtime: just refresh the stored fingerprint
+                    doc_ids = sorted(_own_document_ids(book_id, stored[book_id]['ids']))
+                    keep_ids.update(doc_ids)
+                    outstanding[file_path] = len(doc_ids)
+                    outstanding_files[file_path] = library_file
                     with progress_lock:
-                        indexing_progress['errors'].append(error_msg)
+                        indexing_progress['skipped_files'] += 1
+                    for doc_id in doc_ids:
+                        yield file_path, {'_op_type': 'update', '_index': target, '_id': doc_id, 'doc': fingerprint}
+                    continue
+
+                if granularity == "passage":
+                    documents = [(f"{book_id}-{number}", dict(fingerprint, **passage))
+                                 for number, passage in enumerate(extracted)]
+                else:
+                    documents = [(book_id, dict(fingerprint, content=extracted))]
+                keep_ids.update(doc_id for doc_id, _ in documents)
+                if not documents:
+                    mark_finished(file_path, library_file)
+                    with progress_lock:
+                        indexing_progress['processed_files'] += 1
+                    continue
+                outstanding[file_path] = len(documents)
+                outstanding_files[file_path] = library_file
+                for doc_id, doc in documents:
+                    yield file_path, {'_index': target, '_id': doc_id, '_source': doc}
+
+        for file_path, ok, item in bulk_index(extracted_documents()):
+            if ok:
+                written_index = target
+                metrics.record_documents()
+            else:
+                result = next(iter(item.values()))
+                error_msg = f"Error indexing {file_path}: status {result.get('status')}, {result.get('error')}"
+                print(error_msg)
+                with progress_lock:
+                    indexing_progress['errors'].add(error_msg, file_path, 'write',
+                                                    error_type=bulk_error_type(result))
+            outstanding[file_path] -= 1
+            if outstanding[file_path] == 0:
+                del outstanding[file_path]
+                mark_finished(file_path, outstanding_files.pop(file_path))
+                print(f"Indexed: {file_path}")
+                with progress_lock:
+                    indexing_progress['processed_files'] += 1
+
+        # Books the scan didn't see only count as deleted if it saw the whole
+        # library, and an empty library is more likely an unmounted share
+        with progress_lock:
+            library_empty = paths is None and indexing_progress['total_files'] == 0
+        incomplete = None
+        if scan_errors:
+            incomplete = f"{len(scan_errors)} parts of {directory} could not be read"
+        elif library_empty and (stored or (loading and live_index() is not None)):
+            incomplete = f"No books found in {directory}"
+        if incomplete:
+            error_msg = f"{incomplete}, keeping the documents and texts of books not seen"
+            print(error_msg)
+            with progress_lock:
+                indexing_progress['errors'].add(error_msg, stage='scan', error_type='IncompleteScan')
+            if loading:
+                # The checkpoint stays, so the next run picks the load up again
+                raise RuntimeError(f"{incomplete}, not replacing the live index")
+
+        # Whatever is left in the index without a file or passage behind it is stale
+        def deletions():
+            if incomplete:
+                return
+            for book_id, book in stored.items():
+                for doc_id in book['ids'] - keep_ids:
+                    yield book.get('file_path', doc_id), {'_op_type': 'delete', '_index': target, '_id': doc_id}
+
+        for file_path, ok, item in bulk_index(deletions()):
+            result = next(iter(item.values()))
+            if ok or result.get('status') == 404:
+                written_index = target
+                print(f"Removed from index: {file_path}")
+                with progress_lock:
+                    indexing_progress['deleted_documents'] += 1
+            else:
+                error_msg = f"Error removing {file_path}: status {result.get('status')}, {result.get('error')}"
+                print(error_msg)
+                with progress_lock:
+                    indexing_progress['errors'].add(error_msg, file_path, 'delete',
+                                                    error_type=bulk_error_type(result))
+
+        if loading:
+            swap_index(target)
+
+        try:
+            # Only a full run over the whole library knows every live hash
+            pruned = text_store.prune(live_hashes) if paths is None and not incomplete else 0
+            if pruned:
+                print(f"Removed {pruned} stale texts from the text store")
+        except OSError as e:
+            print(f"Could not prune the text store: {e}")
+
+        if checkpoint is not None:
+            # The run is complete, there's nothing left to resume
+            checkpoint.close()
+            checkpoint = None
+            os.remove(checkpoint_path)
         
+    except IndexingCancelled:
+        print("Indexing aborted on request")
+        with progress_lock:
+            indexing_progress['errors'].add("Indexing aborted on request, the next run resumes where this one stopped",
+                                            stage='run', error_type='IndexingCancelled')
+        raise
+    except Exception as e:
+        error_msg = f"Indexing aborted: {type(e)}, {e}"
+        print(error_msg)
+        with progress_lock:
+            indexing_progress['errors'].add(error_msg, stage='run', error=e)
+        raise
     finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        if written_index is not None:
+            try:
+                # Otherwise a search within refresh_interval caches the old
+                # results under the new generation
+                es.indices.refresh(index=written_index)
+            except Exception as e:
+                print(f"Could not refresh {written_index}: {e}")
+        bump_index_generation()
         with progress_lock:
             indexing_progress['is_running'] = False
+            indexing_progress['state'] = 'finished'
+            if previous_progress is not None:
+                indexing_progress = previous_progress
 
 if __name__ == '__main__':
     BOOKS_DIR = "/books"  # This should match the volume mount in docker-compose.yml
@@ -0,0 +1,155 @@
+import heapq
+import os
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+
+# scan: walking the library; read: stat, hashing and text store reads;
+# parse: the extractors minus strip; strip: HTML to text; write: _bulk requests
+STAGES = ('scan', 'read', 'parse', 'strip', 'write')
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+METRICS_SLOWEST_FILES = int(os.environ.get("METRICS_SLOWEST_FILES", 10))
+# The ETA extrapolates the rate of the last ETA_WINDOW seconds
+ETA_WINDOW = float(os.environ.get("ETA_WINDOW", 120))
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds, Prometheus style."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """[(upper bound, observations <= bound)], ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+# Seconds per stage spent by this process on the current file; extraction
+# workers collect them here and ship them back with the file's result
+_stage_seconds = {}
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_seconds[stage] = _stage_seconds.get(stage, 0.0) + time.perf_counter() - started
+
+def take_stage_seconds():
+    """Return and reset the stage seconds collected by timed()."""
+    seconds = dict(_stage_seconds)
+    _stage_seconds.clear()
+    return seconds
+
+class IndexingMetrics:
+    """Timings and throughput of indexing runs.
+
+    Histograms and totals add up over the life of the process, as
+    Prometheus expects; rates, the slowest files and the ETA are per run.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.totals = {'files': 0, 'bytes': 0, 'documents': 0}
+        self.start_run()
+
+    def start_run(self):
+        with self._lock:
+            self.run_started = time.time()
+            self.run_files = 0
+            self.run_bytes = 0
+            self.run_documents = 0
+            self._slowest = []
+            self._samples = deque()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].observe(seconds)
+
+    def record_file(self, file_path, size, stage_seconds):
+        """Account for one extracted file and the time its stages took."""
+        with self._lock:
+            for stage, seconds in stage_seconds.items():
+                self.histograms[stage].observe(seconds)
+            self.totals['files'] += 1
+            self.totals['bytes'] += size
+            self.run_files += 1
+            self.run_bytes += size
+            entry = (sum(stage_seconds.values()), file_path, stage_seconds)
+            if len(self._slowest) < METRICS_SLOWEST_FILES:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def record_documents(self, count=1):
+        with self._lock:
+            self.totals['documents'] += count
+            self.run_documents += count
+
+    def estimate_remaining(self, processed, total, now=None):
+        """Seconds left at the rate of the last ETA_WINDOW seconds, None before there is a rate."""
+        now = now or time.time()
+        with self._lock:
+            samples = self._samples
+            if not samples or samples[-1][1] != processed:
+                samples.append((now, processed))
+            while len(samples) > 2 and now - samples[0][0] > ETA_WINDOW:
+                samples.popleft()
+            first_time, first_processed = samples[0]
+            if processed == first_processed:
+                # Nothing done since the window started, fall back to the run's average
+                first_time, first_processed = self.run_started, 0
+            if processed <= first_processed or now <= first_time:
+                return None
+            rate = (processed - first_processed) / (now - first_time)
+        return max(0, total - processed) / rate
+
+    def snapshot(self):
+        """Rates of the current run, slowest files and per-stage summaries, for /indexing_progress."""
+        with self._lock:
+            elapsed = max(time.time() - self.run_started, 1e-9)
+            return {
+                'files_per_sec': round(self.run_files / elapsed, 3),
+                'bytes_per_sec': round(self.run_bytes / elapsed),
+                'docs_per_sec': round(self.run_documents / elapsed, 3),
+                'stages': {stage: {'count': histogram.count, 'seconds': round(histogram.sum, 3)}
+                           for stage, histogram in self.histograms.items()},
+                'slowest_files': [{'file_path': file_path, 'seconds': round(seconds, 3),
+                                   'stages': {stage: round(value, 3) for stage, value in stage_seconds.items()}}
+                                  for seconds, file_path, stage_seconds in sorted(self._slowest, reverse=True)]
+            }
+
+    def prometheus(self):
+        """Histograms and totals in the Prometheus text exposition format."""
+        lines = ['# HELP booksearch_indexing_stage_seconds Time spent per indexing stage.',
+                 '# TYPE booksearch_indexing_stage_seconds histogram']
+        with self._lock:
+            for stage, histogram in self.histograms.items():
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'booksearch_indexing_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'booksearch_indexing_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'booksearch_indexing_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, description in (('files', 'Files extracted.'), ('bytes', 'Bytes of files extracted.'),
+                                      ('documents', 'Documents written to Elasticsearch.')):
+                lines.append(f'# HELP booksearch_indexed_{name}_total {description}')
+                lines.append(f'# TYPE booksearch_indexed_{name}_total counter')
+                lines.append(f'booksearch_indexed_{name}_total {self.totals[name]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = IndexingMetrics()
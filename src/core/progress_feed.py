@@ -0,0 +1,80 @@
+import os
+import time
+from threading import Condition, Thread
+
+# Seconds between progress samples pushed to /indexing_progress/stream
+# clients; polls of /indexing_progress within that time share one sample too
+PROGRESS_STREAM_INTERVAL = float(os.environ.get("PROGRESS_STREAM_INTERVAL", 1.0))
+# Seconds of silence after which a stream gets a keep-alive comment
+PROGRESS_STREAM_HEARTBEAT = float(os.environ.get("PROGRESS_STREAM_HEARTBEAT", 15))
+
+class ProgressFeed:
+    """Samples a progress source at most once per interval and shares the sample with every reader.
+
+    However many pages and scripts watch a run, the source (and the lock
+    behind it) is read once per interval: by a sampler thread while
+    anyone is subscribed to updates(), otherwise by the first current()
+    call after the last sample went stale.
+    """
+
+    def __init__(self, source, interval=PROGRESS_STREAM_INTERVAL):
+        self.source = source
+        self.interval = interval
+        self._condition = Condition()
+        self._sequence = 0
+        self._snapshot = None
+        self._sampled_at = None
+        self._subscribers = 0
+        self._sampler = None
+
+    def _sample(self):
+        # Called with the condition held
+        snapshot = self.source()
+        self._sampled_at = time.monotonic()
+        if self._sequence == 0 or snapshot != self._snapshot:
+            self._snapshot = snapshot
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def _stale(self):
+        return self._sampled_at is None or time.monotonic() - self._sampled_at >= self.interval
+
+    def current(self):
+        """The latest sample, taking a new one if it's older than the interval."""
+        with self._condition:
+            if self._stale():
+                self._sample()
+            return self._snapshot
+
+    def _run_sampler(self):
+        while True:
+            with self._condition:
+                if not self._subscribers:
+                    self._sampler = None
+                    return
+                if self._stale():
+                    self._sample()
+            time.sleep(self.interval)
+
+    def updates(self, heartbeat=PROGRESS_STREAM_HEARTBEAT):
+        """Yield (True, snapshot) for every new sample, (False, snapshot) after heartbeat quiet seconds."""
+        with self._condition:
+            self._subscribers += 1
+            if self._sampler is None:
+                self._sampler = Thread(target=self._run_sampler, name="progress-feed", daemon=True)
+                self._sampler.start()
+            if self._stale():
+                self._sample()
+        last = 0
+        try:
+            while True:
+                with self._condition:
+                    if self._sequence == last:
+                        self._condition.wait(heartbeat)
+                    changed = self._sequence != last
+                    last = self._sequence
+                    snapshot = self._snapshot
+                yield changed, snapshot
+        finally:
+            with self._condition:
+                self._subscribers -= 1
@@ -0,0 +1,138 @@
+import ebooklib
+from ebooklib import epub
+from bs4 import BeautifulSoup
+import hashlib
+import os
+import time
+from threading import Lock
+from src.core.epub_chapters import read_chapter
+
+RENDER_CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", "/app/data/render_cache")
+RENDER_CACHE_MAX_BYTES = int(os.environ.get("RENDER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Render the EPUB into the cache while indexing, not only on first view
+RENDER_CACHE_WARM = os.environ.get("RENDER_CACHE_WARM", "false").lower() in ('1', 'true', 'yes')
+# Bump when the rendering below changes so stale cache files are ignored
+RENDER_VERSION = 1
+
+# Basic formatting tags kept when converting EPUB documents to HTML
+ALLOWED_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'br', 'div', 'span', 'strong', 'em', 'b', 'i', 'ul', 'ol', 'li']
+
+_cache_bytes = None
+_cache_lock = Lock()
+
+def sanitize_html(content):
+    """Strip a document down to ALLOWED_TAGS, keeping the text of everything else."""
+    soup = BeautifulSoup(content, 'html.parser')
+    for tag in soup.find_all():
+        if tag.name not in ALLOWED_TAGS:
+            tag.unwrap()
+    return str(soup)
+
+def render_epub_html(full_path):
+    """Convert every document of an EPUB to simplified HTML, separated by <hr>."""
+    book = epub.read_epub(full_path)
+    html_content = []
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_DOCUMENT:
+            content = item.get_content()
+            if content:
+                html_content.append(sanitize_html(content))
+    return '<hr>'.join(html_content)
+
+def render_chapter_html(full_path, chapter, stat=None):
+    """Simplified HTML of a single spine item, read without loading the rest of the book."""
+    return sanitize_html(read_chapter(full_path, chapter, stat))
+
+def cache_key(full_path, stat, variant=''):
+    """Identify a rendering of a file as it is now; any change to the file changes the key."""
+    raw = f"{RENDER_VERSION}|{full_path}|{stat.st_mtime_ns}|{stat.st_size}|{variant}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _cache_path(key):
+    return os.path.join(RENDER_CACHE_DIR, key[:2], key + '.html')
+
+def _current_cache_bytes():
+    """Total size of the cache directory, measured once and then tracked on writes."""
+    global _cache_bytes
+    if _cache_bytes is None:
+        _cache_bytes = sum(size for _, size, _ in _cache_files())
+    return _cache_bytes
+
+def _cache_files():
+    """(path, size, last_used) for every cached rendering."""
+    files = []
+    if not os.path.isdir(RENDER_CACHE_DIR):
+        return files
+    for shard in os.scandir(RENDER_CACHE_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.endswith('.html'):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+    return files
+
+def _evict(incoming_bytes):
+    """Delete least recently used renderings until incoming_bytes fit in the budget."""
+    global _cache_bytes
+    if _current_cache_bytes() + incoming_bytes <= RENDER_CACHE_MAX_BYTES:
+        return
+    # Re-measure: other processes share the directory
+    files = sorted(_cache_files(), key=lambda f: f[2])
+    _cache_bytes = sum(size for _, size, _ in files)
+    for path, size, _ in files:
+        if _cache_bytes + incoming_bytes <= RENDER_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            _cache_bytes -= size
+        except OSError:
+            pass
+
+def get_cached(key):
+    """Return the cached rendering for key, or None. A hit marks the file as recently used."""
+    path = _cache_path(key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return html
+
+def store(key, html):
+    global _cache_bytes
+    data = html.encode('utf-8')
+    if len(data) > RENDER_CACHE_MAX_BYTES:
+        return
+    path = _cache_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _cache_lock:
+            _evict(len(data))
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # Readers never see a half-written file
+            os.replace(tmp_path, path)
+            _cache_bytes = _current_cache_bytes() + len(data)
+    except OSError as e:
+        print(f"Could not write render cache entry {path}: {e}")
+
+def get_rendered_html(full_path, stat=None, chapter=None):
+    """Return (html, key) for an EPUB, or one chapter of it, rendering and caching it on a miss."""
+    stat = stat or os.stat(full_path)
+    key = cache_key(full_path, stat, '' if chapter is None else f'chapter-{chapter}')
+    html = get_cached(key)
+    if html is None:
+        started = time.time()
+        if chapter is None:
+            html = render_epub_html(full_path)
+        else:
+            html = render_chapter_html(full_path, chapter, stat)
+        print(f"Rendered {full_path} to HTML in {time.time() - started:.2f}s")
+        store(key, html)
+    return html, key
@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from collections import namedtuple
+from threading import Lock
+
+SUPPORTED_EXTENSIONS = ('.epub', '.pdf', '.txt')
+
+# How long /files may serve a manifest before scanning the share again
+MANIFEST_MAX_AGE = int(os.environ.get("MANIFEST_MAX_AGE", 300))
+# Where the scanning process (the indexer) publishes every manifest for web
+# workers to read instead of walking the share; empty disables it
+MANIFEST_FILE = os.environ.get("MANIFEST_FILE", "")
+
+LibraryFile = namedtuple('LibraryFile', ['path', 'size', 'mtime'])
+
+# Result of the last complete scan, shared by the indexer and /files
+library_manifest = {
+    'directory': None,
+    'files': [],
+    'scanned_at': None
+}
+manifest_lock = Lock()
+# (inode, mtime) of the MANIFEST_FILE version last loaded here
+_loaded_manifest_file = None
+_manifest_file_lock = Lock()
+
+def scan_directory(directory, extensions=SUPPORTED_EXTENSIONS, errors=None):
+    """Yield a LibraryFile for every supported file under directory as soon as it is found.
+
+    Uses os.scandir so the directory listing and the file type come from a
+    single call per directory; only matching files cost an extra stat.
+    An unreadable directory raises OSError; unreadable entries below it are
+    skipped and, if errors is a list, reported there so callers know the
+    scan missed part of the library.
+    """
+    pending_dirs = [directory]
+    while pending_dirs:
+        current = pending_dirs.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                        elif entry.name.endswith(extensions) and entry.is_file():
+                            stat = entry.stat()
+                            yield LibraryFile(entry.path, stat.st_size, stat.st_mtime)
+                    except OSError as e:
+                        message = f"Skipping unreadable entry {entry.path}: {e}"
+                        print(message)
+                        if errors is not None:
+                            errors.append(message)
+        except OSError as e:
+            if current == directory:
+                # Unmounted or unreachable: there is no library to report on
+                raise
+            message = f"Skipping unreadable directory {current}: {e}"
+            print(message)
+            if errors is not None:
+                errors.append(message)
+
+def scan_library(directory, errors=None):
+    """Stream a scan of directory and publish it as the library manifest once complete.
+
+    Parts of the library that couldn't be read are reported in errors, as by scan_directory.
+    """
+    files = []
+    for library_file in scan_directory(directory, errors=errors):
+        files.append(library_file)
+        yield library_file
+
+    with manifest_lock:
+        library_manifest['directory'] = directory
+        library_manifest['files'] = files
+        library_manifest['scanned_at'] = time.time()
+    _write_manifest_file()
+
+def _write_manifest_file():
+    if not MANIFEST_FILE:
+        return
+    with manifest_lock:
+        manifest = {
+            'directory': library_manifest['directory'],
+            'scanned_at': library_manifest['scanned_at'],
+            'files': [list(library_file) for library_file in library_manifest['files']]
+        }
+    with _manifest_file_lock:
+        try:
+            os.makedirs(os.path.dirname(MANIFEST_FILE), exist_ok=True)
+            tmp_path = f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, MANIFEST_FILE)
+        except OSError as e:
+            print(f"Could not publish the library manifest to {MANIFEST_FILE}: {e}")
+
+def _load_manifest_file():
+    """Adopt the manifest in MANIFEST_FILE if it changed since it was last loaded."""
+    global _loaded_manifest_file
+    with _manifest_file_lock:
+        try:
+            stat = os.stat(MANIFEST_FILE)
+            version = (stat.st_ino, stat.st_mtime_ns)
+            if version == _loaded_manifest_file:
+                return
+            with open(MANIFEST_FILE, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            # Not published yet, keep what we have
+            return
+        _loaded_manifest_file = version
+    with manifest_lock:
+        library_manifest['directory'] = manifest['directory']
+        library_manifest['files'] = [LibraryFile(*library_file) for library_file in manifest['files']]
+        library_manifest['scanned_at'] = manifest['scanned_at']
+
+def get_manifest(directory, max_age=MANIFEST_MAX_AGE, published_only=False):
+    """Return the files of the last complete scan of directory, rescanning if it's missing or stale.
+
+    With published_only, and MANIFEST_FILE set, the share is never scanned
+    here: the manifest last published by the indexer's scans and watcher
+    is returned however old it is, or no files before the first one.
+    """
+    if published_only and MANIFEST_FILE:
+        _load_manifest_file()
+        with manifest_lock:
+            return library_manifest['files'] if library_manifest['directory'] == directory else []
+
+    with manifest_lock:
+        if (library_manifest['directory'] == directory and library_manifest['scanned_at'] is not None
+                and time.time() - library_manifest['scanned_at'] < max_age):
+            return library_manifest['files']
+
+    for _ in scan_library(directory):
+        pass
+    with manifest_lock:
+        return library_manifest['files']
+
+def stat_library_files(paths, extensions=SUPPORTED_EXTENSIONS):
+    """Yield a LibraryFile for each of paths that is a supported file that still exists."""
+    for path in paths:
+        if not path.endswith(extensions):
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        yield LibraryFile(path, stat.st_size, stat.st_mtime)
+
+def update_manifest(directory, paths):
+    """Re-stat paths and publish a manifest with them added, updated or removed.
+
+    Lets a watcher keep the manifest current without rescanning the share.
+    Does nothing until a full scan of directory has been published.
+    """
+    paths = set(paths)
+    current = {library_file.path: library_file for library_file in stat_library_files(paths)}
+    with manifest_lock:
+        if library_manifest['directory'] != directory:
+            return
+        files = [library_file for library_file in library_manifest['files'] if library_file.path not in paths]
+        files.extend(current.values())
+        library_manifest['files'] = files
+    _write_manifest_file()
@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+SEARCH_CACHE_MAX_BYTES = int(os.environ.get("SEARCH_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 300))
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a query, for use in cache keys."""
+    return ' '.join(query.casefold().split())
+
+class SearchCache:
+    """LRU cache of search payloads bounded by total JSON size, with a TTL.
+
+    Every entry belongs to an index generation; the first lookup made with
+    a newer generation drops everything cached for the old one.
+    """
+
+    def __init__(self, max_bytes=SEARCH_CACHE_MAX_BYTES, ttl=SEARCH_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = None
+        self._lock = Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    def _sync_generation(self, generation):
+        if generation != self._generation:
+            if self._entries:
+                self.stats['invalidations'] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, generation):
+        with self._lock:
+            self._sync_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            payload, _, expires_at = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return payload
+
+    def put(self, key, payload, generation):
+        size = len(json.dumps(payload))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._sync_generation(generation)
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats['evictions'] += 1
+            self._entries[key] = (payload, size, time.time() + self.ttl)
+            self._bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+            stats['generation'] = self._generation
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0
+        return stats
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import mmap
+import os
+import zlib
+
+# Extracted text lives here, keyed by content hash, so the web tier and
+# re-indexing never have to re-parse the source files
+TEXT_STORE_DIR = os.environ.get("TEXT_STORE_DIR", "/app/data/text_store")
+# Characters per independently compressed block; a range read only inflates the blocks it covers
+TEXT_STORE_BLOCK_CHARS = int(os.environ.get("TEXT_STORE_BLOCK_CHARS", 64 * 1024))
+# Bump when the layout below changes so old entries are ignored
+STORE_VERSION = 1
+
+def _entry_paths(content_hash):
+    """(blocks file, metadata file) for a content hash."""
+    base = os.path.join(TEXT_STORE_DIR, content_hash[:2], content_hash)
+    return base + '.bin', base + '.json'
+
+def _alias_path(file_path):
+    name = hashlib.sha1(file_path.encode('utf-8')).hexdigest()
+    return os.path.join(TEXT_STORE_DIR, 'paths', name[:2], name + '.json')
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def put(content_hash, text, sections, file_path=None, stat=None):
+    """Store the text of a file and its sections (passage dicts without content).
+
+    The text is compressed in TEXT_STORE_BLOCK_CHARS blocks. The metadata
+    file is written last, so an entry only becomes visible once complete.
+    With file_path and stat the path is also linked to content_hash. Lone
+    surrogates, which broken PDFs and text files can decode to, are stored
+    as they are so offsets into the text stay valid.
+    """
+    blocks = []
+    offset = 0
+    compressed = []
+    for start in range(0, len(text), TEXT_STORE_BLOCK_CHARS):
+        data = zlib.compress(text[start:start + TEXT_STORE_BLOCK_CHARS].encode('utf-8', 'surrogatepass'), 6)
+        blocks.append([offset, len(data)])
+        compressed.append(data)
+        offset += len(data)
+    blocks_path, meta_path = _entry_paths(content_hash)
+    _write_atomic(blocks_path, b''.join(compressed))
+    meta = {
+        'version': STORE_VERSION,
+        'length': len(text),
+        'block_chars': TEXT_STORE_BLOCK_CHARS,
+        'blocks': blocks,
+        'sections': sections
+    }
+    _write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+    if file_path is not None and stat is not None:
+        link(file_path, stat, content_hash)
+
+def link(file_path, stat, content_hash):
+    """Remember that file_path, at this size and mtime, has content_hash."""
+    alias = {'content_hash': content_hash, 'file_size': stat.st_size, 'file_mtime_ns': stat.st_mtime_ns}
+    _write_atomic(_alias_path(file_path), json.dumps(alias).encode('utf-8'))
+
+def lookup(file_path, stat=None):
+    """Content hash stored for file_path, None if unknown or the file changed since.
+
+    Only stats the file, so it's cheap even on a network share.
+    """
+    alias = _read_json(_alias_path(file_path))
+    if alias is None:
+        return None
+    stat = stat or os.stat(file_path)
+    if alias.get('file_size') != stat.st_size or alias.get('file_mtime_ns') != stat.st_mtime_ns:
+        return None
+    return alias.get('content_hash')
+
+def get_meta(content_hash):
+    """Length, block table and sections of a stored text, None if not stored."""
+    meta = _read_json(_entry_paths(content_hash)[1])
+    if meta is None or meta.get('version') != STORE_VERSION:
+        return None
+    return meta
+
+def read_text(content_hash, start=0, end=None, meta=None):
+    """Characters start:end of a stored text, None if not stored."""
+    meta = meta or get_meta(content_hash)
+    if meta is None:
+        return None
+    end = meta['length'] if end is None else min(end, meta['length'])
+    if start >= end:
+        return ''
+    block_chars = meta['block_chars']
+    first, last = start // block_chars, (end - 1) // block_chars
+    try:
+        with open(_entry_paths(content_hash)[0], 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as blocks:
+            parts = []
+            for offset, size in meta['blocks'][first:last + 1]:
+                parts.append(zlib.decompress(blocks[offset:offset + size]).decode('utf-8', 'surrogatepass'))
+    except (OSError, ValueError, zlib.error):
+        return None
+    text = ''.join(parts)
+    return text[start - first * block_chars:end - first * block_chars]
+
+def load(content_hash):
+    """(text, sections) for a content hash, None if not stored."""
+    meta = get_meta(content_hash)
+    if meta is None:
+        return None
+    text = read_text(content_hash, meta=meta)
+    if text is None:
+        return None
+    return text, meta['sections']
+
+def text_for_file(file_path):
+    """Stored text of the file as it is now, None if it hasn't been indexed since it changed."""
+    content_hash = lookup(file_path)
+    return read_text(content_hash) if content_hash else None
+
+def prune(live_hashes):
+    """Delete stored texts and path links whose content hash isn't in live_hashes."""
+    removed = 0
+    if not os.path.isdir(TEXT_STORE_DIR):
+        return removed
+    for shard in os.scandir(TEXT_STORE_DIR):
+        if not shard.is_dir():
+            continue
+        if shard.name == 'paths':
+            for alias_shard in os.scandir(shard.path):
+                for entry in os.scandir(alias_shard.path):
+                    alias = _read_json(entry.path)
+                    if alias is None or alias.get('content_hash') not in live_hashes:
+                        os.remove(entry.path)
+            continue
+        for entry in os.scandir(shard.path):
+            content_hash = entry.name.split('.', 1)[0]
+            if content_hash not in live_hashes:
+                os.remove(entry.path)
+                removed += entry.name.endswith('.json')
+    return removed
@@ -0,0 +1,205 @@
+import os
+import time
+from threading import Condition, Lock, Thread
+from src.core.index import IndexingCancelled, index_files, watch_errors
+from src.core.scanner import SUPPORTED_EXTENSIONS, get_manifest, scan_library, update_manifest
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# "poll" stats the library every WATCH_POLL_INTERVAL seconds and works on SMB
+# mounts; "inotify" needs the optional inotify_simple package and only sees
+# changes made through this machine's kernel; "off" disables the watcher
+WATCH_MODE = os.environ.get("WATCH_MODE", "poll").lower()
+WATCH_POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", 60))
+# A file is indexed once it has had no new events for this many seconds,
+# so books still being copied aren't picked up half-written
+WATCH_DEBOUNCE = float(os.environ.get("WATCH_DEBOUNCE", 10))
+WATCH_BATCH_SIZE = int(os.environ.get("WATCH_BATCH_SIZE", 100))
+
+watch_status = {
+    'mode': None,
+    'running': False,
+    'queued': 0,
+    'last_event': None,
+    'last_batch': None,
+    'indexed_batches': 0,
+    'last_error': None
+}
+watch_lock = Lock()
+_watcher = None
+
+class DebouncedQueue:
+    """Paths waiting to be indexed, each released once it has been quiet for delay seconds."""
+
+    def __init__(self, delay=WATCH_DEBOUNCE):
+        self.delay = delay
+        self._due = {}
+        self._condition = Condition()
+
+    def put(self, path):
+        with self._condition:
+            # Another event pushes the path back
+            self._due[path] = time.time() + self.delay
+            self._condition.notify()
+
+    def take(self, max_items=WATCH_BATCH_SIZE, timeout=None):
+        """Wait for paths that have settled and return up to max_items of them ([] on timeout)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while True:
+                now = time.time()
+                ready = [path for path, due in self._due.items() if due <= now][:max_items]
+                if ready:
+                    for path in ready:
+                        del self._due[path]
+                    return ready
+                waits = [min(self._due.values()) - now] if self._due else []
+                if deadline is not None:
+                    if now >= deadline:
+                        return []
+                    waits.append(deadline - now)
+                self._condition.wait(min(waits) if waits else None)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._due)
+
+def _snapshot(library_files):
+    return {library_file.path: (library_file.size, library_file.mtime) for library_file in library_files}
+
+def diff_snapshots(previous, current):
+    """Paths added, modified or removed between two {path: (size, mtime)} snapshots."""
+    changed = [path for path, signature in current.items() if previous.get(path) != signature]
+    changed.extend(path for path in previous if path not in current)
+    return changed
+
+class LibraryWatcher:
+    """Notice new, changed and deleted books and index just those, in the background."""
+
+    def __init__(self, directory, mode=WATCH_MODE, poll_interval=WATCH_POLL_INTERVAL, debounce=WATCH_DEBOUNCE):
+        if mode == 'inotify' and INotify is None:
+            print("inotify_simple is not installed, watching the library by polling instead")
+            mode = 'poll'
+        self.directory = directory
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.queue = DebouncedQueue(debounce)
+
+    def start(self):
+        with watch_lock:
+            watch_status['mode'] = self.mode
+            watch_status['running'] = True
+        detect = self._poll_loop if self.mode == 'poll' else self._inotify_loop
+        Thread(target=detect, name="library-watcher", daemon=True).start()
+        Thread(target=self._index_loop, name="library-watcher-indexer", daemon=True).start()
+
+    def _queue(self, paths):
+        for path in paths:
+            self.queue.put(path)
+        if paths:
+            with watch_lock:
+                watch_status['last_event'] = time.time()
+                watch_status['queued'] = len(self.queue)
+
+    def _poll_loop(self):
+        # Changes are relative to the last published scan, whoever made it
+        previous = _snapshot(get_manifest(self.directory))
+        while True:
+            time.sleep(self.poll_interval)
+            scan_errors = []
+            try:
+                current = _snapshot(scan_library(self.directory, scan_errors))
+            except Exception as e:
+                self._record_error(f"Polling {self.directory} failed: {e}")
+                continue
+            if scan_errors:
+                # Books in the parts it couldn't read would look deleted
+                self._record_error(f"Polling {self.directory} missed part of the library: {scan_errors[0]}")
+                continue
+            self._queue(diff_snapshots(previous, current))
+            previous = current
+
+    def _inotify_loop(self):
+        inotify = INotify()
+        watch_flags = flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE | flags.CREATE
+        directories = {}
+
+        def add_tree(root):
+            for current, _, _ in os.walk(root):
+                try:
+                    directories[inotify.add_watch(current, watch_flags)] = current
+                except OSError as e:
+                    print(f"Cannot watch {current}: {e}")
+
+        add_tree(self.directory)
+        while True:
+            changed = []
+            for event in inotify.read():
+                parent = directories.get(event.wd)
+                if parent is None or not event.name:
+                    continue
+                path = os.path.join(parent, event.name)
+                if event.mask & flags.ISDIR:
+                    if event.mask & (flags.CREATE | flags.MOVED_TO):
+                        add_tree(path)
+                        # Files moved in with the directory raise no events of their own
+                        for current, _, files in os.walk(path):
+                            changed.extend(os.path.join(current, name) for name in files)
+                    else:
+                        # Neither do the books of a directory moved away
+                        prefix = path + os.sep
+                        changed.extend(library_file.path for library_file in get_manifest(self.directory)
+                                       if library_file.path.startswith(prefix))
+                elif path.endswith(SUPPORTED_EXTENSIONS):
+                    changed.append(path)
+            self._queue(changed)
+
+    def _index_loop(self):
+        while True:
+            self.index_batch(self.queue.take(WATCH_BATCH_SIZE))
+
+    def index_batch(self, batch):
+        """Index one batch of changed paths; on failure they go back on the queue."""
+        with watch_lock:
+            watch_status['queued'] = len(self.queue)
+        try:
+            print(f"Watcher indexing {len(batch)} changed files")
+            index_files(self.directory, paths=batch)
+            if self.mode != 'poll':
+                # Polling publishes full scans; inotify has to patch the manifest
+                update_manifest(self.directory, batch)
+            with watch_lock:
+                watch_status['last_batch'] = time.time()
+                watch_status['indexed_batches'] += 1
+        except (Exception, IndexingCancelled) as e:
+            self._record_error(f"Indexing changed files failed: {e}")
+            # Try the batch again later rather than dropping it
+            time.sleep(self.poll_interval)
+            self._queue(batch)
+
+    def _record_error(self, message):
+        print(message)
+        with watch_lock:
+            watch_status['last_error'] = message
+
+def get_watch_status():
+    with watch_lock:
+        status = watch_status.copy()
+    # Per-file errors of the batches; full runs report theirs through get_errors()
+    status['errors'] = watch_errors.summary()
+    return status
+
+def start_watcher(directory, mode=WATCH_MODE):
+    """Start watching directory unless mode is "off". Safe to call more than once."""
+    global _watcher
+    if mode == 'off':
+        return None
+    with watch_lock:
+        if _watcher is not None:
+            return _watcher
+        _watcher = LibraryWatcher(directory, mode)
+    _watcher.start()
+    return _watcher
@@ -0,0 +1,192 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows; workers then run without a memory limit
+    resource = None
+
+class WorkerTimeout(Exception):
+    """A task ran past its time limit and its worker was killed."""
+
+class WorkerCrashed(Exception):
+    """A worker died, or ran out of memory, while running a task."""
+
+def _worker_main(conn, initializer, initargs, memory_limit_mb):
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        fn, args = task
+        try:
+            result = (True, fn(*args))
+        except MemoryError:
+            # The heap may be in any state, let the pool start a fresh process
+            conn.send((False, WorkerCrashed("Out of memory")))
+            return
+        except BaseException as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # Unpicklable result or exception
+            conn.send((False, WorkerCrashed(f"Could not send the result back: {e}")))
+
+class _Worker:
+    def __init__(self, mp_context, initializer, initargs, memory_limit_mb):
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(target=_worker_main, daemon=True,
+                                          args=(child_conn, initializer, initargs, memory_limit_mb))
+        self.process.start()
+        child_conn.close()
+        self.future = None
+        self.deadline = None
+        self.paused_at_start = 0.0
+        self.tasks_done = 0
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+class WorkerPool:
+    """Process pool that can kill and replace a single worker.
+
+    Unlike ProcessPoolExecutor, a task that runs past timeout seconds or
+    takes its process down only fails its own future (with WorkerTimeout
+    or WorkerCrashed); the other workers carry on. Each worker gets an
+    address space limit of memory_limit_mb and is replaced after
+    max_tasks tasks so leaks don't build up. paused_seconds is a callable
+    returning how many seconds the job has been paused in total so far;
+    pauses move the deadlines of running tasks back, even when nobody was
+    waiting on the pool during them.
+    """
+
+    def __init__(self, workers, mp_context, initializer=None, initargs=(), timeout=None,
+                 memory_limit_mb=0, max_tasks=None, paused_seconds=None):
+        self.workers = workers
+        self.mp_context = mp_context
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks = max_tasks
+        self.paused_seconds = paused_seconds
+        self._queue = deque()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._queue.append((future, fn, args))
+        self._dispatch()
+        return future
+
+    def _dispatch(self):
+        for worker in self._workers:
+            if not self._queue:
+                return
+            if worker.future is None:
+                self._start_task(worker)
+        while self._queue and len(self._workers) < self.workers:
+            worker = _Worker(self.mp_context, self.initializer, self.initargs, self.memory_limit_mb)
+            self._workers.append(worker)
+            self._start_task(worker)
+
+    def _start_task(self, worker):
+        future, fn, args = self._queue.popleft()
+        worker.future = future
+        worker.deadline = time.monotonic() + self.timeout if self.timeout else None
+        worker.paused_at_start = self.paused_seconds() if self.paused_seconds is not None else 0.0
+        worker.conn.send((fn, args))
+
+    def _retire(self, worker, kill=False):
+        self._workers.remove(worker)
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+
+    def _deadline(self, worker, paused):
+        # Time spent paused since the task started doesn't count against it
+        return worker.deadline + paused - worker.paused_at_start
+
+    def wait(self, poll_interval=0.5):
+        """Block until at least one submitted task finishes and return the finished futures."""
+        while True:
+            busy = [worker for worker in self._workers if worker.future is not None]
+            if not busy:
+                return []
+            now = time.monotonic()
+            paused = self.paused_seconds() if self.paused_seconds is not None else 0.0
+            deadlines = [self._deadline(worker, paused) for worker in busy if worker.deadline is not None]
+            timeout = max(0, min(deadlines) - now) if deadlines else None
+            if self.paused_seconds is not None:
+                # A pause starting now would move the deadlines
+                timeout = poll_interval if timeout is None else min(timeout, poll_interval)
+            handles = [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy]
+            ready = set(wait(handles, timeout))
+
+            finished = []
+            now = time.monotonic()
+            paused = self.paused_seconds() if self.paused_seconds is not None else 0.0
+            for worker in busy:
+                future = worker.future
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    try:
+                        ok, value = worker.conn.recv()
+                    except (EOFError, OSError):
+                        ok, value = False, WorkerCrashed(f"Worker exited with code {worker.process.exitcode}")
+                    worker.future = None
+                    worker.tasks_done += 1
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                    if isinstance(value, WorkerCrashed) or not worker.process.is_alive():
+                        self._retire(worker, kill=True)
+                    elif self.max_tasks and worker.tasks_done >= self.max_tasks:
+                        self._retire(worker)
+                    finished.append(future)
+                elif worker.deadline is not None and now >= self._deadline(worker, paused):
+                    self._retire(worker, kill=True)
+                    future.set_exception(WorkerTimeout(f"Gave up after {self.timeout:g}s"))
+                    finished.append(future)
+            self._dispatch()
+            if finished:
+                return finished
+
+    def shutdown(self):
+        """Stop idle workers and kill busy ones; queued tasks are dropped."""
+        self._queue.clear()
+        for worker in list(self._workers):
+            self._retire(worker, kill=worker.future is not None)
+            if worker.future is not None:
+                worker.future.cancel()
@@ -3,7 +3,9 @@ import json
 import os
 import tempfile
 import shutil
-from app import app
+from app import app, search_cache
+from src.core.catalog import LibraryCatalog
+from src.core.scanner import LibraryFile
 from unittest.mock import patch, MagicMock
 
 class BookSearchAPITest(unittest.TestCase):
@@ -24,10 +26,10 @@ class BookSearchAPITest(unittest.TestCase):
         shutil.rmtree(self.test_books_dir)
     
     @patch('app.es')
-    @patch('app.index_files')
-    def test_index_books_api(self, mock_index_files, mock_es):
-        # Mock the index_files function
-        mock_index_files.return_value = None
+    @patch('app.start_indexing')
+    def test_index_books_api(self, mock_start_indexing, mock_es):
+        # Mock the start_indexing function
+        mock_start_indexing.return_value = True
         
         # Test the API endpoint
         response = self.client.get('/index_books', headers={'Accept': 'application/json'})
@@ -38,22 +40,28 @@ class BookSearchAPITest(unittest.TestCase):
         # Check if the response contains the expected message
         data = json.loads(response.data)
         self.assertIn('message', data)
-        self.assertEqual(data['message'], 'Indexing completed')
+        self.assertEqual(data['message'], 'Indexing started in background')
         
-        # Check if the index_files function was called
-        mock_index_files.assert_called_once_with('/books')
+        # Check if the indexing run was started in the background
+        mock_start_indexing.assert_called_once_with('/books')
     
     @patch('app.es')
     def test_search_api(self, mock_es):
+        search_cache.clear()
         # Mock the Elasticsearch search method
         mock_search_result = {
+            'took': 2,
             'hits': {
+                'total': {'value': 1, 'relation': 'eq'},
                 'hits': [
                     {
+                        '_id': 'test_sample',
+                        '_score': 1.0,
                         '_source': {
                             'file_path': '/books/test_sample.txt',
                             'content': 'This is a test sample file for testing the book search API.'
-                        }
+                        },
+                        'highlight': {'content': ['This is a **test** sample file']}
                     }
                 ]
             }
@@ -68,20 +76,20 @@ class BookSearchAPITest(unittest.TestCase):
         
         # Check if the response contains the expected data
         data = json.loads(response.data)
-        self.assertEqual(len(data), 1)
-        self.assertEqual(data[0]['file_path'], '/books/test_sample.txt')
-        self.assertIn('snippet', data[0])
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['file_path'], 'test_sample.txt')
+        self.assertIn('snippet', data['results'][0])
         
         # Check if the Elasticsearch search method was called with the correct parameters
         mock_es.search.assert_called_once()
     
-    @patch('app.os.listdir')
-    @patch('app.os.path.isfile')
-    def test_list_files_api(self, mock_isfile, mock_listdir):
-        # Mock the os.listdir function
-        mock_listdir.return_value = ['test_sample.txt', 'another_file.txt']
-        # Mock the os.path.isfile function to always return True
-        mock_isfile.return_value = True
+    @patch('app.get_catalog')
+    def test_list_files_api(self, mock_get_catalog):
+        # Mock the catalog of the library scan
+        mock_get_catalog.return_value = LibraryCatalog('/books', [
+            LibraryFile('/books/test_sample.txt', 60, 2.0),
+            LibraryFile('/books/another_file.txt', 40, 1.0)
+        ])
         
         # Test the API endpoint
         response = self.client.get('/files', headers={'Accept': 'application/json'})
@@ -91,12 +99,13 @@ class BookSearchAPITest(unittest.TestCase):
         
         # Check if the response contains the expected data
         data = json.loads(response.data)
-        self.assertEqual(len(data), 2)
-        self.assertEqual(data[0]['name'], 'test_sample.txt')
-        self.assertEqual(data[1]['name'], 'another_file.txt')
+        self.assertEqual(len(data['files']), 2)
+        self.assertEqual(data['files'][0]['name'], 'another_file.txt')
+        self.assertEqual(data['files'][1]['name'], 'test_sample.txt')
+        self.assertEqual(data['total_size'], 100)
         
-        # Check if the os.listdir function was called with the correct parameters
-        mock_listdir.assert_called_once_with('/books')
+        # Check if the catalog was read for the books directory
+        mock_get_catalog.assert_called_once_with('/books', published_only=False)
     
     @patch('app.open')
     @patch('app.os.path.isfile')
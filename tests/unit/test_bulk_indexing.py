@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+from src.core import index
+
+
+def fake_streaming_bulk(statuses):
+    """Build a streaming_bulk stand-in that answers each pass with the next list of statuses"""
+    calls = []
+
+    def streaming_bulk(client, actions, **kwargs):
+        calls.append(kwargs)
+        pass_statuses = statuses[len(calls) - 1]
+        for action, status in zip(actions, pass_statuses):
+            yield 200 <= status < 300, {'index': {'_id': action['_source']['file_path'], 'status': status}}
+
+    return streaming_bulk, calls
+
+
+class TestBulkIndex(unittest.TestCase):
+    def actions(self, *paths):
+        return [(path, {'_index': index.INDEX_NAME, '_source': {'file_path': path}}) for path in paths]
+
+    @patch('src.core.index.time.sleep')
+    def test_rejected_documents_are_retried_in_smaller_batches(self, mock_sleep):
+        streaming_bulk, calls = fake_streaming_bulk([[201, 429, 201], [201]])
+        with patch('src.core.index.helpers.streaming_bulk', side_effect=streaming_bulk):
+            results = list(index.bulk_index(iter(self.actions('a', 'b', 'c')), chunk_size=8))
+
+        self.assertEqual([(path, ok) for path, ok, _ in results], [('a', True), ('c', True), ('b', True)])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1]['chunk_size'], 4)
+        mock_sleep.assert_called_once_with(index.BULK_INITIAL_BACKOFF)
+
+    @patch('src.core.index.time.sleep')
+    def test_rejections_are_retried_once_a_batch_builds_up(self, mock_sleep):
+        streaming_bulk, calls = fake_streaming_bulk([[429, 429, 201, 201], [201, 201]])
+        with patch('src.core.index.helpers.streaming_bulk', side_effect=streaming_bulk):
+            results = list(index.bulk_index(iter(self.actions('a', 'b', 'c', 'd')), chunk_size=2))
+
+        # a and b go through before c and d are even reported
+        self.assertEqual([(path, ok) for path, ok, _ in results],
+                         [('a', True), ('b', True), ('c', True), ('d', True)])
+        self.assertEqual(len(calls), 2)
+        mock_sleep.assert_called_once_with(index.BULK_INITIAL_BACKOFF)
+
+    @patch('src.core.index.time.sleep')
+    def test_large_rejections_are_retried_before_a_batch_builds_up(self, mock_sleep):
+        streaming_bulk, calls = fake_streaming_bulk([[429, 201], [201]])
+        actions = self.actions('big', 'small')
+        actions[0][1]['_source']['content'] = 'x' * index.BULK_MIN_CHUNK_BYTES
+        with patch('src.core.index.helpers.streaming_bulk', side_effect=streaming_bulk), \
+                patch('src.core.index.json.dumps', side_effect=AssertionError("serialized again")):
+            results = list(index.bulk_index(iter(actions), chunk_size=8,
+                                            max_chunk_bytes=index.BULK_MIN_CHUNK_BYTES))
+
+        # Its size alone fills a batch, so it's retried before small is reported
+        self.assertEqual([(path, ok) for path, ok, _ in results], [('big', True), ('small', True)])
+
+    @patch('src.core.index.time.sleep')
+    def test_failures_are_reported_per_document(self, mock_sleep):
+        streaming_bulk, calls = fake_streaming_bulk([[400, 201], [429], [429]])
+        with patch('src.core.index.helpers.streaming_bulk', side_effect=streaming_bulk):
+            results = list(index.bulk_index(iter(self.actions('bad', 'good')), max_retries=0))
+
+        self.assertEqual([(path, ok) for path, ok, _ in results], [('bad', False), ('good', True)])
+        self.assertEqual(results[0][2]['index']['status'], 400)
+        mock_sleep.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
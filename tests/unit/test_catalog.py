@@ -0,0 +1,67 @@
+import json
+import unittest
+from unittest.mock import patch
+from app import app
+from src.core import catalog
+from src.core.scanner import LibraryFile
+
+
+def library(*files):
+    return [LibraryFile(f'/books/{path}', size, mtime) for path, size, mtime in files]
+
+
+class LibraryCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.catalog = catalog.LibraryCatalog('/books', library(
+            ('Greek/Hecate - Smith.epub', 300, 3.0),
+            ('Greek/medea.pdf', 100, 1.0),
+            ('notes.txt', 200, 2.0),
+            ('Aradia - Leland.epub', 50, 4.0),
+        ))
+
+    def test_entries_and_totals(self):
+        self.assertEqual(self.catalog.total_files, 4)
+        self.assertEqual(self.catalog.total_size, 650)
+        entry = self.catalog.entries[0]
+        self.assertEqual((entry['name'], entry['title'], entry['path'], entry['type']),
+                         ('Hecate - Smith.epub', 'Hecate', 'Greek/Hecate - Smith.epub', 'epub'))
+
+    def test_sort_filter_and_page(self):
+        files, matched, matched_size = self.catalog.query('size', descending=True, offset=1, limit=2)
+        self.assertEqual([f['name'] for f in files], ['notes.txt', 'medea.pdf'])
+        self.assertEqual((matched, matched_size), (4, 650))
+
+        files, matched, matched_size = self.catalog.query('title', search='GREEK/')
+        self.assertEqual([f['name'] for f in files], ['Hecate - Smith.epub', 'medea.pdf'])
+        self.assertEqual((matched, matched_size), (2, 400))
+
+        files, matched, _ = self.catalog.query('mtime', file_type='epub')
+        self.assertEqual([f['name'] for f in files], ['Hecate - Smith.epub', 'Aradia - Leland.epub'])
+
+        with self.assertRaises(ValueError):
+            self.catalog.query('color')
+
+    def test_catalog_is_rebuilt_only_for_a_new_scan(self):
+        first = library(('a.txt', 1, 1.0))
+        with patch('src.core.catalog.get_manifest', return_value=first):
+            built = catalog.get_catalog('/books')
+            self.assertIs(catalog.get_catalog('/books'), built)
+        with patch('src.core.catalog.get_manifest', return_value=library(('b.txt', 1, 1.0))):
+            self.assertIsNot(catalog.get_catalog('/books'), built)
+
+    def test_files_api_pages_the_catalog(self):
+        app.config['TESTING'] = True
+        with patch('app.get_catalog', return_value=self.catalog):
+            response = app.test_client().get('/files', query_string={'sort': 'path', 'limit': 1, 'offset': 1},
+                                             headers={'Accept': 'application/json'})
+            invalid = app.test_client().get('/files', query_string={'limit': 0},
+                                            headers={'Accept': 'application/json'})
+
+        data = json.loads(response.data)
+        self.assertEqual([f['path'] for f in data['files']], ['Greek/Hecate - Smith.epub'])
+        self.assertEqual((data['total_files'], data['matched_files'], data['offset']), (4, 4, 1))
+        self.assertEqual(invalid.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 import os
-from src.core.index import extract_text_from_epub
+import shutil
+import tempfile
+from unittest.mock import patch
+from src.core.index import extract_text_from_epub, extract_files, file_content_hash, iter_epub_chunks, extract_passages
 
 class TestEPUBExtraction(unittest.TestCase):
     def setUp(self):
@@ -11,6 +14,12 @@ class TestEPUBExtraction(unittest.TestCase):
             if f.endswith('.epub')
         ]
         self.invalid_file = os.path.join(self.test_data_dir, 'nonexistent.epub')
+        # Pool workers are spawned, so they pick the text store location up from the environment
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir)
+        env_patcher = patch.dict(os.environ, {'TEXT_STORE_DIR': store_dir})
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
 
     def test_extract_text_from_all_epubs(self):
         """Test text extraction from all EPUB files in test_data"""
@@ -21,6 +30,25 @@ class TestEPUBExtraction(unittest.TestCase):
                 self.assertGreater(len(text), 0,
                                  f"Extracted text should not be empty for {epub_path}")
 
+    def test_chunks_add_up_to_full_text(self):
+        """The streaming extractor yields one chunk per item, framed the same way as the joined text"""
+        for epub_path in self.epub_files:
+            with self.subTest(epub_file=os.path.basename(epub_path)):
+                chunks = list(iter_epub_chunks(epub_path))
+                self.assertGreater(len(chunks), 0)
+                self.assertEqual(''.join(f"\n{chunk}\n" for chunk in chunks), extract_text_from_epub(epub_path))
+
+    def test_passage_offsets_point_into_full_text(self):
+        """Each passage's offsets select its content out of the whole-book text"""
+        for epub_path in self.epub_files:
+            with self.subTest(epub_file=os.path.basename(epub_path)):
+                text = extract_text_from_epub(epub_path)
+                passages = extract_passages(epub_path)
+                self.assertGreater(len(passages), 0)
+                for passage in passages:
+                    self.assertEqual(text[passage['start_offset']:passage['end_offset']], passage['content'])
+                self.assertTrue(any('chapter_index' in passage for passage in passages))
+
     def test_extract_text_from_invalid_file(self):
         # Test error handling for non-existent file
         text = extract_text_from_epub(self.invalid_file)
@@ -33,5 +61,25 @@ class TestEPUBExtraction(unittest.TestCase):
             text = extract_text_from_epub(temp_epub.name)
             self.assertEqual(text, '')
 
+    def test_parallel_extraction_matches_serial(self):
+        """Process pool extraction returns the same text as calling the extractor directly"""
+        futures = dict(extract_files(self.epub_files + [self.invalid_file], workers=2))
+
+        self.assertEqual(set(futures), set(self.epub_files + [self.invalid_file]))
+        for epub_path in self.epub_files:
+            text, errors, content_hash = futures[epub_path].result()
+            self.assertEqual(text, extract_text_from_epub(epub_path))
+            self.assertEqual(content_hash, file_content_hash(epub_path))
+        # A file that vanished between scan and extraction fails its own future only
+        with self.assertRaises(FileNotFoundError):
+            futures[self.invalid_file].result()
+
+    def test_unchanged_content_is_not_extracted(self):
+        """A file whose content hash is already known comes back without text"""
+        epub_path = self.epub_files[0]
+        known_hash = file_content_hash(epub_path)
+        [(file_path, future)] = list(extract_files([epub_path], workers=1, known_hashes={epub_path: known_hash}))
+        self.assertEqual(future.result(), (None, [], known_hash))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import json
+import unittest
+from unittest.mock import patch
+from app import app
+from src.core import index
+from src.core.error_log import ErrorLog
+
+
+class ErrorLogTest(unittest.TestCase):
+    def test_buffer_is_bounded_but_counts_everything(self):
+        log = ErrorLog(maxlen=3)
+        for number in range(5):
+            log.add(f"bad item {number}", f"/books/{number}.epub", 'strip', ValueError('oops'))
+        log.append("plain message")
+
+        self.assertEqual(len(log), 6)
+        self.assertEqual([record['id'] for record in log.records()], [4, 5, 6])
+        summary = log.summary(recent=2)
+        self.assertEqual((summary['total'], summary['dropped']), (6, 3))
+        self.assertEqual(summary['by_type'], {'ValueError': 5, 'other': 1})
+        self.assertEqual(summary['by_stage'], {'strip': 5, 'other': 1})
+        self.assertEqual([record['message'] for record in summary['recent']], ['bad item 4', 'plain message'])
+        self.assertEqual(log.records()[0]['file'], '/books/3.epub')
+
+    def test_paging_with_a_cursor(self):
+        log = ErrorLog(maxlen=3)
+        for number in range(4):
+            log.add(f"error {number}")
+
+        page, missed = log.page(after=0, limit=2)
+        self.assertEqual([record['id'] for record in page], [2, 3])
+        self.assertTrue(missed)
+        page, missed = log.page(after=3, limit=2)
+        self.assertEqual([record['id'] for record in page], [4])
+        self.assertFalse(missed)
+
+        # Ids go on after a new run clears the log, and an old cursor misses nothing
+        log.clear()
+        self.assertEqual(log.page(after=0), ([], False))
+        self.assertEqual(log.page(after=2), ([], False))
+        log.extend([{'message': 'from a worker', 'file': '/books/a.pdf', 'stage': 'parse', 'type': None, 'id': 1}])
+        self.assertEqual(log.records()[0]['id'], 5)
+        self.assertEqual(log.page(after=4), ([log.records()[0]], False))
+        self.assertEqual(log.page(after=0), ([log.records()[0]], False))
+
+    def test_errors_api(self):
+        log = ErrorLog(maxlen=10)
+        for number in range(3):
+            log.add(f"error {number}", stage='write', error_type='mapper_parsing_exception')
+        app.config['TESTING'] = True
+        with patch.object(index, 'index_errors', log):
+            client = app.test_client()
+            first = json.loads(client.get('/indexing_errors?limit=2').data)
+            second = json.loads(client.get(f"/indexing_errors?after={first['next']}").data)
+            invalid = client.get('/indexing_errors?limit=0')
+
+        self.assertEqual([record['message'] for record in first['errors']], ['error 0', 'error 1'])
+        self.assertEqual(first['by_type'], {'mapper_parsing_exception': 3})
+        self.assertEqual([record['message'] for record in second['errors']], ['error 2'])
+        self.assertEqual(second['next'], 3)
+        self.assertEqual(invalid.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import patch
+from src.core import es_client
+
+
+class TestLazyClient(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(es_client, '_client', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        health_patcher = patch.dict(es_client.es_health, {'status': 'unknown', 'checked_at': None,
+                                                          'last_ok': None, 'last_error': None})
+        health_patcher.start()
+        self.addCleanup(health_patcher.stop)
+
+    @patch('src.core.es_client.Elasticsearch')
+    def test_client_is_created_on_first_use_and_shared(self, mock_es_class):
+        mock_es_class.assert_not_called()
+
+        es_client.es.search(index='book_index')
+        es_client.es.indices.exists(index='book_index')
+
+        mock_es_class.assert_called_once()
+        self.assertIs(es_client.get_client(), mock_es_class.return_value)
+        mock_es_class.return_value.search.assert_called_once_with(index='book_index')
+
+    @patch('src.core.es_client.get_client')
+    def test_health_tracks_outages(self, mock_get_client):
+        self.assertTrue(es_client.is_available())
+
+        mock_get_client.return_value.ping.side_effect = ConnectionError("refused")
+        self.assertFalse(es_client.check_health())
+        self.assertFalse(es_client.is_available())
+        self.assertEqual(es_client.get_health()['last_error'], "refused")
+
+        mock_get_client.return_value.ping.side_effect = None
+        mock_get_client.return_value.ping.return_value = True
+        self.assertTrue(es_client.check_health())
+        self.assertTrue(es_client.is_available())
+        self.assertIsNotNone(es_client.get_health()['last_ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from app import app
+
+
+class FileStreamingTest(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.books_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.books_dir)
+        self.body = b'PK' + bytes(range(256)) * 40
+        with open(os.path.join(self.books_dir, 'book.epub'), 'wb') as f:
+            f.write(self.body)
+        with open(os.path.join(self.books_dir, 'notes.txt'), 'w', encoding='utf-8') as f:
+            f.write('Hecate at the crossroads\n' * 100)
+
+        # Point /books at the temporary directory
+        original_join = os.path.join
+        original_abspath = os.path.abspath
+
+        def books_join(path, *paths):
+            if path == '/books':
+                path = self.books_dir
+            return original_join(path, *paths)
+
+        def books_abspath(path):
+            if path == '/books':
+                return self.books_dir
+            return original_abspath(path)
+
+        for patcher in (patch('app.os.path.join', side_effect=books_join),
+                        patch('app.os.path.abspath', side_effect=books_abspath)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_epub_supports_ranges(self):
+        response = self.client.get('/epub/book.epub', headers={'Range': 'bytes=100-199'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.body[100:200])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(response.headers['Content-Type'], 'application/epub+zip')
+
+    def test_epub_answers_304_to_matching_etag(self):
+        first = self.client.get('/epub/book.epub')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data, self.body)
+        self.assertEqual(first.headers['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', first.headers['Content-Disposition'])
+
+        second = self.client.get('/epub/book.epub', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+    def test_plain_text_download_is_streamed(self):
+        response = self.client.get('/file/notes.txt', headers={'Accept': 'text/plain', 'Range': 'bytes=0-5'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'Hecate')
+        self.assertEqual(response.headers['Content-Type'], 'text/plain; charset=utf-8')
+
+    def test_text_window_is_decoded_in_chunks(self):
+        with open(os.path.join(self.books_dir, 'notes.txt'), 'w', encoding='utf-8') as f:
+            f.write('Żółć ' * 1000)
+
+        with patch('app.TEXT_STREAM_CHUNK_CHARS', 7):
+            response = self.client.get('/file/notes.txt?offset=3&length=20', headers={'Accept': 'text/plain'})
+            self.assertTrue(response.is_streamed)
+            text = response.get_data(as_text=True)
+            html = self.client.get('/file_html/notes.txt?offset=10&length=5',
+                                   headers={'Accept': 'text/html'}).get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(text, ('Żółć ' * 1000)[3:23])
+        self.assertIn('<pre>Żółć </pre>', html)
+        self.assertIn('href="?offset=5&amp;length=5"', html)
+
+    def test_invalid_window_is_rejected(self):
+        response = self.client.get('/file/notes.txt?offset=-1', headers={'Accept': 'text/plain'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sibling_directory_sharing_the_prefix_is_refused(self):
+        private_dir = self.books_dir + '_private'
+        os.mkdir(private_dir)
+        self.addCleanup(shutil.rmtree, private_dir)
+        with open(os.path.join(private_dir, 'secret.epub'), 'wb') as f:
+            f.write(b'PK secret')
+        sibling = f"%2e%2e/{os.path.basename(private_dir)}/secret.epub"
+
+        for route in ('/epub/', '/file/', '/file_html/', '/toc/'):
+            response = self.client.get(route + sibling)
+            self.assertEqual(response.status_code, 403, route)
+            self.assertNotIn(b'secret', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
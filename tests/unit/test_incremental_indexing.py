@@ -0,0 +1,393 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest.mock import patch, MagicMock
+from src.core import index
+
+
+class TestIncrementalIndexing(unittest.TestCase):
+    def setUp(self):
+        self.books_dir = tempfile.mkdtemp()
+        self.unchanged = self.write_book('unchanged.txt', 'Hecate at the crossroads')
+        self.touched = self.write_book('touched.txt', 'Same words, newer mtime')
+        self.changed = self.write_book('changed.txt', 'Brand new text')
+        self.added = self.write_book('added.txt', 'Never indexed before')
+
+        self.sent_actions = []
+        es_patcher = patch('src.core.index.es', MagicMock())
+        self.es = es_patcher.start()
+        self.addCleanup(es_patcher.stop)
+        # The alias points at an index from the current template
+        self.live = f"{index.INDEX_NAME}-v{index.INDEX_TEMPLATE_VERSION}-1"
+        self.es.indices.get_alias.return_value = {self.live: {'aliases': {index.INDEX_NAME: {}}}}
+        self.es.indices.get_mapping.return_value = {
+            self.live: {'mappings': {'_meta': {'template_version': index.INDEX_TEMPLATE_VERSION}}}}
+        self.es.indices.get.return_value = {self.live: {}}
+        bulk_patcher = patch('src.core.index.helpers.streaming_bulk', side_effect=self.streaming_bulk)
+        bulk_patcher.start()
+        self.addCleanup(bulk_patcher.stop)
+        # Keep the text store out of the way, in this process and in the spawned workers
+        store_dir = os.path.join(self.books_dir, '.text_store')
+        self.checkpoint = os.path.join(self.books_dir, '.checkpoint.jsonl')
+        for patcher in (patch.dict(os.environ, {'TEXT_STORE_DIR': store_dir}),
+                        patch.object(index.text_store, 'TEXT_STORE_DIR', store_dir),
+                        patch.object(index, 'INDEX_CHECKPOINT_FILE', self.checkpoint),
+                        patch.object(index, 'EXTRACT_QUARANTINE_FILE', os.path.join(self.books_dir, '.quarantine.json'))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.books_dir)
+
+    def write_book(self, name, text):
+        path = os.path.join(self.books_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def streaming_bulk(self, client, actions, **kwargs):
+        for action in actions:
+            self.sent_actions.append(action)
+            yield True, {action.get('_op_type', 'index'): {'_id': action['_id'], 'status': 200}}
+
+    def stored_hit(self, path, **overrides):
+        stat = os.stat(path)
+        source = {
+            'file_path': path,
+            'file_size': stat.st_size,
+            'file_mtime': stat.st_mtime,
+            'content_hash': index.file_content_hash(path),
+            'file_type': os.path.splitext(path)[1].lstrip('.')
+        }
+        source.update(overrides)
+        return {'_id': index.document_id(path), '_source': source}
+
+    def test_only_new_and_changed_files_are_reindexed(self):
+        gone = os.path.join(self.books_dir, 'deleted.txt')
+        stored = [
+            self.stored_hit(self.unchanged),
+            self.stored_hit(self.touched, file_mtime=1.0),
+            self.stored_hit(self.changed, file_mtime=1.0, content_hash='outdated'),
+            {'_id': index.document_id(gone), '_source': {'file_path': gone}},
+        ]
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            index.index_files(self.books_dir, workers=1)
+
+        sent = {action['_id']: action.get('_op_type', 'index') for action in self.sent_actions}
+        self.assertEqual(sent, {
+            index.document_id(self.touched): 'update',
+            index.document_id(self.changed): 'index',
+            index.document_id(self.added): 'index',
+            index.document_id(gone): 'delete',
+        })
+        self.assertEqual(index.indexing_progress['processed_files'], 4)
+        self.assertEqual(index.indexing_progress['skipped_files'], 2)
+        self.assertEqual(index.indexing_progress['deleted_documents'], 1)
+
+    def test_full_mode_reindexes_everything(self):
+        stored = [self.stored_hit(self.unchanged)]
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            index.index_files(self.books_dir, workers=1, incremental=False)
+
+        self.assertEqual(len(self.sent_actions), 4)
+        self.assertTrue(all(action.get('_op_type', 'index') == 'index' for action in self.sent_actions))
+
+    def test_passage_mode_replaces_passages_of_changed_books(self):
+        long_book = self.write_book('long.txt', 'x' * (2 * index.PASSAGE_TXT_CHARS + 10))
+        book_id = index.document_id(long_book)
+        stored = [self.stored_hit(long_book, file_mtime=1.0, content_hash='outdated',
+                                  book_id=book_id, granularity='passage')]
+        stored = [dict(stored[0], _id=f"{book_id}-{number}") for number in range(5)]
+        stored.append({'_id': 'legacy-random-id', '_source': {'file_path': long_book}})
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            index.index_files(self.books_dir, workers=1, granularity='passage')
+
+        sent = {action['_id']: action for action in self.sent_actions if action['_id'].startswith(book_id)
+                or action['_id'] == 'legacy-random-id'}
+        self.assertEqual({doc_id: action.get('_op_type', 'index') for doc_id, action in sent.items()}, {
+            f"{book_id}-0": 'index',
+            f"{book_id}-1": 'index',
+            f"{book_id}-2": 'index',
+            f"{book_id}-3": 'delete',
+            f"{book_id}-4": 'delete',
+            'legacy-random-id': 'delete',
+        })
+        last = sent[f"{book_id}-2"]['_source']
+        self.assertEqual((last['start_offset'], last['end_offset']), (2 * index.PASSAGE_TXT_CHARS, 2 * index.PASSAGE_TXT_CHARS + 10))
+        self.assertEqual(last['book_id'], book_id)
+        self.assertEqual(index.indexing_progress['processed_files'], 5)
+
+    def test_watched_paths_only_touch_their_own_documents(self):
+        gone = os.path.join(self.books_dir, 'deleted.txt')
+        stored = [
+            self.stored_hit(self.changed, file_mtime=1.0, content_hash='outdated'),
+            {'_id': index.document_id(gone), '_source': {'file_path': gone}},
+        ]
+        with patch('src.core.index.helpers.scan', return_value=stored) as mock_scan, \
+                patch('src.core.index.scan_library') as mock_scan_library, \
+                patch('src.core.index.text_store.prune') as mock_prune:
+            index.index_files(self.books_dir, workers=1, paths=[self.changed, gone])
+
+        query = mock_scan.call_args.kwargs['query']['query']
+        self.assertIn(index.document_id(gone), query['bool']['should'][0]['terms']['book_id'])
+        mock_scan_library.assert_not_called()
+        mock_prune.assert_not_called()
+        sent = {action['_id']: action.get('_op_type', 'index') for action in self.sent_actions}
+        self.assertEqual(sent, {
+            index.document_id(self.changed): 'index',
+            index.document_id(gone): 'delete',
+        })
+
+
+    def test_resumed_run_skips_files_the_interrupted_run_finished(self):
+        stat = os.stat(self.changed)
+        with open(self.checkpoint, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'directory': self.books_dir, 'granularity': 'book', 'incremental': True,
+                                'index': self.live}) + '\n')
+            f.write(json.dumps({'path': self.changed, 'size': stat.st_size, 'mtime': stat.st_mtime}) + '\n')
+        stored = [
+            self.stored_hit(self.unchanged),
+            self.stored_hit(self.changed, file_mtime=1.0, content_hash='outdated'),
+        ]
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            index.index_files(self.books_dir, workers=1, granularity='book')
+
+        sent = {action['_id'] for action in self.sent_actions}
+        self.assertEqual(sent, {index.document_id(self.touched), index.document_id(self.added)})
+        self.assertEqual(index.indexing_progress['resumed_files'], 1)
+        self.assertEqual(index.indexing_progress['processed_files'], 4)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_abort_stops_the_run_before_deletions(self):
+        gone = os.path.join(self.books_dir, 'deleted.txt')
+        stored = [{'_id': index.document_id(gone), '_source': {'file_path': gone}}]
+
+        def cancel_on_first_action(client, actions, **kwargs):
+            for action in actions:
+                self.sent_actions.append(action)
+                index.request_cancel()
+                yield True, {'index': {'_id': action['_id'], 'status': 200}}
+
+        with patch('src.core.index.helpers.scan', return_value=stored), \
+                patch('src.core.index.helpers.streaming_bulk', side_effect=cancel_on_first_action):
+            with self.assertRaises(index.IndexingCancelled):
+                index.index_files(self.books_dir, workers=1, granularity='book')
+
+        self.assertEqual(len(self.sent_actions), 1)
+        self.assertNotIn('delete', [action.get('_op_type') for action in self.sent_actions])
+        self.assertEqual(index.indexing_progress['deleted_documents'], 0)
+        # The finished file is recorded for the next run
+        with open(self.checkpoint, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertFalse(index.request_cancel())
+
+    def test_incomplete_or_empty_scans_delete_nothing(self):
+        shelf = os.path.join(self.books_dir, 'shelf')
+        os.makedirs(shelf)
+        shelved = self.write_book(os.path.join('shelf', 'shelved.txt'), 'On a share that dropped out')
+        stored = [self.stored_hit(shelved)]
+        scandir = os.scandir
+
+        def unreadable_shelf(path):
+            if path == shelf:
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        with patch('src.core.index.helpers.scan', return_value=stored), \
+                patch('src.core.scanner.os.scandir', side_effect=unreadable_shelf), \
+                patch.object(index.text_store, 'prune') as prune:
+            index.index_files(self.books_dir, workers=1)
+        self.assertNotIn('delete', [action.get('_op_type') for action in self.sent_actions])
+        prune.assert_not_called()
+        self.assertEqual(index.index_errors.summary()['by_type'].get('IncompleteScan'), 1)
+
+        # An empty library (an unmounted share) isn't taken as every book deleted either
+        empty_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, empty_dir)
+        self.sent_actions.clear()
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            index.index_files(empty_dir, workers=1)
+        self.assertEqual(self.sent_actions, [])
+
+        # Nor is a library that can't be opened at all
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            with self.assertRaises(OSError):
+                index.index_files(os.path.join(self.books_dir, 'missing'), workers=1)
+        self.assertEqual(self.sent_actions, [])
+
+    def test_second_start_is_refused_while_a_run_is_going(self):
+        release = threading.Event()
+        with patch.object(index, 'index_files', side_effect=lambda *args, **kwargs: release.wait(5)) as run:
+            self.assertTrue(index.start_indexing(self.books_dir))
+            self.assertFalse(index.start_indexing(self.books_dir))
+            release.set()
+            index._index_thread.join(5)
+            self.assertTrue(index.start_indexing(self.books_dir, incremental=False))
+            index._index_thread.join(5)
+        self.assertEqual(run.call_count, 2)
+        run.assert_called_with(self.books_dir, incremental=False)
+
+
+    def test_files_that_hang_extraction_are_quarantined(self):
+        extracted = []
+
+        def hang_on_changed(file_paths, workers, known_hashes, granularity):
+            for file_path in file_paths:
+                extracted.append(file_path)
+                future = Future()
+                if file_path == self.changed:
+                    future.set_exception(index.WorkerTimeout("Gave up after 600s"))
+                else:
+                    future.set_result(('text', [], 'hash'))
+                yield file_path, future
+
+        with patch('src.core.index.helpers.scan', return_value=[]), \
+                patch('src.core.index.extract_files', side_effect=hang_on_changed):
+            index.index_files(self.books_dir, workers=1)
+        self.assertEqual(set(index.load_quarantine()), {self.changed})
+        self.assertEqual(index.indexing_progress['quarantined_files'], 1)
+
+        # Later runs leave it alone until it changes, or a full run retries it
+        extracted.clear()
+        with patch('src.core.index.helpers.scan', return_value=[]), \
+                patch('src.core.index.extract_files', side_effect=hang_on_changed):
+            index.index_files(self.books_dir, workers=1)
+        self.assertEqual(len(extracted), 3)
+        self.assertNotIn(self.changed, extracted)
+        self.assertEqual(index.indexing_progress['quarantined_files'], 1)
+
+        self.sent_actions.clear()
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1, incremental=False)
+        self.assertIn(index.document_id(self.changed), {action['_id'] for action in self.sent_actions})
+        self.assertEqual(index.load_quarantine(), {})
+
+    def test_books_that_fail_extraction_keep_their_indexed_copy(self):
+        stored = [self.stored_hit(self.changed, file_mtime=1.0, content_hash='outdated'),
+                  self.stored_hit(self.touched, file_mtime=1.0, content_hash='outdated')]
+
+        def fail_on_stored(file_paths, workers, known_hashes, granularity):
+            for file_path in file_paths:
+                future = Future()
+                if file_path == self.changed:
+                    future.set_exception(index.WorkerTimeout("Gave up after 600s"))
+                elif file_path == self.touched:
+                    future.set_exception(ValueError("Broken archive"))
+                else:
+                    future.set_result(('text', [], 'hash'))
+                yield file_path, future
+
+        for _ in range(2):
+            # The second run skips the quarantined book instead of extracting it
+            with patch('src.core.index.helpers.scan', return_value=stored), \
+                    patch('src.core.index.extract_files', side_effect=fail_on_stored):
+                index.index_files(self.books_dir, workers=1)
+            self.assertNotIn('delete', [action.get('_op_type') for action in self.sent_actions])
+        self.assertEqual(index.indexing_progress['quarantined_files'], 1)
+
+    def test_incremental_run_writes_to_the_live_index(self):
+        refreshed = []
+        with patch('src.core.index.helpers.scan', return_value=[]), \
+                patch('src.core.index.bump_index_generation',
+                      side_effect=lambda: refreshed.append(self.es.indices.refresh.called)):
+            index.index_files(self.books_dir, workers=1)
+        # Searches cached under the new generation see the run's writes
+        self.es.indices.refresh.assert_called_once_with(index=self.live)
+        self.assertEqual(refreshed, [True])
+
+        self.assertEqual({action['_index'] for action in self.sent_actions}, {self.live})
+        self.es.indices.create.assert_not_called()
+        self.es.indices.update_aliases.assert_not_called()
+
+    def test_full_run_loads_a_new_index_and_swaps_it_in(self):
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1, incremental=False)
+
+        target = self.es.indices.create.call_args.kwargs['index']
+        self.assertTrue(target.startswith(f"{index.INDEX_NAME}-v{index.INDEX_TEMPLATE_VERSION}-"))
+        self.assertEqual({action['_index'] for action in self.sent_actions}, {target})
+        settings = [call.kwargs['settings']['index'] for call in self.es.indices.put_settings.call_args_list]
+        self.assertEqual(settings[0], {'refresh_interval': '-1', 'number_of_replicas': 0})
+        self.assertEqual(settings[-1], {'refresh_interval': index.INDEX_REFRESH_INTERVAL,
+                                        'number_of_replicas': index.INDEX_REPLICAS})
+        self.es.indices.update_aliases.assert_called_once_with(actions=[
+            {'remove': {'index': self.live, 'alias': index.INDEX_NAME}},
+            {'add': {'index': target, 'alias': index.INDEX_NAME}}])
+        self.es.indices.delete.assert_called_once_with(index=self.live)
+
+    def test_full_run_continues_an_unfinished_load_and_replaces_a_pre_alias_index(self):
+        unfinished = f"{index.INDEX_NAME}-v{index.INDEX_TEMPLATE_VERSION}-5"
+        outdated = f"{index.INDEX_NAME}-v1-3"
+        self.es.indices.get_alias.return_value = {index.INDEX_NAME: {'aliases': {}}}
+        self.es.indices.get.return_value = {unfinished: {}, outdated: {}}
+
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1, incremental=False)
+
+        self.es.indices.create.assert_not_called()
+        self.assertEqual({action['_index'] for action in self.sent_actions}, {unfinished})
+        self.es.indices.update_aliases.assert_called_once_with(actions=[
+            {'remove_index': {'index': index.INDEX_NAME}},
+            {'add': {'index': unfinished, 'alias': index.INDEX_NAME}}])
+        self.es.indices.delete.assert_called_once_with(index=outdated)
+
+    def test_watched_paths_keep_the_full_runs_errors_and_progress(self):
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1)
+        index.index_errors.add("Error indexing broken.epub", 'broken.epub', 'parse')
+        full_run = index.indexing_progress
+
+        gone = os.path.join(self.books_dir, 'gone.txt')
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1, paths=[gone, os.path.join(self.books_dir, 'x.pdf')])
+
+        self.assertIs(index.indexing_progress, full_run)
+        self.assertEqual([record['file'] for record in index.index_errors.records()], ['broken.epub'])
+
+    def test_watched_paths_wait_for_the_first_full_run(self):
+        self.es.indices.exists.return_value = False
+        self.es.indices.get_alias.return_value = {}
+
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1, paths=[self.changed])
+
+        self.assertEqual(self.sent_actions, [])
+        self.es.indices.create.assert_not_called()
+        self.es.indices.update_aliases.assert_not_called()
+
+    def test_incremental_run_leaves_an_interrupted_loads_checkpoint_alone(self):
+        unfinished = f"{index.INDEX_NAME}-v{index.INDEX_TEMPLATE_VERSION}-5"
+        load_checkpoint = index.checkpoint_file(True)
+        stat = os.stat(self.changed)
+        with open(load_checkpoint, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'directory': self.books_dir, 'granularity': 'book', 'incremental': False,
+                                'index': unfinished}) + '\n')
+            f.write(json.dumps({'path': self.changed, 'size': stat.st_size, 'mtime': stat.st_mtime}) + '\n')
+
+        with patch('src.core.index.helpers.scan', return_value=[]):
+            index.index_files(self.books_dir, workers=1, granularity='book')
+        self.assertTrue(os.path.exists(load_checkpoint))
+
+        # The next full run continues the load and skips what it finished
+        self.es.indices.get.return_value = {self.live: {}, unfinished: {}}
+        self.sent_actions.clear()
+        stored = [self.stored_hit(self.changed)]
+        with patch('src.core.index.helpers.scan', return_value=stored):
+            index.index_files(self.books_dir, workers=1, granularity='book', incremental=False)
+        self.assertNotIn(index.document_id(self.changed), {action['_id'] for action in self.sent_actions})
+        self.assertEqual(index.indexing_progress['resumed_files'], 1)
+        self.assertFalse(os.path.exists(load_checkpoint))
+
+    def test_reset_leaves_the_index_alone_while_a_run_holds_it(self):
+        with index.index_write_lock:
+            self.assertIsNone(index.recreate_index())
+        self.es.indices.delete.assert_not_called()
+        self.assertIsNotNone(index.recreate_index())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from app import app
+from src.core import index, metrics, text_store
+
+
+class IndexingMetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = metrics.IndexingMetrics()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1, 3), (float('inf'), 4)])
+        self.assertAlmostEqual(histogram.sum, 3.65)
+
+    def test_eta_follows_the_recent_rate(self):
+        self.metrics.run_started = 0
+        with patch.object(metrics, 'ETA_WINDOW', 10):
+            # Slow start: 10 files in the first 100 seconds
+            self.assertAlmostEqual(self.metrics.estimate_remaining(10, 110, now=100), 1000)
+            self.metrics.estimate_remaining(20, 110, now=105)
+            # Then 50 files in 7 seconds; the slow start has left the window
+            self.assertAlmostEqual(self.metrics.estimate_remaining(70, 110, now=112), 40 / (50 / 7))
+
+    def test_slowest_files_and_prometheus_output(self):
+        with patch.object(metrics, 'METRICS_SLOWEST_FILES', 2):
+            self.metrics.start_run()
+            self.metrics.record_file('/books/a.pdf', 100, {'read': 0.2, 'parse': 3.0})
+            self.metrics.record_file('/books/b.txt', 50, {'read': 0.01})
+            self.metrics.record_file('/books/c.epub', 80, {'parse': 1.0, 'strip': 0.5})
+        self.metrics.record_documents(3)
+        self.metrics.observe('write', 0.3)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual([f['file_path'] for f in snapshot['slowest_files']], ['/books/a.pdf', '/books/c.epub'])
+        self.assertEqual(snapshot['stages']['parse'], {'count': 2, 'seconds': 4.0})
+
+        text = self.metrics.prometheus()
+        self.assertIn('booksearch_indexing_stage_seconds_bucket{stage="parse",le="+Inf"} 2', text)
+        self.assertIn('booksearch_indexing_stage_seconds_count{stage="write"} 1', text)
+        self.assertIn('booksearch_indexed_bytes_total 230', text)
+        self.assertIn('booksearch_indexed_documents_total 3', text)
+
+    def test_metrics_endpoint(self):
+        app.config['TESTING'] = True
+        response = app.test_client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'booksearch_indexing_running ', response.data)
+
+
+class ExtractionTimingsTest(unittest.TestCase):
+    def test_stage_timings_travel_with_the_result(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir)
+        book = os.path.join(store_dir, 'book.txt')
+        with open(book, 'w', encoding='utf-8') as f:
+            f.write('Hecate at the crossroads')
+
+        with patch.object(text_store, 'TEXT_STORE_DIR', store_dir):
+            result = pickle.loads(pickle.dumps(index._extract_file(book)))
+
+        text, errors, content_hash = result
+        self.assertEqual(text, 'Hecate at the crossroads')
+        self.assertEqual(set(result.timings), {'read', 'parse'})
+        self.assertEqual(metrics.take_stage_seconds(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
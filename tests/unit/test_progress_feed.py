@@ -0,0 +1,80 @@
+import json
+import unittest
+from unittest.mock import patch
+import app as app_module
+from app import app
+from src.core.progress_feed import ProgressFeed
+
+
+def snapshot(processed, **overrides):
+    progress = {
+        'total_files': 10,
+        'processed_files': processed,
+        'percentage': processed * 10.0,
+        'current_file': f'/books/{processed}.txt',
+        'scan_complete': True,
+        'state': 'running',
+        'resumed_files': 0,
+        'quarantined_files': 0,
+        'metrics': {},
+        'elapsed_time': 61,
+        'estimated_remaining': 0,
+        'estimated_completion': 0,
+        'errors': {'total': 0}
+    }
+    progress.update(overrides)
+    return progress
+
+
+class ProgressFeedTest(unittest.TestCase):
+    def test_readers_share_one_sample_per_interval(self):
+        calls = []
+
+        def source():
+            calls.append(1)
+            return len(calls)
+
+        feed = ProgressFeed(source, interval=60)
+        self.assertEqual([feed.current() for _ in range(5)], [1] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_updates_yield_new_samples_and_heartbeats(self):
+        samples = iter([1, 1, 2])
+        feed = ProgressFeed(lambda: next(samples, 2), interval=0.01)
+        updates = feed.updates(heartbeat=0.2)
+
+        self.assertEqual(next(updates), (True, 1))
+        self.assertEqual(next(updates), (True, 2))
+        self.assertEqual(next(updates), (False, 2))
+        updates.close()
+        self.assertEqual(feed._subscribers, 0)
+
+    def test_stream_sends_changed_fields_then_done(self):
+        samples = [snapshot(1), snapshot(2), snapshot(2, state='paused'), None]
+        formatted = []
+        original_format_progress = app_module.format_progress
+
+        def format_progress(progress, tz_name):
+            formatted.append(progress)
+            return original_format_progress(progress, tz_name)
+
+        # The run moves on only once the stream has sent the previous sample,
+        # so no sample is skipped however the sampler thread is scheduled
+        feed = ProgressFeed(lambda: samples[len(formatted)], interval=0.01)
+        app.config['TESTING'] = True
+        with patch('app.progress_feed', feed), patch('app.format_progress', side_effect=format_progress):
+            response = app.test_client().get('/indexing_progress/stream?tz=Europe/Warsaw')
+            body = response.get_data(as_text=True)
+
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = [event for event in body.split('\n\n') if event]
+        deltas = [json.loads(event[len('data: '):]) for event in events if event.startswith('data: ')]
+        self.assertEqual(deltas[0]['processed_files'], 1)
+        self.assertEqual(deltas[0]['elapsed_time'], '1m 1s')
+        self.assertEqual(set(deltas[1]), {'processed_files', 'percentage', 'current_file'})
+        self.assertEqual(deltas[2], {'state': 'paused'})
+        self.assertTrue(events[-1].startswith('event: done'))
+
+
+if __name__ == '__main__':
+    unittest.main()
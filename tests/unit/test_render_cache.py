@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from ebooklib import epub
+from app import app
+from src.core import render_cache
+from src.core.epub_chapters import get_package
+
+
+def write_epub(path, text, extra_chapters=0, non_linear=()):
+    book = epub.EpubBook()
+    book.set_identifier('render-test')
+    book.set_title('Render Test')
+    book.set_language('en')
+    chapter = epub.EpubHtml(title='Chapter 1', file_name='chap_01.xhtml', lang='en')
+    chapter.content = f'<html><body><h1>Chapter 1</h1><p>{text}</p><img src="x.png"/></body></html>'
+    book.add_item(chapter)
+    chapters = [chapter]
+    for number in range(2, extra_chapters + 2):
+        extra = epub.EpubHtml(title=f'Chapter {number}', file_name=f'chap_{number:02}.xhtml', lang='en')
+        extra.content = f'<html><body><h1>Chapter {number}</h1><p>Text of chapter {number}</p></body></html>'
+        book.add_item(extra)
+        chapters.append(extra)
+    book.toc = chapters
+    # non_linear: chapter numbers (1-based) marked linear="no" in the spine
+    book.spine = ['nav'] + [(chapter, 'no') if number in non_linear else chapter
+                            for number, chapter in enumerate(chapters, 1)]
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(path, book)
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        for name, value in (('RENDER_CACHE_DIR', self.cache_dir), ('_cache_bytes', None)):
+            patcher = patch.object(render_cache, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.epub_path = os.path.join(self.temp_dir, 'book.epub')
+        write_epub(self.epub_path, 'Hecate at the crossroads')
+
+    def test_second_request_is_served_from_cache(self):
+        with patch.object(render_cache, 'render_epub_html', wraps=render_cache.render_epub_html) as render:
+            html, key = render_cache.get_rendered_html(self.epub_path)
+            again, same_key = render_cache.get_rendered_html(self.epub_path)
+
+        render.assert_called_once()
+        self.assertEqual(html, again)
+        self.assertEqual(key, same_key)
+        self.assertIn('Hecate at the crossroads', html)
+        self.assertNotIn('<img', html)
+
+    def test_changed_file_gets_a_new_key(self):
+        _, key = render_cache.get_rendered_html(self.epub_path)
+        write_epub(self.epub_path, 'A longer text about the goddess Hecate')
+        html, new_key = render_cache.get_rendered_html(self.epub_path)
+
+        self.assertNotEqual(key, new_key)
+        self.assertIn('goddess Hecate', html)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with patch.object(render_cache, 'RENDER_CACHE_MAX_BYTES', 25):
+            render_cache.store('aa01', 'x' * 10)
+            render_cache.store('bb02', 'y' * 10)
+            os.utime(render_cache._cache_path('aa01'), (1, 1))
+            self.assertEqual(render_cache.get_cached('bb02'), 'y' * 10)
+            render_cache.store('cc03', 'z' * 10)
+
+        self.assertIsNone(render_cache.get_cached('aa01'))
+        self.assertEqual(render_cache.get_cached('bb02'), 'y' * 10)
+        self.assertEqual(render_cache.get_cached('cc03'), 'z' * 10)
+
+    def test_single_chapter_is_rendered_from_the_spine(self):
+        write_epub(self.epub_path, 'Hecate at the crossroads', extra_chapters=2)
+        spine, toc = get_package(self.epub_path)
+
+        self.assertEqual(len(spine), 4)
+        self.assertEqual([(entry['title'], entry['chapter']) for entry in toc],
+                         [('Chapter 1', 1), ('Chapter 2', 2), ('Chapter 3', 3)])
+        with patch.object(render_cache, 'render_epub_html') as render_book:
+            html, key = render_cache.get_rendered_html(self.epub_path, chapter=2)
+        render_book.assert_not_called()
+        self.assertIn('Text of chapter 2', html)
+        self.assertNotIn('Hecate', html)
+        self.assertNotEqual(key, render_cache.get_rendered_html(self.epub_path)[1])
+        with self.assertRaises(IndexError):
+            render_cache.get_rendered_html(self.epub_path, chapter=4)
+
+    def test_chapter_numbers_match_the_indexed_chapter_index(self):
+        from src.core.index import iter_epub_chapters
+        write_epub(self.epub_path, 'Hecate at the crossroads', extra_chapters=2, non_linear=(2,))
+
+        indexed = {chapter_index: text for chapter_index, text in iter_epub_chapters(self.epub_path)}
+        # Chapter 2 is non-linear; the ones after it must not shift
+        for marker in ('Hecate at the crossroads', 'Text of chapter 2', 'Text of chapter 3'):
+            chapter_index = next(index for index, text in indexed.items() if marker in text)
+            html = render_cache.get_rendered_html(self.epub_path, chapter=chapter_index)[0]
+            self.assertIn(marker, html)
+
+    def get(self, url, **kwargs):
+        app.config['TESTING'] = True
+        client = app.test_client()
+        original_join = os.path.join
+
+        def books_join(path, *paths):
+            if path == '/books' and paths == ('book.epub',):
+                return self.epub_path
+            return original_join(path, *paths)
+
+        with patch('app.os.path.join', side_effect=books_join), \
+                patch('app.os.path.abspath', side_effect=lambda p: '/books/book.epub' if p == self.epub_path else p):
+            return client.get(url, **kwargs)
+
+    def test_file_html_answers_304_for_current_etag(self):
+        first = self.get('/file_html/book.epub')
+        second = self.get('/file_html/book.epub', headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn(b'Hecate at the crossroads', first.data)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+
+    def test_chapter_and_toc_endpoints(self):
+        write_epub(self.epub_path, 'Hecate at the crossroads', extra_chapters=1)
+
+        page = self.get('/file_html/book.epub?chapter=2')
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(b'Text of chapter 2', page.data)
+        self.assertIn(b'href="?chapter=1"', page.data)
+        self.assertNotIn(b'Hecate', page.data)
+        self.assertEqual(self.get('/file_html/book.epub?chapter=9').status_code, 404)
+        self.assertEqual(self.get('/file_html/book.epub?chapter=x').status_code, 400)
+
+        toc = self.get('/toc/book.epub').get_json()
+        self.assertEqual(toc['chapters'], 3)
+        self.assertEqual(toc['toc'][1], {'title': 'Chapter 2', 'chapter': 2, 'level': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
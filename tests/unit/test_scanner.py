@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.core import scanner
+
+
+class TestLibraryScanner(unittest.TestCase):
+    def setUp(self):
+        self.books_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.books_dir, 'Author', 'Series'))
+        self.books = [
+            self.touch('top.epub', b'epub'),
+            self.touch(os.path.join('Author', 'book.pdf'), b'pdf!'),
+            self.touch(os.path.join('Author', 'Series', 'notes.txt'), b'some notes'),
+        ]
+        self.touch(os.path.join('Author', 'cover.jpg'), b'jpeg')
+
+    def tearDown(self):
+        shutil.rmtree(self.books_dir)
+
+    def touch(self, relative_path, data):
+        path = os.path.join(self.books_dir, relative_path)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_scan_finds_supported_files_recursively(self):
+        found = {f.path: f for f in scanner.scan_directory(self.books_dir)}
+
+        self.assertEqual(set(found), set(self.books))
+        notes = found[self.books[2]]
+        self.assertEqual(notes.size, len(b'some notes'))
+        self.assertEqual(notes.mtime, os.stat(self.books[2]).st_mtime)
+
+    def test_unreadable_parts_are_reported(self):
+        series = os.path.join(self.books_dir, 'Author', 'Series')
+        scandir = os.scandir
+
+        def unreadable_series(path):
+            if path == series:
+                raise PermissionError(13, 'Permission denied', path)
+            return scandir(path)
+
+        errors = []
+        with patch('src.core.scanner.os.scandir', side_effect=unreadable_series):
+            found = {f.path for f in scanner.scan_directory(self.books_dir, errors=errors)}
+        self.assertEqual(found, set(self.books[:2]))
+        self.assertEqual(len(errors), 1)
+        self.assertIn(series, errors[0])
+
+        # Without the library itself there's nothing to report on
+        with self.assertRaises(OSError):
+            list(scanner.scan_directory(os.path.join(self.books_dir, 'missing')))
+
+    def test_manifest_is_published_after_a_complete_scan(self):
+        scan = scanner.scan_library(self.books_dir)
+        next(scan)
+        self.assertNotEqual(scanner.library_manifest['directory'], self.books_dir)
+
+        list(scan)
+        self.assertEqual(scanner.library_manifest['directory'], self.books_dir)
+        self.assertEqual(len(scanner.library_manifest['files']), 3)
+
+    def test_get_manifest_reuses_a_fresh_scan(self):
+        list(scanner.scan_library(self.books_dir))
+        with patch('src.core.scanner.scan_directory') as mock_scan:
+            files = scanner.get_manifest(self.books_dir)
+        mock_scan.assert_not_called()
+        self.assertEqual(len(files), 3)
+
+        with patch('src.core.scanner.scan_directory', return_value=iter([])) as mock_scan:
+            files = scanner.get_manifest(self.books_dir, max_age=0)
+        mock_scan.assert_called_once_with(self.books_dir, errors=None)
+        self.assertEqual(files, [])
+
+    def test_web_workers_read_the_published_manifest_without_scanning(self):
+        manifest_file = os.path.join(self.books_dir, '.manifest', 'library_manifest.json')
+        with patch.object(scanner, 'MANIFEST_FILE', manifest_file):
+            list(scanner.scan_library(self.books_dir))
+            self.assertTrue(os.path.exists(manifest_file))
+            # A web worker starts without a manifest of its own
+            with patch.dict(scanner.library_manifest, {'directory': None, 'files': [], 'scanned_at': 0}), \
+                    patch.object(scanner, '_loaded_manifest_file', None), \
+                    patch('src.core.scanner.scan_directory') as mock_scan:
+                files = scanner.get_manifest(self.books_dir, max_age=0, published_only=True)
+                self.assertEqual(sorted(f.path for f in files), sorted(self.books))
+                self.assertIsInstance(files[0], scanner.LibraryFile)
+
+                # The watcher's updates are published too
+                os.remove(self.books[0])
+                scanner.update_manifest(self.books_dir, [self.books[0]])
+                scanner.library_manifest['files'] = []
+                files = scanner.get_manifest(self.books_dir, max_age=0, published_only=True)
+                self.assertEqual(len(files), 2)
+            mock_scan.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+import json
+import unittest
+from unittest.mock import patch
+from app import app, search_cache
+from src.core.index import bump_index_generation
+
+
+def search_response(hits, total=None):
+    return {
+        'took': 3,
+        'hits': {
+            'total': total or {'value': len(hits), 'relation': 'eq'},
+            'hits': hits
+        }
+    }
+
+
+class SearchAPITest(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        search_cache.clear()
+
+    def search(self, **params):
+        params.setdefault('query', 'hecate')
+        return self.client.get('/search', query_string=params, headers={'Accept': 'application/json'})
+
+    @patch('app.es')
+    def test_snippet_comes_from_highlight_without_content(self, mock_es):
+        mock_es.search.return_value = search_response([{
+            '_id': 'abc',
+            '_score': 1.5,
+            '_source': {'file_path': '/books/witches.epub', 'book_id': 'abc'},
+            'highlight': {'content': ['goddess **Hecate** at the crossroads']},
+            'sort': [1.5, 'abc']
+        }])
+
+        response = self.search()
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['results'][0]['snippet'], 'goddess **Hecate** at the crossroads')
+        self.assertEqual(data['results'][0]['file_path'], 'witches.epub')
+        kwargs = mock_es.search.call_args.kwargs
+        self.assertNotIn('content', kwargs['source'])
+        self.assertIn('content', kwargs['highlight']['fields'])
+        mock_es.get.assert_not_called()
+
+    @patch('app.es')
+    def test_python_snippet_is_only_a_fallback(self, mock_es):
+        mock_es.search.return_value = search_response([{
+            '_id': 'abc', '_score': 1.0, '_source': {'file_path': '/books/notes.txt'}
+        }])
+        mock_es.get.return_value = {'_source': {'content': 'Offerings to hecate were left at night.'}}
+
+        data = json.loads(self.search().data)
+
+        mock_es.get.assert_called_once()
+        self.assertIn('**hecate**', data['results'][0]['snippet'])
+
+    @patch('app.text_store.read_text', return_value='Offerings to hecate were left at night.')
+    @patch('app.es')
+    def test_fallback_reads_passage_from_text_store(self, mock_es, mock_read_text):
+        mock_es.search.return_value = search_response([{
+            '_id': 'abc-3', '_score': 1.0,
+            '_source': {'file_path': '/books/notes.txt', 'content_hash': 'f00d',
+                        'start_offset': 100, 'end_offset': 139}
+        }])
+
+        data = json.loads(self.search().data)
+
+        mock_read_text.assert_called_once_with('f00d', 100, 139)
+        mock_es.get.assert_not_called()
+        self.assertIn('**hecate**', data['results'][0]['snippet'])
+
+    @patch('app.es')
+    def test_paging_parameters_and_real_total(self, mock_es):
+        mock_es.search.return_value = search_response(
+            [{'_id': 'b', '_score': 0.5, '_source': {'file_path': '/books/b.txt'},
+              'highlight': {'content': ['x']}, 'sort': [0.5, 'b']}],
+            total={'value': 42, 'relation': 'eq'})
+
+        data = json.loads(self.search(size=1, search_after='[0.7, "a"]', track_total_hits='false').data)
+
+        kwargs = mock_es.search.call_args.kwargs
+        self.assertEqual(kwargs['size'], 1)
+        self.assertEqual(kwargs['search_after'], [0.7, 'a'])
+        self.assertFalse(kwargs['track_total_hits'])
+        self.assertEqual(data['total'], 42)
+        self.assertEqual(json.loads(data['next_search_after']), [0.5, 'b'])
+
+    @patch('app.es')
+    def test_invalid_paging_is_rejected(self, mock_es):
+        self.assertEqual(self.search(size='ten').status_code, 400)
+        self.assertEqual(self.search(search_after='{"a": 1}').status_code, 400)
+        mock_es.search.assert_not_called()
+
+    @patch('app.is_available', return_value=False)
+    @patch('app.es')
+    def test_search_fails_fast_while_elasticsearch_is_down(self, mock_es, mock_available):
+        self.assertEqual(self.search().status_code, 503)
+        mock_es.search.assert_not_called()
+
+    @patch('app.es')
+    def test_repeated_queries_are_served_from_cache_until_reindex(self, mock_es):
+        mock_es.search.return_value = search_response([{
+            '_id': 'abc', '_score': 1.0, '_source': {'file_path': '/books/a.txt'},
+            'highlight': {'content': ['**Hecate**']}
+        }])
+
+        first = json.loads(self.search(query='Books about  Hecate').data)
+        second = json.loads(self.search(query='books about hecate').data)
+        self.assertEqual(mock_es.search.call_count, 1)
+        self.assertEqual(first['results'], second['results'])
+        self.assertEqual(second['query'], 'books about hecate')
+
+        self.search(query='books about hecate', size=3)
+        self.assertEqual(mock_es.search.call_count, 2)
+
+        bump_index_generation()
+        self.search(query='books about hecate')
+        self.assertEqual(mock_es.search.call_count, 3)
+
+    @patch('app.es')
+    def test_suggestions_and_facets_are_queried_alongside(self, mock_es):
+        def fake_search(**kwargs):
+            if 'suggest' in kwargs:
+                return {'suggest': {'did_you_mean': [{'options': [
+                    {'text': 'hecate', 'highlighted': '**hecate**', 'score': 0.8}]}]}}
+            if 'aggs' in kwargs:
+                return {'aggregations': {'file_type': {'buckets': [
+                    {'key': 'epub', 'doc_count': 4}, {'key': 'pdf', 'doc_count': 1}]}}}
+            return search_response([{'_id': 'a', '_score': 1.0, '_source': {'file_path': '/books/a.epub'},
+                                     'highlight': {'content': ['**hecat**']}}])
+        mock_es.search.side_effect = fake_search
+
+        data = json.loads(self.search(query='hecat', include='suggest,facets').data)
+
+        self.assertEqual(mock_es.search.call_count, 3)
+        self.assertEqual(data['suggest'], [{'text': 'hecate', 'highlighted': '**hecate**', 'score': 0.8}])
+        self.assertEqual(data['facets'], {'file_type': [{'value': 'epub', 'count': 4},
+                                                        {'value': 'pdf', 'count': 1}]})
+        self.assertEqual(len(data['results']), 1)
+
+    @patch('app.es')
+    def test_failed_extra_leaves_the_search_intact(self, mock_es):
+        def fake_search(**kwargs):
+            if 'suggest' in kwargs:
+                raise RuntimeError('phrase suggester unavailable')
+            return search_response([])
+        mock_es.search.side_effect = fake_search
+
+        response = self.search(include='suggest')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(json.loads(response.data)['suggest'])
+
+    @patch('app.es')
+    def test_file_type_filters_the_main_query(self, mock_es):
+        mock_es.search.return_value = search_response([])
+
+        data = json.loads(self.search(file_type='PDF').data)
+
+        query = mock_es.search.call_args.kwargs['query']
+        self.assertEqual(query['bool']['filter'], [{'term': {'file_type': 'pdf'}}])
+        self.assertEqual(data['file_type'], 'pdf')
+
+    @patch('app.es')
+    def test_unknown_include_is_rejected(self, mock_es):
+        self.assertEqual(self.search(include='suggest,spelling').status_code, 400)
+        mock_es.search.assert_not_called()
+
+    @patch('app.INDEX_GRANULARITY', 'passage')
+    @patch('app.es')
+    def test_passage_total_counts_books_not_passages(self, mock_es):
+        response = search_response([{'_id': 'a-1', '_score': 1.0, '_source': {'file_path': '/books/a.txt'},
+                                     'highlight': {'content': ['x']}}],
+                                   total={'value': 12, 'relation': 'eq'})
+        response['aggregations'] = {'books': {'value': 3}}
+        mock_es.search.return_value = response
+
+        data = json.loads(self.search().data)
+
+        kwargs = mock_es.search.call_args.kwargs
+        self.assertEqual(kwargs['collapse'], {'field': 'book_id'})
+        self.assertEqual(kwargs['aggs']['books']['cardinality']['field'], 'book_id')
+        self.assertEqual((data['total'], data['total_relation']), (3, 'eq'))
+
+        self.search(track_total_hits='false')
+        self.assertNotIn('aggs', mock_es.search.call_args.kwargs)
+
+    @patch('app.es')
+    def test_epub_passages_link_to_their_chapter(self, mock_es):
+        mock_es.search.return_value = search_response([{
+            '_id': 'a-4', '_score': 1.0, '_source': {'file_path': '/books/a.epub', 'chapter_index': 4},
+            'highlight': {'content': ['**Hecate**']}
+        }])
+
+        data = json.loads(self.search().data)
+        html = self.client.get('/search', query_string={'query': 'hecate'}).get_data(as_text=True)
+
+        self.assertTrue(data['results'][0]['chapter_url'].endswith('/file_html/a.epub?chapter=4'))
+        self.assertIn('href="/file_html/a.epub?chapter=4"', html)
+
+    @patch('app.es')
+    def test_results_page_markup_is_balanced(self, mock_es):
+        mock_es.search.return_value = search_response([{
+            '_id': 'a', '_score': 1.0, '_source': {'file_path': '/books/a.txt'},
+            'highlight': {'content': ['**Hecate**']}
+        }])
+
+        html = self.client.get('/search', query_string={'query': 'hecate'}).get_data(as_text=True)
+
+        self.assertIn('Search Results', html)
+        self.assertEqual(html.count('<div'), html.count('</div>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
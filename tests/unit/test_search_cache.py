@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+from src.core.search_cache import SearchCache, normalize_query
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_normalized_queries_share_a_key(self):
+        self.assertEqual(normalize_query('  Books about\tHECATE '), 'books about hecate')
+
+    def test_evicts_least_recently_used_by_size(self):
+        cache = SearchCache(max_bytes=40, ttl=60)
+        cache.put('a', {'r': 'x' * 10}, 1)
+        cache.put('b', {'r': 'y' * 10}, 1)
+        cache.get('a', 1)
+        cache.put('c', {'r': 'z' * 10}, 1)
+
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('c', 1))
+        stats = cache.get_stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['bytes'], 40)
+
+    def test_oversized_payloads_are_not_cached(self):
+        cache = SearchCache(max_bytes=10, ttl=60)
+        cache.put('big', {'r': 'x' * 100}, 1)
+        self.assertIsNone(cache.get('big', 1))
+
+    def test_entries_expire(self):
+        cache = SearchCache(max_bytes=1000, ttl=10)
+        with patch('src.core.search_cache.time.time', return_value=100):
+            cache.put('a', {'r': 1}, 1)
+        with patch('src.core.search_cache.time.time', return_value=111):
+            self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.get_stats()['expirations'], 1)
+
+    def test_new_generation_invalidates_everything(self):
+        cache = SearchCache(max_bytes=1000, ttl=60)
+        cache.put('a', {'r': 1}, 1)
+        self.assertIsNone(cache.get('a', 2))
+        stats = cache.get_stats()
+        self.assertEqual(stats['invalidations'], 1)
+        self.assertEqual(stats['entries'], 0)
+        self.assertEqual((stats['hits'], stats['misses']), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+from unittest.mock import patch
+import app as app_module
+from app import app
+from src.core import index
+from src.core.catalog import LibraryCatalog
+from src.core.progress_feed import ProgressFeed
+
+
+class FakeUpstream(io.BytesIO):
+    def __init__(self, body, content_type='application/json', status=200):
+        super().__init__(body)
+        self.headers = {'Content-Type': content_type}
+        self.status = status
+
+
+class WebRoleTest(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        patcher = patch.object(app_module, 'APP_ROLE', 'web')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_indexing_endpoints_are_forwarded_to_the_indexer(self):
+        upstream = FakeUpstream(json.dumps({"status": "paused"}).encode())
+        with patch('app.urllib.request.urlopen', return_value=upstream) as urlopen, \
+                patch('app.request_pause') as request_pause:
+            response = self.client.post('/pause_indexing?x=1', headers={'X-Timezone': 'Europe/Warsaw'})
+
+        request_pause.assert_not_called()
+        forwarded = urlopen.call_args.args[0]
+        self.assertEqual(forwarded.full_url, 'http://booksearch_indexer:5000/pause_indexing?x=1')
+        self.assertEqual(forwarded.get_method(), 'POST')
+        self.assertEqual(forwarded.get_header('X-timezone'), 'Europe/Warsaw')
+        self.assertEqual(json.loads(response.data), {"status": "paused"})
+
+    def test_progress_stream_is_served_from_the_indexer_snapshot(self):
+        snapshots = [FakeUpstream(json.dumps(None).encode())]
+        feed = ProgressFeed(app_module.current_progress, interval=0.01)
+        with patch('app.urllib.request.urlopen', side_effect=snapshots) as urlopen, \
+                patch('app.progress_feed', feed), patch('app.indexer_progress', None):
+            response = self.client.get('/indexing_progress/stream')
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            self.assertIn(b'event: done', response.get_data())
+        # The stream itself isn't forwarded, only the progress sample is fetched
+        self.assertEqual(urlopen.call_args.args[0], 'http://booksearch_indexer:5000/indexing_progress/snapshot')
+
+    def test_failed_snapshot_fetch_keeps_the_last_progress(self):
+        with patch('app.urllib.request.urlopen', side_effect=urllib.error.URLError('refused')), \
+                patch('app.indexer_progress', {'processed_files': 3}):
+            self.assertEqual(app_module.current_progress(), {'processed_files': 3})
+
+    def test_progress_streams_are_capped(self):
+        with patch('app.progress_stream_slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            response = self.client.get('/indexing_progress/stream')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response.headers)
+
+    def test_indexer_errors_and_outages(self):
+        conflict = urllib.error.HTTPError('http://booksearch_indexer:5000/index_books', 409, 'Conflict',
+                                          {'Content-Type': 'application/json'},
+                                          io.BytesIO(b'{"error": "Indexing is already running"}'))
+        with patch('app.urllib.request.urlopen', side_effect=conflict):
+            response = self.client.get('/index_books', headers={'Accept': 'application/json'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.data), {"error": "Indexing is already running"})
+
+        with patch('app.urllib.request.urlopen', side_effect=urllib.error.URLError('refused')):
+            response = self.client.get('/indexing_progress')
+        self.assertEqual(response.status_code, 502)
+
+    def test_file_list_shows_indexing_in_the_indexer(self):
+        snapshot = FakeUpstream(json.dumps({'processed_files': 3}).encode())
+        feed = ProgressFeed(app_module.current_progress)
+        with patch('app.urllib.request.urlopen', return_value=snapshot), patch('app.progress_feed', feed), \
+                patch('app.get_catalog', return_value=LibraryCatalog('/books', [])):
+            response = self.client.get('/files', headers={'Accept': 'application/json'})
+        self.assertTrue(json.loads(response.data)['indexing_in_progress'])
+
+    def test_search_is_served_locally(self):
+        with patch('app.urllib.request.urlopen') as urlopen:
+            self.client.get('/health')
+        urlopen.assert_not_called()
+
+
+class SharedGenerationTest(unittest.TestCase):
+    def test_bumps_in_another_process_change_the_generation(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+        with patch.object(index, 'INDEX_GENERATION_FILE', os.path.join(data_dir, 'index_generation')):
+            before = index.get_index_generation()
+            index.bump_index_generation()
+            after_own_bump = index.get_index_generation()
+            self.assertNotEqual(before, after_own_bump)
+
+            # The indexer process replaces the file; this process's counter stays put
+            with open(os.path.join(data_dir, 'new'), 'w') as f:
+                f.write('1')
+            os.replace(os.path.join(data_dir, 'new'), index.INDEX_GENERATION_FILE)
+            self.assertNotEqual(index.get_index_generation(), after_own_bump)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from src.core import index, text_store
+
+
+class TextStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.store_dir)
+        for name, value in (('TEXT_STORE_DIR', self.store_dir), ('TEXT_STORE_BLOCK_CHARS', 10)):
+            patcher = patch.object(text_store, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.book_path = os.path.join(self.store_dir, 'book.txt')
+        with open(self.book_path, 'w', encoding='utf-8') as f:
+            f.write('Hecate, goddess of crossroads and keys — ' * 3)
+
+    def test_ranges_are_read_across_blocks(self):
+        text = 'Żółć and Hecate ' * 5
+        text_store.put('abc123', text, [{'start_offset': 0, 'end_offset': len(text)}])
+
+        self.assertEqual(text_store.read_text('abc123'), text)
+        self.assertEqual(text_store.read_text('abc123', 7, 33), text[7:33])
+        self.assertEqual(text_store.read_text('abc123', 75, 500), text[75:])
+        self.assertEqual(text_store.load('abc123'), (text, [{'start_offset': 0, 'end_offset': len(text)}]))
+        self.assertIsNone(text_store.read_text('missing'))
+
+    def test_lone_surrogates_are_stored(self):
+        text = 'Hecate \udce9 of the crossroads'
+        text_store.put('abc123', text, [])
+
+        self.assertEqual(text_store.read_text('abc123'), text)
+        self.assertEqual(text_store.read_text('abc123', 7, 12), text[7:12])
+
+    def test_path_link_is_dropped_when_the_file_changes(self):
+        text_store.put('abc123', 'old text', [], self.book_path, os.stat(self.book_path))
+        self.assertEqual(text_store.lookup(self.book_path), 'abc123')
+        self.assertEqual(text_store.text_for_file(self.book_path), 'old text')
+
+        with open(self.book_path, 'a', encoding='utf-8') as f:
+            f.write('more')
+        self.assertIsNone(text_store.lookup(self.book_path))
+        self.assertIsNone(text_store.text_for_file(self.book_path))
+
+    def test_prune_keeps_only_live_hashes(self):
+        text_store.put('aa11', 'kept', [], self.book_path, os.stat(self.book_path))
+        text_store.put('bb22', 'stale', [])
+
+        self.assertEqual(text_store.prune({'aa11'}), 1)
+        self.assertEqual(text_store.read_text('aa11'), 'kept')
+        self.assertIsNone(text_store.read_text('bb22'))
+        self.assertEqual(text_store.prune(set()), 1)
+        self.assertIsNone(text_store.lookup(self.book_path))
+
+    def test_extraction_reuses_stored_text(self):
+        text, errors, content_hash = index._extract_file(self.book_path)
+        self.assertEqual(text, index.extract_text(self.book_path))
+        self.assertEqual(content_hash, index.file_content_hash(self.book_path))
+
+        with patch.object(index, 'extract_document') as extract, \
+                patch.object(index, 'file_content_hash') as content_hash_of:
+            passages, _, same_hash = index._extract_file(self.book_path, granularity="passage")
+        extract.assert_not_called()
+        content_hash_of.assert_not_called()
+        self.assertEqual(same_hash, content_hash)
+        self.assertEqual(passages, index.extract_passages(self.book_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
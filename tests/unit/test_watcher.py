@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from src.core import scanner, watcher
+
+
+class DebouncedQueueTest(unittest.TestCase):
+    def test_paths_are_released_once_quiet(self):
+        queue = watcher.DebouncedQueue(delay=1)
+        queue.put('/books/a.epub')
+        self.assertEqual(queue.take(timeout=0.05), [])
+
+        time.sleep(0.5)
+        queue.put('/books/a.epub')
+        queue.put('/books/b.epub')
+        self.assertEqual(queue.take(timeout=0.6), [])
+        self.assertEqual(sorted(queue.take(timeout=1)), ['/books/a.epub', '/books/b.epub'])
+        self.assertEqual(len(queue), 0)
+
+    def test_batches_are_limited(self):
+        queue = watcher.DebouncedQueue(delay=0)
+        for number in range(5):
+            queue.put(f'/books/{number}.txt')
+        self.assertEqual(len(queue.take(max_items=3)), 3)
+        self.assertEqual(len(queue.take(max_items=3)), 2)
+
+
+class LibraryWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.books_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.books_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.books_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_diff_reports_added_modified_and_removed(self):
+        previous = {'/books/a.txt': (1, 1.0), '/books/b.txt': (2, 2.0), '/books/c.txt': (3, 3.0)}
+        current = {'/books/a.txt': (1, 1.0), '/books/b.txt': (5, 4.0), '/books/d.txt': (4, 4.0)}
+        self.assertEqual(sorted(watcher.diff_snapshots(previous, current)),
+                         ['/books/b.txt', '/books/c.txt', '/books/d.txt'])
+
+    def test_inotify_falls_back_to_polling_without_the_package(self):
+        with patch.object(watcher, 'INotify', None):
+            self.assertEqual(watcher.LibraryWatcher(self.books_dir, mode='inotify').mode, 'poll')
+
+    def test_indexed_batch_patches_the_manifest(self):
+        kept = self.write('kept.txt', 'kept')
+        removed = self.write('removed.txt', 'removed')
+        list(scanner.scan_library(self.books_dir))
+        os.remove(removed)
+        added = self.write('added.txt', 'added')
+
+        library_watcher = watcher.LibraryWatcher(self.books_dir, mode='poll', debounce=0)
+        library_watcher.mode = 'inotify'
+        library_watcher._queue([removed, added])
+        with patch('src.core.watcher.index_files') as mock_index:
+            library_watcher.index_batch(library_watcher.queue.take())
+
+        mock_index.assert_called_once()
+        self.assertEqual(sorted(mock_index.call_args.kwargs['paths']), sorted([removed, added]))
+        self.assertEqual(sorted(f.path for f in scanner.get_manifest(self.books_dir)), sorted([kept, added]))
+
+    def test_failed_batch_is_queued_again(self):
+        library_watcher = watcher.LibraryWatcher(self.books_dir, mode='poll', poll_interval=0, debounce=0)
+        with patch('src.core.watcher.index_files', side_effect=ConnectionError("down")):
+            library_watcher.index_batch(['/books/a.txt'])
+
+        self.assertEqual(library_watcher.queue.take(timeout=1), ['/books/a.txt'])
+        self.assertIn('down', watcher.get_watch_status()['last_error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
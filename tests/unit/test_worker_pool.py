@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import time
+import unittest
+from src.core.worker_pool import WorkerPool, WorkerTimeout, WorkerCrashed
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.mp_context = multiprocessing.get_context('spawn')
+
+    def finish(self, pool, futures):
+        done = set()
+        while len(done) < len(futures):
+            done.update(pool.wait())
+        return done
+
+    def test_hung_task_is_killed_without_stopping_the_others(self):
+        with WorkerPool(2, self.mp_context, timeout=2) as pool:
+            hung = pool.submit(time.sleep, 60)
+            quick = [pool.submit(max, number, 3) for number in range(5)]
+            self.finish(pool, [hung] + quick)
+
+            with self.assertRaises(WorkerTimeout):
+                hung.result()
+            self.assertEqual([future.result() for future in quick], [3, 3, 3, 3, 4])
+            # The killed worker was replaced
+            again = pool.submit(max, 7, 1)
+            self.finish(pool, [again])
+            self.assertEqual(again.result(), 7)
+
+    def test_crashed_worker_fails_only_its_task(self):
+        with WorkerPool(1, self.mp_context, max_tasks=2) as pool:
+            crashed = pool.submit(os._exit, 3)
+            self.finish(pool, [crashed])
+            self.assertRaises(WorkerCrashed, crashed.result)
+
+            futures = [pool.submit(abs, -number) for number in range(4)]
+            self.finish(pool, futures)
+            self.assertEqual([future.result() for future in futures], [0, 1, 2, 3])
+
+    def test_task_exceptions_are_passed_through(self):
+        with WorkerPool(1, self.mp_context) as pool:
+            future = pool.submit(int, 'not a number')
+            self.finish(pool, [future])
+            self.assertRaises(ValueError, future.result)
+
+    def test_pause_longer_than_the_timeout_does_not_kill_the_task(self):
+        pause = {'total': 0.0}
+        with WorkerPool(1, self.mp_context, timeout=1.5, paused_seconds=lambda: pause['total']) as pool:
+            future = pool.submit(time.sleep, 2.5)
+            # Paused while nobody waits on the pool, like the indexer blocked in check_job_control
+            time.sleep(2)
+            pause['total'] = 2.0
+            self.finish(pool, [future])
+            self.assertIsNone(future.result())
+
+
+if __name__ == '__main__':
+    unittest.main()